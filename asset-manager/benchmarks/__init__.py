@@ -0,0 +1,8 @@
+"""
+Benchmarks for the pipeline library.
+
+generate.py builds synthetic pipelines of any size and run.py times the
+common operations on one, writing the results out as json. Run them with:
+
+python -m benchmarks.run --shows 2 --shots 50 --assets 40 --output results.json
+"""
@@ -0,0 +1,86 @@
+import os
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from pipeline import Storage
+
+
+# roughly how often each category shows up in a real production
+CATEGORIES = {
+    "character": 20,
+    "prop": 35,
+    "vehicle": 10,
+    "environment": 10,
+    "fx": 15,
+    "camera": 5,
+    "light": 5,
+}
+
+PAYLOAD_FILE = "payload.bin"
+
+
+@dataclass(frozen=True)
+class TreeSpec:
+    """The shape of a synthetic pipeline.
+
+        Attributes:
+            shows (int): The number of shows.
+            shots (int): The number of shots in each show.
+            assets (int): The number of assets in each shot.
+            payload_size (int): The average size in bytes of the file stored in each asset, 0 for none.
+            asset_names (int): The number of distinct asset names in a show, so
+                that the same asset is used by several shots like in a real show.
+            seed (int): The seed of the random generator, the same spec always builds the same tree.
+    """
+    shows: int = 2
+    shots: int = 20
+    assets: int = 20
+    payload_size: int = 16 * 1024
+    asset_names: int = 100
+    seed: int = 0
+
+
+def generate(root: str, spec: TreeSpec, storage: Optional[Storage] = None) -> Storage:
+    """Build a synthetic pipeline under the given root.
+
+    Payload sizes follow a log-normal distribution with a mean of
+    spec.payload_size, as a few large files next to many small ones is
+    typical of real assets. Payloads are random bytes so that they don't compress unrealistically well.
+
+    Args:
+        root: An empty directory to build the pipeline in
+        spec: The shape of the pipeline
+        storage: The storage to build it with, defaults to a plain Storage of the root
+
+    Returns:
+        The storage holding the new pipeline
+    """
+    storage = storage or Storage(root)
+    generator = random.Random(spec.seed)
+    categories = list(CATEGORIES)
+    weights = list(CATEGORIES.values())
+
+    for show_number in range(spec.shows):
+        show_name = f"show{show_number:03}"
+        show = storage.create_show(show_name)
+        names = [f"shot{number:04}" for number in range(spec.shots)]
+        show.create_shots(names)
+
+        # every name keeps its category across shots, as it is the same asset
+        pool = [
+            (f"asset{number:04}", generator.choices(categories, weights)[0])
+            for number in range(max(spec.asset_names, spec.assets))
+        ]
+        for name in names:
+            shot = show.load_shot(name)
+            assets = generator.sample(pool, spec.assets)
+            shot.create_assets(assets)
+            if spec.payload_size:
+                for asset, _ in assets:
+                    size = int(generator.lognormvariate(-0.28, 0.75) * spec.payload_size)
+                    path = os.path.join(root, show_name, name, asset, PAYLOAD_FILE)
+                    with open(path, "wb") as file:
+                        file.write(generator.randbytes(size))
+
+    return storage
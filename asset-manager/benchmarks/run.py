@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from pipeline import AssetMetadata, Storage
+
+from .generate import TreeSpec, generate
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Call a function a number of times and summarise how long it took.
+
+    Returns:
+        The number of runs and the min, median, mean, p95 and max time of a call in seconds
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+    }
+
+
+def run(storage: Storage, repeat: int = 50, archive_repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """Time the common operations on a pipeline built by generate().
+
+    Each call moves on to the next show, shot or asset, so that the results
+    aren't only measuring the same entity over and over.
+
+    Args:
+        storage: The storage to benchmark
+        repeat: The number of times each operation is timed
+        archive_repeat: The number of times archives are timed, as they are slow
+    """
+    show_names = sorted(storage.shows())
+    shows = [storage.load_show(name) for name in show_names]
+    shot_names = [(show, name) for show in shows for name in sorted(show.shots())]
+    shots = [show.load_shot(name) for show, name in shot_names]
+    asset_names = [(shot, name) for shot in shots[:repeat] for name in sorted(shot.assets())]
+    assets = [shot.load_asset(name) for shot, name in asset_names]
+
+    next_show_name = _cycle(show_names)
+    next_shot_name = _cycle(shot_names)
+    next_asset_name = _cycle(asset_names)
+    next_show = _cycle(shows)
+    next_shot = _cycle(shots)
+    next_asset = _cycle(assets)
+    descriptions = itertools.count()
+
+    def load_shot() -> None:
+        show, name = next(next_shot_name)
+        show.load_shot(name)
+
+    def load_asset() -> None:
+        shot, name = next(next_asset_name)
+        shot.load_asset(name)
+
+    def update_metadata() -> None:
+        asset = next(next_asset)
+        metadata = asset.metadata()
+        asset.update_metadata(AssetMetadata(metadata.name, metadata.category, f"update {next(descriptions)}"))
+
+    operations: Dict[str, Callable[[], Any]] = {
+        "Storage.shows": storage.shows,
+        "Storage.load_show": lambda: storage.load_show(next(next_show_name)),
+        "Storage.find_assets": lambda: sum(1 for _ in storage.find_assets("prop")),
+        "Show.shots": lambda: next(next_show).shots(),
+        "Show.load_shot": load_shot,
+        "Shot.assets": lambda: next(next_shot).assets(),
+        "Shot.assets_by_category": lambda: next(next_shot).assets_by_category("prop"),
+        "Shot.load_asset": load_asset,
+        "Asset.shots": lambda: next(next_asset).shots(),
+        "Asset.update_metadata": update_metadata,
+    }
+
+    results = {name: measure(func, repeat) for name, func in operations.items()}
+    storage.flush()
+    results["Shot.archive"] = measure(lambda: next(next_shot).archive(), archive_repeat)
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Describe how the median of each operation changed against a baseline run."""
+    lines = []
+    for name, result in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            lines.append(f"{name:<28} {result['median'] * 1e6:12.1f}us        (new)")
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else float("inf")
+        lines.append(f"{name:<28} {result['median'] * 1e6:12.1f}us {ratio:8.2f}x")
+    return lines
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Benchmark the pipeline library.")
+    parser.add_argument("--root", help="Build the pipeline here instead of in a temporary directory")
+    parser.add_argument("--shows", type=int, default=TreeSpec.shows)
+    parser.add_argument("--shots", type=int, default=TreeSpec.shots, help="The number of shots per show")
+    parser.add_argument("--assets", type=int, default=TreeSpec.assets, help="The number of assets per shot")
+    parser.add_argument("--payload-size", type=int, default=TreeSpec.payload_size,
+                        help="The average payload of an asset in bytes")
+    parser.add_argument("--seed", type=int, default=TreeSpec.seed)
+    parser.add_argument("--repeat", type=int, default=50, help="The number of times each operation is timed")
+    parser.add_argument("--catalog", action="store_true", help="Benchmark a storage with a catalog")
+    parser.add_argument("--lazy", action="store_true", help="Benchmark a lazy storage")
+    parser.add_argument("--durability", default="atomic", choices=["atomic", "fsync", "write-back"])
+    parser.add_argument("--output", help="Write the json results to this file instead of stdout")
+    parser.add_argument("--compare", help="A previous json result to compare against")
+    options = parser.parse_args(args)
+
+    spec = TreeSpec(options.shows, options.shots, options.assets, options.payload_size, seed=options.seed)
+    storage_options = dict(catalog=options.catalog, lazy=options.lazy, durability=options.durability)
+
+    root = options.root or tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    try:
+        os.makedirs(root, exist_ok=True)
+        start = time.perf_counter()
+        storage = generate(root, spec, Storage(root, **storage_options))
+        storage.flush()
+        generated = time.perf_counter() - start
+
+        results = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "spec": asdict(spec),
+            "options": storage_options,
+            "generate_seconds": generated,
+            "results": run(storage, options.repeat),
+        }
+    finally:
+        if options.root is None:
+            shutil.rmtree(root)
+
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if options.compare:
+        with open(options.compare, "r") as file:
+            baseline = json.load(file)
+        print("\n".join(compare(results, baseline)), file=sys.stderr)
+    return 0
+
+
+def _cycle(items: List) -> Iterator:
+    if not items:
+        raise ValueError("the generated pipeline is empty")
+    return itertools.cycle(items)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,8 +11,25 @@ and shots within the pipeline storage.
 # import pipeline
 # my_show = pipeline.Show("path/to/show")
 
-from .storage import Storage
+from .storage import Storage, WalkEntry
 from .directory import Directory
+from .backends import MemoryDirectory, PackedDirectory, ShowPack
+from .cache import MetadataCache, CacheInfo
+from .writer import MetadataWriter, WriteBackWriter
+from .catalog import Catalog
+from .index import AssetIndex
+from .objects import ObjectStore, DedupeStats
+from .trash import Trash, TrashEntry, PurgeStats
+from .journal import Transaction
+from .versions import VersionConflict, retry_on_conflict
+from .usage import DiskUsage, UsageCache, UsageEntry
+from .archive import ArchiveStats, ArchiveCancelled, make_archive, make_incremental_archive, restore_archive
 from .show import Show, ShowMetadata
 from .shot import Shot, ShotMetadata
 from .asset import Asset, AssetMetadata
+from .query import AssetMatch
+from .search import SearchMatch
+from .snapshot import Snapshot, Row
+from .watch import ChangeEvent, Watcher
+from .instrument import instrument, OperationRecord, OperationStats, StatsSink, LoggingSink
+from .aio import AsyncStorage, AsyncShow, AsyncShot, AsyncAsset
@@ -0,0 +1,249 @@
+"""
+An asyncio front-end to the pipeline library.
+
+Every call is run on a bounded pool of threads so that the event loop
+is never blocked on the filesystem. Archives get a pool of their own, so
+a few long archive jobs can't hold up the quick metadata requests.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .archive import ArchiveStats
+from .asset import Asset, AssetMetadata
+from .shot import Shot, ShotMetadata
+from .show import Show, ShowMetadata
+from .storage import Storage, WalkEntry
+
+
+class _Executor:
+    """The thread pools shared by an AsyncStorage and every handle it returns."""
+
+    # the number of items fetched from a blocking iterator per thread hop
+    BATCH_SIZE = 64
+
+    def __init__(self, max_workers: int, max_archives: int) -> None:
+        self._io = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-io")
+        self._archives = ThreadPoolExecutor(max_workers=max_archives, thread_name_prefix="pipeline-archive")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, functools.partial(func, *args, **kwargs))
+
+    async def archive(self, func: Callable, **kwargs) -> ArchiveStats:
+        # threads can't be interrupted, so cancelling the task asks the
+        # archive to stop itself before its next file instead
+        cancel = threading.Event()
+        future = self._archives.submit(func, cancel=cancel, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    async def iterate(self, iterator: Iterator) -> AsyncIterator:
+        while True:
+            batch = await self.run(_take, iterator, self.BATCH_SIZE)
+            for item in batch:
+                yield item
+            if len(batch) < self.BATCH_SIZE:
+                return
+
+    def shutdown(self) -> None:
+        self._io.shutdown()
+        self._archives.shutdown()
+
+
+def _take(iterator: Iterator, count: int) -> List:
+    """Get up to count items from an iterator."""
+    items = []
+    for item in iterator:
+        items.append(item)
+        if len(items) == count:
+            break
+    return items
+
+
+class AsyncAsset:
+    """An asyncio version of Asset, see Asset for the details of each method."""
+
+    def __init__(self, asset: Asset, executor: _Executor) -> None:
+        self._asset = asset
+        self._executor = executor
+
+    async def metadata(self) -> AssetMetadata:
+        return await self._executor.run(self._asset.metadata)
+
+    async def update_metadata(self, metadata: AssetMetadata) -> None:
+        await self._executor.run(self._asset.update_metadata, metadata)
+
+    async def shots(self) -> List[str]:
+        return await self._executor.run(self._asset.shots)
+
+    async def archive(self, delete_original_folder: bool = False, workers: Optional[int] = None,
+                      incremental: bool = False) -> ArchiveStats:
+        """Archive this asset into a .zip file, cancelling the task stops the archive."""
+        return await self._executor.archive(
+            self._asset.archive, delete_original_folder=delete_original_folder,
+            workers=workers, incremental=incremental,
+        )
+
+    async def delete(self) -> None:
+        await self._executor.run(self._asset.delete)
+
+
+class AsyncShot:
+    """An asyncio version of Shot, see Shot for the details of each method."""
+
+    def __init__(self, shot: Shot, executor: _Executor) -> None:
+        self._shot = shot
+        self._executor = executor
+
+    async def metadata(self) -> ShotMetadata:
+        return await self._executor.run(self._shot.metadata)
+
+    async def update_metadata(self, metadata: ShotMetadata) -> None:
+        await self._executor.run(self._shot.update_metadata, metadata)
+
+    async def assets_by_category(self, category: str) -> List[str]:
+        return await self._executor.run(self._shot.assets_by_category, category)
+
+    async def assets(self) -> List[str]:
+        return await self._executor.run(self._shot.assets)
+
+    async def iter_assets(self) -> AsyncIterator[AsyncAsset]:
+        """Load each asset of this shot in turn, a batch at a time."""
+        names = await self.assets()
+        loaded = (self._shot.load_asset(name) for name in names)
+        async for asset in self._executor.iterate(loaded):
+            yield AsyncAsset(asset, self._executor)
+
+    async def load_asset(self, name: str) -> AsyncAsset:
+        asset = await self._executor.run(self._shot.load_asset, name)
+        return AsyncAsset(asset, self._executor)
+
+    async def create_asset(self, name: str, category: str = "") -> AsyncAsset:
+        asset = await self._executor.run(self._shot.create_asset, name, category)
+        return AsyncAsset(asset, self._executor)
+
+    async def create_assets(self, assets: Iterable[Union[str, Tuple[str, str]]], sync: bool = False) -> Dict[str, bool]:
+        return await self._executor.run(self._shot.create_assets, list(assets), sync)
+
+    async def archive(self, delete_original_folder: bool = False, workers: Optional[int] = None,
+                      incremental: bool = False) -> ArchiveStats:
+        """Archive this shot into a .zip file, cancelling the task stops the archive."""
+        return await self._executor.archive(
+            self._shot.archive, delete_original_folder=delete_original_folder,
+            workers=workers, incremental=incremental,
+        )
+
+    async def delete(self) -> None:
+        await self._executor.run(self._shot.delete)
+
+
+class AsyncShow:
+    """An asyncio version of Show, see Show for the details of each method."""
+
+    def __init__(self, show: Show, executor: _Executor) -> None:
+        self._show = show
+        self._executor = executor
+
+    async def metadata(self) -> ShowMetadata:
+        return await self._executor.run(self._show.metadata)
+
+    async def update_metadata(self, metadata: ShowMetadata) -> None:
+        await self._executor.run(self._show.update_metadata, metadata)
+
+    async def shots(self) -> List[str]:
+        return await self._executor.run(self._show.shots)
+
+    async def iter_shots(self) -> AsyncIterator[AsyncShot]:
+        """Load each shot of this show in turn, a batch at a time."""
+        names = await self.shots()
+        loaded = (self._show.load_shot(name) for name in names)
+        async for shot in self._executor.iterate(loaded):
+            yield AsyncShot(shot, self._executor)
+
+    async def load_shot(self, name: str) -> AsyncShot:
+        shot = await self._executor.run(self._show.load_shot, name)
+        return AsyncShot(shot, self._executor)
+
+    async def create_shot(self, name: str) -> AsyncShot:
+        shot = await self._executor.run(self._show.create_shot, name)
+        return AsyncShot(shot, self._executor)
+
+    async def create_shots(self, names: Iterable[str], sync: bool = False) -> Dict[str, bool]:
+        return await self._executor.run(self._show.create_shots, list(names), sync)
+
+    async def reindex_assets(self) -> None:
+        await self._executor.run(self._show.reindex_assets)
+
+    async def archive(self, delete_original_folder: bool = False, workers: Optional[int] = None,
+                      incremental: bool = False) -> ArchiveStats:
+        """Archive this show into a .zip file, cancelling the task stops the archive."""
+        return await self._executor.archive(
+            self._show.archive, delete_original_folder=delete_original_folder,
+            workers=workers, incremental=incremental,
+        )
+
+    async def delete(self) -> None:
+        await self._executor.run(self._show.delete)
+
+
+class AsyncStorage:
+    """An asyncio version of Storage, see Storage for the details of each method.
+
+    Use it as an async context manager, or call close(), to stop its threads.
+    """
+
+    def __init__(self, root: str, max_workers: int = 8, max_archives: int = 1, **options) -> None:
+        """Create a new pipeline storage for use from asyncio code.
+
+        Args:
+            root: The path under which all pipeline data is stored
+            max_workers: The number of threads running filesystem calls.
+            max_archives: The number of archives which can be written at the same time.
+            options: Passed on to Storage, eg: catalog=True.
+        """
+        self._storage = Storage(root, **options)
+        self._executor = _Executor(max_workers, max_archives)
+
+    async def __aenter__(self) -> "AsyncStorage":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Save anything buffered and stop the threads of this storage."""
+        await self._executor.run(self._storage.flush)
+        self._executor.shutdown()
+
+    async def shows(self) -> List[str]:
+        return await self._executor.run(self._storage.shows)
+
+    async def load_show(self, name: str) -> AsyncShow:
+        show = await self._executor.run(self._storage.load_show, name)
+        return AsyncShow(show, self._executor)
+
+    async def create_show(self, name: str) -> AsyncShow:
+        show = await self._executor.run(self._storage.create_show, name)
+        return AsyncShow(show, self._executor)
+
+    async def restore_show(self, name: str) -> AsyncShow:
+        show = await self._executor.run(self._storage.restore_show, name)
+        return AsyncShow(show, self._executor)
+
+    async def walk(self, depth: int = 3, with_metadata: bool = False) -> AsyncIterator[WalkEntry]:
+        """Lazily visit every show, shot and asset, a batch at a time."""
+        async for entry in self._executor.iterate(self._storage.walk(depth, with_metadata)):
+            yield entry
+
+    async def reindex(self) -> None:
+        await self._executor.run(self._storage.reindex)
+
+    async def flush(self) -> None:
+        await self._executor.run(self._storage.flush)
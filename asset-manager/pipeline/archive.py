@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Event
+from typing import Optional, Tuple
+
+from .instrument import count_bytes
+
+
+CHUNK_SIZE = 1024 * 1024
+"""The number of bytes read and compressed at a time."""
+
+SPOOL_SIZE = 8 * 1024 * 1024
+"""Compressed members larger than this are spooled to a temporary file."""
+
+MANIFEST_SUFFIX = ".manifest.json"
+"""Appended to the base name of an incremental archive for its manifest."""
+
+MANIFEST_VERSION = 1
+
+
+class ArchiveCancelled(Exception):
+    """Raised when an archive is stopped through its cancel event.
+
+    The partially written archive is removed before this is raised.
+    """
+
+
+@dataclass(frozen=True)
+class ArchiveStats:
+    """A dataclass describing a finished archive.
+
+        Attributes:
+            path (str): The path of the written .zip file.
+            files (int): The number of files written into the archive.
+            bytes_read (int): The total size of the archived files.
+            bytes_written (int): The total compressed size of the archived files.
+            seconds (float): The time it took to write the archive.
+            workers (int): The number of threads used to compress the files.
+            unchanged (int): The number of files skipped by an incremental archive.
+    """
+    path: str
+    files: int
+    bytes_read: int
+    bytes_written: int
+    seconds: float
+    workers: int
+    unchanged: int = 0
+
+    def throughput(self) -> float:
+        """The number of bytes archived per second."""
+        if self.seconds <= 0:
+            return float(self.bytes_read)
+        return self.bytes_read / self.seconds
+
+
+def make_archive(base_name: str, root_dir: str, workers: Optional[int] = None,
+                 level: int = zlib.Z_DEFAULT_COMPRESSION, cancel: Optional[Event] = None) -> ArchiveStats:
+    """Create a .zip archive of everything in a directory.
+
+    This produces the same archive as shutil.make_archive(base_name, "zip", root_dir)
+    but the files are deflated in parallel by a pool of threads. zlib releases
+    the GIL while compressing, so this scales with the number of cores.
+    Only a handful of members are held per worker at a time, so memory
+    use does not depend on the size of the directory.
+
+    A full archive supersedes any incremental chain at the same base name,
+    whose base it overwrites, so the manifest and deltas of the chain are
+    removed once it is written.
+
+    Args:
+        base_name: The path of the archive to create, without the .zip extension.
+        root_dir: The directory to archive.
+        workers: The number of compression threads, defaults to the number of cpus.
+        level: The zlib compression level to use.
+        cancel: If given, setting this event from another thread stops the archive.
+
+    Raises:
+        ArchiveCancelled: if the cancel event was set before the archive was done
+    """
+    stats, _ = _write_archive(base_name + ".zip", root_dir, workers, level, cancel=cancel)
+    _remove_chain(base_name)
+    return stats
+
+
+def make_incremental_archive(base_name: str, root_dir: str, workers: Optional[int] = None,
+                             level: int = zlib.Z_DEFAULT_COMPRESSION,
+                             cancel: Optional[Event] = None) -> ArchiveStats:
+    """Archive only what changed in a directory since it was last archived.
+
+    The first call writes a full base archive at base_name.zip along with
+    a manifest at base_name.manifest.json recording the size, modification
+    time and sha256 of every file. Each later call writes a delta archive
+    (base_name.1.zip, base_name.2.zip, ...) holding only the new and changed
+    files, and records the deleted ones in the manifest. Files whose size and
+    modification time are unchanged are not read again at all.
+
+    Use restore_archive() to rebuild the directory from the whole chain.
+
+    Args:
+        base_name: The path of the base archive, without the .zip extension.
+        root_dir: The directory to archive.
+        workers: The number of compression threads, defaults to the number of cpus.
+        level: The zlib compression level to use.
+        cancel: If given, setting this event from another thread stops the archive.
+
+    Raises:
+        ArchiveCancelled: if the cancel event was set before the archive was done
+    """
+    manifest_path = base_name + MANIFEST_SUFFIX
+    try:
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {"version": MANIFEST_VERSION, "archives": [], "files": {}}
+
+    previous = manifest["files"]
+    archives = manifest["archives"]
+    if archives:
+        zip_path = f"{base_name}.{len(archives)}.zip"
+        stats, files = _write_archive(zip_path, root_dir, workers, level, previous, cancel)
+    else:
+        zip_path = base_name + ".zip"
+        stats, files = _write_archive(zip_path, root_dir, workers, level, {}, cancel)
+
+    archives.append({
+        "name": os.path.basename(zip_path),
+        "deleted": sorted(set(previous) - set(files)),
+    })
+    manifest["files"] = files
+
+    # the manifest is what ties the chain together, so it must never be
+    # left half written if we are interrupted
+    with open(manifest_path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return stats
+
+
+def restore_archive(base_name: str, root_dir: str) -> None:
+    """Rebuild a directory from a base archive and all of its deltas.
+
+    Args:
+        base_name: The path of the base archive, without the .zip extension.
+        root_dir: The directory to extract into, it is created if needed.
+
+    Raises:
+        FileNotFoundError: if there is no manifest for the archive
+    """
+    with open(base_name + MANIFEST_SUFFIX, "r") as file:
+        manifest = json.load(file)
+
+    folder = os.path.dirname(base_name)
+    os.makedirs(root_dir, exist_ok=True)
+    for entry in manifest["archives"]:
+        for name in entry["deleted"]:
+            path = os.path.join(root_dir, name)
+            if name.endswith("/"):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
+        with zipfile.ZipFile(os.path.join(folder, entry["name"])) as archive:
+            archive.extractall(root_dir)
+
+
+def _remove_chain(base_name: str) -> None:
+    """Remove the manifest and the deltas of an incremental archive, but not its base."""
+    manifest_path = base_name + MANIFEST_SUFFIX
+    try:
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return
+
+    # without its manifest the chain is never replayed, so that goes first
+    os.remove(manifest_path)
+    folder = os.path.dirname(base_name)
+    for entry in manifest["archives"][1:]:
+        try:
+            os.remove(os.path.join(folder, entry["name"]))
+        except FileNotFoundError:
+            pass
+
+
+def _write_archive(zip_path: str, root_dir: str, workers: Optional[int], level: int,
+                   previous: Optional[dict] = None, cancel: Optional[Event] = None) -> Tuple[ArchiveStats, dict]:
+    """Write the files of root_dir into a new zip file.
+
+    If previous is given, it is the manifest of files that were already
+    archived and only files which differ from it are written. The manifest
+    describing every file currently in root_dir is returned with the stats.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    digest = previous is not None
+    manifest = {}
+    files = 0
+    unchanged = 0
+    bytes_read = 0
+    bytes_written = 0
+    pending = deque()
+    stats_by_name = {}
+
+    def check_cancelled() -> None:
+        if cancel is not None and cancel.is_set():
+            raise ArchiveCancelled(zip_path)
+
+    def write_next() -> None:
+        nonlocal files, unchanged, bytes_read, bytes_written
+        check_cancelled()
+        info, buffer, sha256 = pending.popleft().result()
+        stat = stats_by_name.pop(info.filename)
+        with buffer:
+            if digest:
+                manifest[info.filename] = {
+                    "size": info.file_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256,
+                }
+                # touched but identical files don't need to be archived again
+                if previous.get(info.filename, {}).get("sha256") == sha256:
+                    unchanged += 1
+                    return
+            _write_member(archive, info, buffer)
+        files += 1
+        bytes_read += info.file_size
+        bytes_written += info.compress_size
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for dirpath, dirnames, filenames in os.walk(root_dir):
+                dirnames.sort()
+                for name in dirnames:
+                    path = os.path.join(dirpath, name)
+                    arcname = os.path.relpath(path, root_dir).replace(os.sep, "/") + "/"
+                    manifest[arcname] = {}
+                    if not previous or arcname not in previous:
+                        archive.write(path, arcname)
+
+                for name in sorted(filenames):
+                    check_cancelled()
+                    path = os.path.join(dirpath, name)
+                    if os.path.abspath(path) == os.path.abspath(zip_path):
+                        continue
+
+                    arcname = os.path.relpath(path, root_dir).replace(os.sep, "/")
+                    stat = os.stat(path)
+                    known = previous.get(arcname) if previous else None
+                    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                        manifest[arcname] = known
+                        unchanged += 1
+                        continue
+
+                    info = zipfile.ZipInfo.from_file(path, arcname)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    stats_by_name[arcname] = stat
+                    pending.append(executor.submit(_compress, path, info, level, digest))
+
+                    # members must be written in order, so we only keep a small
+                    # window of compressed files waiting for their turn
+                    if len(pending) >= workers * 2:
+                        write_next()
+
+            while pending:
+                write_next()
+    except BaseException:
+        # don't leave a truncated archive behind that looks like a good one
+        executor.shutdown(cancel_futures=True)
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        raise
+    finally:
+        executor.shutdown()
+
+    stats = ArchiveStats(
+        path=zip_path,
+        files=files,
+        bytes_read=bytes_read,
+        bytes_written=bytes_written,
+        seconds=time.perf_counter() - started,
+        workers=workers,
+        unchanged=unchanged,
+    )
+    # the files are read on other threads, so they are counted here instead
+    count_bytes(read=bytes_read, written=bytes_written)
+    return stats, manifest
+
+
+def _compress(path: str, info: zipfile.ZipInfo, level: int,
+              digest: bool) -> Tuple[zipfile.ZipInfo, tempfile.SpooledTemporaryFile, Optional[str]]:
+    """Deflate a file into a spooled buffer, filling in the sizes and crc of info.
+
+    If digest is True, the sha256 of the file contents is returned as well.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    sha256 = hashlib.sha256() if digest else None
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    crc = 0
+    size = 0
+
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if sha256 is not None:
+                sha256.update(chunk)
+            buffer.write(compressor.compress(chunk))
+    buffer.write(compressor.flush())
+
+    info.CRC = crc
+    info.file_size = size
+    info.compress_size = buffer.tell()
+    buffer.seek(0)
+    return info, buffer, sha256.hexdigest() if sha256 is not None else None
+
+
+def _write_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, buffer: tempfile.SpooledTemporaryFile) -> None:
+    """Copy an already compressed member into the archive."""
+    # zipfile can only deflate members itself, so the already compressed
+    # data is written after a local header in the same way it would do
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    info.header_offset = archive.fp.tell()
+    archive.fp.write(info.FileHeader(zip64))
+    shutil.copyfileobj(buffer, archive.fp, CHUNK_SIZE)
+
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+    archive.start_dir = archive.fp.tell()
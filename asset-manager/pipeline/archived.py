@@ -0,0 +1,208 @@
+import mmap
+import os
+import struct
+import threading
+import zipfile
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .codec import decode
+from .directory import Directory
+from .trash import Trash
+
+
+# the lengths of the name and extra field in the local header of a member
+_LOCAL_LENGTHS = struct.Struct("<HH")
+
+
+class ZipReader:
+    """A .zip archive opened for random access without extracting it.
+
+    The archive is mapped into memory and only its central directory is
+    parsed up front, so opening even a large archive is cheap. Members
+    are decompressed on demand straight from the mapping, without any
+    seeking, so readers on many threads don't get in each other's way.
+    Parsed metadata files are kept since an archive never changes.
+
+    There is a single reader per archive in the process, see open().
+    """
+
+    _readers: Dict[str, Tuple[Tuple[int, int], "ZipReader"]] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        with open(path, "rb") as file:
+            # the mapping stays valid after the file is closed
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._zip = zipfile.ZipFile(self._map)
+        self._metadata: Dict[str, dict] = {}
+
+        self._children: Dict[str, List[str]] = {"": []}
+        for name in self._zip.namelist():
+            parts = name.rstrip("/").split("/")
+            for depth in range(len(parts)):
+                prefix = "".join(part + "/" for part in parts[:depth])
+                folder = prefix + parts[depth] + "/"
+                is_folder = depth < len(parts) - 1 or name.endswith("/")
+                if is_folder and folder not in self._children:
+                    self._children[folder] = []
+                    self._children[prefix].append(parts[depth])
+
+    @classmethod
+    def open(cls, path: str) -> "ZipReader":
+        """Get the shared reader of an archive, opening it again if it has changed.
+
+        The reader of the old archive is only dropped from the registry,
+        so directories still holding it keep reading the old contents. It
+        is closed once the last of them is gone.
+
+        Raises:
+            FileNotFoundError: if the archive does not exist
+        """
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        stamp = (info.st_mtime_ns, info.st_size)
+        with cls._registry_lock:
+            entry = cls._readers.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            reader = ZipReader(path)
+            cls._readers[path] = (stamp, reader)
+        return reader
+
+    @classmethod
+    def forget(cls, path: str) -> None:
+        """Drop the shared reader of an archive, eg: because it is being removed.
+
+        Like a replaced reader, it stays open for the directories still holding it.
+        """
+        with cls._registry_lock:
+            cls._readers.pop(os.path.abspath(path), None)
+
+    def is_folder(self, prefix: str) -> bool:
+        """True if the archive holds a folder with the given prefix, eg: "shot/"."""
+        return prefix in self._children
+
+    def children(self, prefix: str) -> List[str]:
+        """The names of the folders directly inside the folder with the given prefix."""
+        return list(self._children.get(prefix, ()))
+
+    def read(self, name: str) -> bytes:
+        """Decompress a single member.
+
+        Raises:
+            FileNotFoundError: if there is no such member
+        """
+        try:
+            info = self._zip.getinfo(name)
+        except KeyError:
+            raise FileNotFoundError(os.path.join(self._path, name)) from None
+
+        # the data follows the local header of the member, whose name and
+        # extra field may differ in length from those in the central directory
+        header = info.header_offset
+        name_length, extra_length = _LOCAL_LENGTHS.unpack_from(self._map, header + 26)
+        start = header + 30 + name_length + extra_length
+        data = memoryview(self._map)[start:start + info.compress_size]
+        try:
+            if info.compress_type == zipfile.ZIP_STORED:
+                content = bytes(data)
+            elif info.compress_type == zipfile.ZIP_DEFLATED:
+                content = zlib.decompress(data, -zlib.MAX_WBITS)
+            else:
+                raise NotImplementedError(f"unsupported compression in {self._path}: {info.compress_type}")
+        finally:
+            data.release()
+
+        if zlib.crc32(content) != info.CRC:
+            raise zipfile.BadZipFile(f"bad checksum for {name} in {self._path}")
+        return content
+
+    def metadata(self, prefix: str) -> dict:
+        """The parsed metadata file of the folder with the given prefix."""
+        data = self._metadata.get(prefix)
+        if data is None:
+            data = self._metadata[prefix] = decode(self.read(prefix + Directory.METADATA_FILE))
+        return dict(data)
+
+    def close(self) -> None:
+        self._zip.close()
+        self._map.close()
+
+
+class ArchivedDirectory(Directory):
+    """A read-only directory inside an archive, see Directory.open().
+
+    It stands in for the directory that was archived, at the same path,
+    so shows, shots and assets can be loaded from it and read as usual.
+    Anything that would change it raises a PermissionError.
+    """
+
+    def __init__(self, archive: ZipReader, path: str, prefix: str = "") -> None:
+        """Open a folder of an archive.
+
+        Args:
+            archive: The archive the folder is in
+            path: The path the folder had before it was archived
+            prefix: The path of the folder inside the archive, eg: "shot/"
+        """
+        self._archive = archive
+        self._root = path
+        self._prefix = prefix
+        self._writer = Directory.default_writer
+
+    @staticmethod
+    def open(path: str) -> Optional["ArchivedDirectory"]:
+        """Open the archive of the given directory, if there is one to read it from.
+
+        Incremental archives are only complete once their deltas are
+        replayed, so they have to be restored instead, see Storage.restore_show().
+        """
+        from .archive import MANIFEST_SUFFIX
+
+        if not os.path.isfile(path + ".zip") or os.path.exists(path + MANIFEST_SUFFIX):
+            return None
+        return ArchivedDirectory(ZipReader.open(path + ".zip"), path)
+
+    def read_only(self) -> bool:
+        return True
+
+    def on_disk(self) -> bool:
+        return False
+
+    def parent(self) -> Directory:
+        if not self._prefix:
+            return Directory.open(os.path.dirname(self._root), self._writer)
+        prefix = self._prefix[:self._prefix.rstrip("/").rfind("/") + 1]
+        return ArchivedDirectory(self._archive, os.path.dirname(self._root), prefix)
+
+    def children(self) -> List[str]:
+        return self._archive.children(self._prefix)
+
+    def child_directories(self) -> List[str]:
+        return self._archive.children(self._prefix)
+
+    def child(self, name: str) -> "ArchivedDirectory":
+        prefix = self._prefix + name + "/"
+        if not self._archive.is_folder(prefix):
+            raise FileNotFoundError(os.path.join(self._root, name))
+        return ArchivedDirectory(self._archive, os.path.join(self._root, name), prefix)
+
+    def load_metadata(self) -> dict:
+        return self._archive.metadata(self._prefix)
+
+    def save_metadata(self, metadata: dict) -> None:
+        raise PermissionError(f"archived entities are read-only: {self._root}")
+
+    def create_child(self, name: str) -> Directory:
+        raise PermissionError(f"archived entities are read-only: {self._root}")
+
+    def create_children(self, entries: Iterable[Tuple[str, Any]], sync: bool = False) -> List[bool]:
+        raise PermissionError(f"archived entities are read-only: {self._root}")
+
+    def rename(self, name: str) -> Directory:
+        raise PermissionError(f"archived entities are read-only: {self._root}")
+
+    def delete(self, trash: Optional[Trash] = None) -> None:
+        raise PermissionError(f"archived entities are read-only: {self._root}")
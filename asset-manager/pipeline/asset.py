@@ -1,10 +1,15 @@
 import os
 import json
-from dataclasses import dataclass, asdict
-from typing import List
-import shutil
+from dataclasses import dataclass
+from typing import List, Optional
+from threading import Event
 
+from .archive import ArchiveStats, make_archive, make_incremental_archive
+from .catalog import Catalog
 from .directory import Directory
+from .index import AssetIndex
+from .trash import Trash
+from .usage import DiskUsage
 
 @dataclass(frozen=True)
 class AssetMetadata:
@@ -26,50 +31,85 @@ class Asset:
         Attributes:
             _directory (Directory): The directory where the asset is located.
             _metadata (AssetMetadata): The metadata associated with the asset.
+            _catalog (Catalog): The optional catalog kept up to date with this asset.
+            _trash (Trash): The optional trash of the storage this asset is in.
 
         Methods:
             metadata: Returns the available metadata for this shot.
             update_metadata: Modify the metadata for this shot.
             shots: Get the list of shots this asset is used in.
             archive: Archive this asset into a .zip file.
+            disk_usage: Get the number and size of the files of this asset.
             delete: Remove this asset and all associated data.
     """
-    def __init__(self, directory: Directory, category: str = "") -> None:
+    def __init__(self, directory: Directory, category: str = "", catalog: Optional[Catalog] = None,
+                 lazy: bool = False, trash: Optional[Trash] = None) -> None:
         """Open an asset in the given directory.
 
         This will load any existing metadata or save the default as needed.
+
+        Args:
+            directory: The directory where the asset is located.
+            category: The category saved with the default metadata of a new asset.
+            catalog: If given, any changes to the asset are recorded in it.
+            lazy: If set to True, no metadata is read or written until it is first needed.
+            trash: If given, the asset is moved into this trash when deleted, see Trash.
+                Otherwise it is removed right away.
         """
         self._directory = directory
-
+        # archived entities are read from their archive, not the catalog
+        self._catalog = None if directory.read_only() else catalog
+        self._lazy = lazy
+        self._trash = trash
+        self._category = category
+
+        self._metadata: Optional[AssetMetadata] = None
+        if not lazy:
+            self._metadata = self._load_metadata()
+
+    def _load_metadata(self) -> AssetMetadata:
+        """Read the metadata of this asset, saving the default if there is none yet."""
         try:
-            metadata = AssetMetadata(**directory.load_metadata())
+            return AssetMetadata(**self._directory.load_metadata())
         except FileNotFoundError:
-            # the directory is created, but if this is a new show, it
+            # the directory is created, but if this is a new asset, it
             # might not have any metadata yet, so we can instead save
             # a default file
-            metadata = AssetMetadata(name=directory.name(), category=category)
-            directory.save_metadata(metadata)
-
-        self._metadata = metadata
+            metadata = AssetMetadata(name=self._directory.name(), category=self._category)
+            self._directory.save_metadata(metadata)
+            if self._catalog is not None:
+                self._catalog.add(self._directory, metadata)
+            return metadata
+
+    def _current_metadata(self) -> AssetMetadata:
+        """The metadata of this asset, loading it first in lazy mode."""
+        if self._metadata is None:
+            self._metadata = self._load_metadata()
+        return self._metadata
 
     def metadata(self) -> AssetMetadata:
         """Returns the available metadata for this shot."""
-        # we want to copy this metadata into a new instance
-        # because editing it should not change this class unless
-        # update_metadat is called specifically
-        return AssetMetadata(**asdict(self._metadata))
+        # the metadata is frozen, so it can be handed out as it is
+        # without any risk of the caller changing it behind our back
+        return self._current_metadata()
 
     def update_metadata(self, metadata: AssetMetadata) -> None:
         """Modify the metadata for this shot."""
         # call save_metadata first in case it fails we don't want this
         # class to have bad data on it.
         self._directory.save_metadata(metadata)
-        # also make a copy so that the caller can't further modify
-        # the data that we have without calling update_metadata again
-        self._metadata = AssetMetadata(**asdict(metadata))
+        # frozen metadata can't be modified further by the caller, so
+        # there is no need to keep a copy of it
+        self._metadata = metadata
 
-        os.rename(self._directory.__fspath__(),
-                  os.path.join(os.path.split(self._directory.__fspath__())[0], self._metadata.name))
+        old_directory = self._directory
+        # keep following the asset now that it lives under its new name
+        self._directory = self._directory.rename(self._metadata.name)
+
+        self._index().rename(self._shot_name(), old_directory.name(), self._metadata.name)
+        if self._catalog is not None:
+            self._catalog.rename(old_directory, self._metadata.name)
+            self._catalog.add(self._directory, self._metadata)
 
     def shots(self) -> List[str]:
         """Get the list of shots this asset is used in.
@@ -77,48 +117,79 @@ class Asset:
         Asset must have the same name in other shots.
 
         The order of the returned shots is undetermined.
+        Use Show.reindex_assets() if assets were changed outside of this library.
         """
-        asset = self._directory.__fspath__()
-        shot = os.path.dirname(asset)
-        show = os.path.dirname(shot)
-
-        shots = os.listdir(show)
-        shots.remove(self._directory.METADATA_FILE)
-
-        shot_path = os.path.split(asset)[0]
-        show_path = os.path.split(shot_path)[0]
-
-        related_shots: List = []
-
-        for entry in shots:
-            asset_path = os.path.join(entry, self._metadata.name)
-            full_asset_path = os.path.join(show_path, asset_path)
-
-            if os.path.exists(full_asset_path):
-                related_shots.append(entry)
-            else:
-                pass
+        # the reverse index of the show is built once and then kept up
+        # to date, so this doesn't need to visit every shot on disk
+        return self._index().shots(self._current_metadata().name)
 
-        return related_shots
-
-    def archive(self, delete_original_folder: bool = False) -> None:
+    def archive(self, delete_original_folder: bool = False, workers: Optional[int] = None,
+                incremental: bool = False, cancel: Optional[Event] = None) -> ArchiveStats:
         """Archive this asset into a .zip file
 
+        The files are compressed in parallel, see archive.make_archive().
+
         Args:
             delete_original_folder: If set to True, the directory being zipped will be deleted.
+            workers: The number of compression threads, defaults to the number of cpus.
+            incremental: If set to True, only the files that changed since the last
+                incremental archive are written, see archive.make_incremental_archive().
+            cancel: If given, setting this event from another thread stops the archive.
+
+        Returns:
+            The size, duration and throughput of the archive that was written.
 
+        Raises:
+            ArchiveCancelled: If the cancel event was set, the original folder is kept.
+            NotImplementedError: If the asset is not kept in a folder on disk
         """
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"only assets on disk can be archived: {os.fspath(self._directory)}")
         path = os.path.join(os.path.dirname(self._directory), self._directory)
-        shutil.make_archive(path, "zip", path)
+        # metadata buffered in write-back mode belongs in the archive too
+        self._directory.flush()
+        if incremental:
+            stats = make_incremental_archive(path, path, workers, cancel=cancel)
+        else:
+            stats = make_archive(path, path, workers, cancel=cancel)
 
         if delete_original_folder:
-            shutil.rmtree(path)
+            # removed the way any other delete is, so nothing buffered lands in it later
+            self.delete()
         else:
             pass
 
-    def delete(self) -> None:
-        """Remove this asset and all associated data."""
-        self._directory.delete()
+        return stats
 
+    def disk_usage(self, refresh: bool = False) -> DiskUsage:
+        """Get the number and total size of the files of this asset, every file below it included.
 
+        Sizes are cached for each folder, which is only scanned again once
+        something is added, removed or renamed in it, see usage.UsageCache.
 
+        Args:
+            refresh: If set to True, every folder is scanned again, eg: to see
+                files that other programs changed in place.
+
+        Raises:
+            NotImplementedError: If the asset is not kept in a folder on disk
+        """
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"only assets on disk can be measured: {os.fspath(self._directory)}")
+        return self._directory.disk_usage(refresh)
+
+    def delete(self) -> None:
+        """Remove this asset and all associated data."""
+        # in a storage the data is only moved into its trash and removed in the background
+        self._directory.delete(self._trash)
+        self._index().remove(self._shot_name(), self._directory.name())
+        if self._catalog is not None:
+            self._catalog.remove(self._directory)
+
+    def _shot_name(self) -> str:
+        """The name of the shot directory this asset is stored in."""
+        return os.path.basename(os.path.dirname(self._directory))
+
+    def _index(self) -> AssetIndex:
+        """The reverse asset index of the show this asset belongs to."""
+        return AssetIndex.for_show(self._directory.parent().parent())
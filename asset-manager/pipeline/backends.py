@@ -0,0 +1,446 @@
+"""
+Storage backends other than the default one folder per entity on disk.
+
+Each backend is a Directory subclass, so shows, shots and assets work
+the same whichever backend their Storage was opened with:
+
+memory: everything is kept in memory, for fast tests and simulations.
+packed: all the metadata of a show is kept in a single indexed sqlite
+    file, so a show of any size only uses one inode. Packed entities hold
+    metadata only, they have no folder for other files to go in.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .codec import to_dict
+from .directory import Directory
+from .trash import Trash
+
+
+BACKENDS = ("filesystem", "memory", "packed")
+
+
+class _MemoryNode:
+    __slots__ = ("name", "parent", "children", "metadata", "deleted")
+
+    def __init__(self, name: str, parent: Optional["_MemoryNode"], metadata: Optional[dict] = None) -> None:
+        self.name = name
+        self.parent = parent
+        self.children: Dict[str, _MemoryNode] = {}
+        self.metadata = metadata
+        self.deleted = False
+
+
+class _MemoryTree:
+    """The nodes of one in-memory storage, and the lock guarding them."""
+
+    def __init__(self) -> None:
+        self.token = uuid.uuid4().hex
+        self.lock = threading.RLock()
+
+
+class MemoryDirectory(Directory):
+    """A directory kept in memory, see Storage(backend="memory").
+
+    Nothing is ever written to the disk, the path of a memory directory
+    only names it. Every storage opened with the memory backend starts
+    out empty, even with the same root.
+    """
+
+    def __init__(self, tree: _MemoryTree, node: _MemoryNode, path: str) -> None:
+        self._tree = tree
+        self._node = node
+        self._root = path
+        self._writer = Directory.default_writer
+
+    @staticmethod
+    def root(path: str) -> "MemoryDirectory":
+        """Make the empty root directory of a new in-memory storage."""
+        return MemoryDirectory(_MemoryTree(), _MemoryNode(os.path.basename(path), None), path)
+
+    def on_disk(self) -> bool:
+        return False
+
+    def key(self) -> Hashable:
+        return self._tree.token, self._root
+
+    def parent(self) -> "MemoryDirectory":
+        return MemoryDirectory(self._tree, self._node.parent or self._node, os.path.dirname(self._root))
+
+    def children(self) -> List[str]:
+        with self._tree.lock:
+            return list(self._node.children)
+
+    def child_directories(self) -> List[str]:
+        return self.children()
+
+    def child(self, name: str) -> "MemoryDirectory":
+        with self._tree.lock:
+            node = self._node.children.get(name)
+        if node is None:
+            raise FileNotFoundError(os.path.join(self._root, name))
+        return MemoryDirectory(self._tree, node, os.path.join(self._root, name))
+
+    def create_child(self, name: str) -> "MemoryDirectory":
+        with self._tree.lock:
+            self._check_alive()
+            if name in self._node.children:
+                raise FileExistsError(os.path.join(self._root, name))
+            node = self._node.children[name] = _MemoryNode(name, self._node)
+        return MemoryDirectory(self._tree, node, os.path.join(self._root, name))
+
+    def create_children(self, entries: Iterable[Tuple[str, Any]], sync: bool = False) -> List[bool]:
+        created = []
+        with self._tree.lock:
+            self._check_alive()
+            for name, metadata in entries:
+                if name in self._node.children:
+                    created.append(False)
+                    continue
+                self._node.children[name] = _MemoryNode(name, self._node, to_dict(metadata))
+                created.append(True)
+        return created
+
+    def rename(self, name: str) -> "MemoryDirectory":
+        with self._tree.lock:
+            self._check_alive()
+            siblings = self._node.parent.children
+            if name != self._node.name:
+                if name in siblings:
+                    raise FileExistsError(os.path.join(os.path.dirname(self._root), name))
+                del siblings[self._node.name]
+                siblings[name] = self._node
+                self._node.name = name
+        return MemoryDirectory(self._tree, self._node, os.path.join(os.path.dirname(self._root), name))
+
+    def load_metadata(self) -> dict:
+        with self._tree.lock:
+            self._check_alive()
+            metadata = self._node.metadata
+        if metadata is None:
+            raise FileNotFoundError(os.path.join(self._root, Directory.METADATA_FILE))
+        return dict(metadata)
+
+    def save_metadata(self, metadata: Any) -> None:
+        with self._tree.lock:
+            self._check_alive()
+            self._node.metadata = to_dict(metadata)
+
+    def delete(self, trash: Optional[Trash] = None) -> None:
+        with self._tree.lock:
+            self._check_alive()
+            del self._node.parent.children[self._node.name]
+            self._node.deleted = True
+
+    def _check_alive(self) -> None:
+        node: Optional[_MemoryNode] = self._node
+        while node is not None:
+            if node.deleted:
+                raise FileNotFoundError(self._root)
+            node = node.parent
+
+
+class ShowPack:
+    """The single sqlite file holding all the metadata of a packed show.
+
+    Entities are keyed by their path inside the show, eg: "shot/asset",
+    the show itself being "". Like the catalog, rows are keyed by parent
+    path so listings and whole subtree renames and deletes use the index.
+
+    There is a single pack per file in the process, see open().
+    """
+
+    SUFFIX = ".pack"
+
+    _packs: Dict[str, "ShowPack"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " parent TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " metadata TEXT,"
+                " PRIMARY KEY (parent, name))"
+            )
+
+    @classmethod
+    def open(cls, path: str) -> "ShowPack":
+        """Get the shared pack in the given file.
+
+        Raises:
+            FileNotFoundError: if the file does not exist
+        """
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            # it may have been removed behind our back
+            cls.forget(path)
+            raise FileNotFoundError(path)
+        with cls._registry_lock:
+            pack = cls._packs.get(path)
+            if pack is None:
+                pack = cls._packs[path] = ShowPack(path)
+            return pack
+
+    @classmethod
+    def create(cls, path: str) -> "ShowPack":
+        """Create a new pack, holding a show without metadata yet.
+
+        Raises:
+            FileExistsError: if the file already exists
+        """
+        open(path, "x").close()
+        pack = cls.open(path)
+        pack.add("")
+        return pack
+
+    @classmethod
+    def forget(cls, path: str) -> None:
+        """Close the shared pack of a file, eg: because it is being moved or removed."""
+        with cls._registry_lock:
+            pack = cls._packs.pop(os.path.abspath(path), None)
+        if pack is not None:
+            pack.close()
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM entries WHERE parent = ? AND name = ?", _split(key)
+            ).fetchone()
+        return row is not None
+
+    def children(self, key: str) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name FROM entries WHERE parent = ? AND name != ''", (key,)
+            ).fetchall()
+        return [name for name, in rows]
+
+    def add(self, key: str, metadata: Optional[dict] = None) -> None:
+        """Add a new entity.
+
+        Raises:
+            FileExistsError: if the entity already exists
+        """
+        try:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?)", _split(key) + (_dump(metadata),)
+                )
+        except sqlite3.IntegrityError:
+            raise FileExistsError(os.path.join(self._path, key)) from None
+
+    def add_many(self, parent: str, entries: Iterable[Tuple[str, dict]]) -> List[bool]:
+        """Add many new entities in a single transaction.
+
+        Returns:
+            For each entry in order, True if it was added or False if it already existed
+        """
+        created = []
+        with self._lock, self._connection:
+            for name, metadata in entries:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?)", (parent, name, _dump(metadata))
+                )
+                created.append(cursor.rowcount == 1)
+        return created
+
+    def load(self, key: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT metadata FROM entries WHERE parent = ? AND name = ?", _split(key)
+            ).fetchone()
+        if row is None or row[0] is None:
+            raise FileNotFoundError(os.path.join(self._path, key, Directory.METADATA_FILE))
+        return json.loads(row[0])
+
+    def save(self, key: str, metadata: dict) -> None:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE entries SET metadata = ? WHERE parent = ? AND name = ?", (_dump(metadata),) + _split(key)
+            )
+        if cursor.rowcount == 0:
+            raise FileNotFoundError(os.path.join(self._path, key))
+
+    def rename(self, key: str, name: str) -> None:
+        parent, old_name = _split(key)
+        if old_name == name:
+            return
+        new_key = f"{parent}/{name}" if parent else name
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "SELECT 1 FROM entries WHERE parent = ? AND name = ?", (parent, name)
+            )
+            if cursor.fetchone() is not None:
+                raise FileExistsError(os.path.join(self._path, new_key))
+            cursor = self._connection.execute(
+                "UPDATE entries SET name = ? WHERE parent = ? AND name = ?", (name, parent, old_name)
+            )
+            if cursor.rowcount == 0:
+                raise FileNotFoundError(os.path.join(self._path, key))
+            # '0' is the character right after '/', see Catalog
+            self._connection.execute(
+                "UPDATE entries SET parent = ? || substr(parent, ?)"
+                " WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                (new_key, len(key) + 1, key, key + "/", key + "0"),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries WHERE parent = ? AND name = ?", _split(key))
+            self._connection.execute(
+                "DELETE FROM entries WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                (key, key + "/", key + "0"),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class PackedDirectory(Directory):
+    """A show, shot or asset kept in the pack of its show, see Storage(backend="packed")."""
+
+    def __init__(self, pack: ShowPack, path: str, key: str = "") -> None:
+        self._pack = pack
+        self._root = path
+        self._key = key
+        self._writer = Directory.default_writer
+
+    def on_disk(self) -> bool:
+        return False
+
+    def key(self) -> Hashable:
+        return "packed", os.path.abspath(self._root)
+
+    def parent(self) -> Directory:
+        if not self._key:
+            return PackedRoot(os.path.dirname(self._root))
+        return PackedDirectory(self._pack, os.path.dirname(self._root), self._key.rpartition("/")[0])
+
+    def children(self) -> List[str]:
+        return self._pack.children(self._key)
+
+    def child_directories(self) -> List[str]:
+        return self._pack.children(self._key)
+
+    def child(self, name: str) -> "PackedDirectory":
+        key = self._child_key(name)
+        if not self._pack.exists(key):
+            raise FileNotFoundError(os.path.join(self._root, name))
+        return PackedDirectory(self._pack, os.path.join(self._root, name), key)
+
+    def create_child(self, name: str) -> "PackedDirectory":
+        key = self._child_key(name)
+        self._pack.add(key)
+        return PackedDirectory(self._pack, os.path.join(self._root, name), key)
+
+    def create_children(self, entries: Iterable[Tuple[str, Any]], sync: bool = False) -> List[bool]:
+        return self._pack.add_many(self._key, ((name, to_dict(metadata)) for name, metadata in entries))
+
+    def rename(self, name: str) -> "PackedDirectory":
+        path = os.path.join(os.path.dirname(self._root), name)
+        if self._key:
+            self._pack.rename(self._key, name)
+            return PackedDirectory(self._pack, path, self._child_key(name, self._key.rpartition("/")[0]))
+
+        # a whole show is moved by renaming its pack
+        new_file = path + ShowPack.SUFFIX
+        if os.path.exists(new_file):
+            raise FileExistsError(path)
+        ShowPack.forget(self._root + ShowPack.SUFFIX)
+        os.rename(self._root + ShowPack.SUFFIX, new_file)
+        return PackedDirectory(ShowPack.open(new_file), path)
+
+    def load_metadata(self) -> dict:
+        return self._pack.load(self._key)
+
+    def save_metadata(self, metadata: Any) -> None:
+        self._pack.save(self._key, to_dict(metadata))
+
+    def delete(self, trash: Optional[Trash] = None) -> None:
+        if self._key:
+            self._pack.delete(self._key)
+            return
+        ShowPack.forget(self._root + ShowPack.SUFFIX)
+        os.remove(self._root + ShowPack.SUFFIX)
+
+    def _child_key(self, name: str, parent: Optional[str] = None) -> str:
+        parent = self._key if parent is None else parent
+        return f"{parent}/{name}" if parent else name
+
+
+class PackedRoot(Directory):
+    """The root of a packed storage, a folder holding one pack per show."""
+
+    def on_disk(self) -> bool:
+        return False
+
+    def key(self) -> Hashable:
+        return "packed", os.path.abspath(self._root)
+
+    def children(self) -> List[str]:
+        return [
+            entry[:-len(ShowPack.SUFFIX)] for entry in os.listdir(self._root)
+            if entry.endswith(ShowPack.SUFFIX) and not entry.startswith(".")
+        ]
+
+    def child_directories(self) -> List[str]:
+        return self.children()
+
+    def child(self, name: str) -> PackedDirectory:
+        path = os.path.join(self._root, name)
+        try:
+            return PackedDirectory(ShowPack.open(path + ShowPack.SUFFIX), path)
+        except FileNotFoundError:
+            raise FileNotFoundError(path) from None
+
+    def create_child(self, name: str) -> PackedDirectory:
+        path = os.path.join(self._root, name)
+        try:
+            return PackedDirectory(ShowPack.create(path + ShowPack.SUFFIX), path)
+        except FileExistsError:
+            raise FileExistsError(path) from None
+
+    def create_children(self, entries: Iterable[Tuple[str, Any]], sync: bool = False) -> List[bool]:
+        created = []
+        for name, metadata in entries:
+            try:
+                self.create_child(name).save_metadata(metadata)
+                created.append(True)
+            except FileExistsError:
+                created.append(False)
+        return created
+
+
+def open_root(root: str, backend: str, writer: Any) -> Directory:
+    """Open the root directory of a storage with the given backend.
+
+    Raises:
+        ValueError: If the backend is not one of BACKENDS
+    """
+    if backend == "filesystem":
+        return Directory._unchecked(root, writer)
+    if backend == "memory":
+        return MemoryDirectory.root(root)
+    if backend == "packed":
+        return PackedRoot(root)
+    raise ValueError(f"unknown backend: {backend}")
+
+
+def _split(key: str) -> Tuple[str, str]:
+    parent, _, name = key.rpartition("/")
+    return parent, name
+
+
+def _dump(metadata: Optional[dict]) -> Optional[str]:
+    return None if metadata is None else json.dumps(metadata)
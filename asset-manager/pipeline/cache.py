@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .codec import decode
+from .versions import Version, stamp
+
+
+@dataclass(frozen=True)
+class CacheInfo:
+    """A dataclass with the statistics of a MetadataCache.
+
+        Attributes:
+            hits (int): The number of loads answered from the cache.
+            misses (int): The number of loads that had to read the file.
+            size (int): The number of files currently cached.
+            maxsize (int): The number of files the cache can hold.
+    """
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+
+class MetadataCache:
+    """A size-bounded cache of parsed metadata files.
+
+    Each cached file remembers the version stamp it had when it was read,
+    and is only used while the file on disk still matches, see versions.py.
+    A load then costs a single stat instead of an open, read and parse,
+    and changes made by other processes are still seen. When the cache
+    is full, the least recently used file is dropped.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        """Create an empty cache.
+
+        Args:
+            maxsize: The number of files to keep, 0 disables the cache.
+        """
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def load(self, path: str) -> dict:
+        """Get the parsed contents of a metadata file, in either encoding.
+
+        Raises:
+            FileNotFoundError: if the file does not exist
+        """
+        return self.load_versioned(path)[1]
+
+    def load_versioned(self, path: str) -> Tuple[Version, dict]:
+        """Get the parsed contents of a metadata file along with its version stamp.
+
+        The file is stamped before it is read, so if it changes in between
+        the stamp is the older one and a checked save over it fails safely.
+
+        Raises:
+            FileNotFoundError: if the file does not exist
+        """
+        try:
+            version = stamp(os.stat(path))
+        except FileNotFoundError:
+            self.discard(path)
+            raise
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                self._hits += 1
+                # hand out a copy so the cached data can't be modified
+                return version, dict(entry[1])
+            self._misses += 1
+
+        with open(path, "rb") as file:
+            data = decode(file.read())
+        self._put(path, version, data)
+        return version, dict(data)
+
+    def store(self, path: str, data: dict, version: Optional[Version] = None) -> Version:
+        """Remember data that was just written to the given file.
+
+        Args:
+            path: The file that was written
+            data: The data written into it
+            version: The version stamp of the file, if it is already known
+
+        Returns:
+            The version stamp of the file
+        """
+        if version is None:
+            version = stamp(os.stat(path))
+        self._put(path, version, dict(data))
+        return version
+
+    def discard(self, path: str) -> None:
+        """Forget the given file, if it is cached."""
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self) -> None:
+        """Forget every file and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        """Get the hit and miss counters of the cache."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, len(self._entries), self._maxsize)
+
+    def _put(self, path: str, stamp: tuple, data: dict) -> None:
+        if self._maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[path] = (stamp, data)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
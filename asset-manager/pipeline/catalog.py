@@ -0,0 +1,306 @@
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+from .search import tokens_of
+
+
+class Catalog:
+    """A persistent index of the shows, shots and assets in a storage.
+
+    The catalog is a small sqlite database kept under the storage root
+    which mirrors the name, category and description of every entity.
+    Listing and category queries can be answered from its indexes
+    instead of walking the directories and opening every metadata file.
+    Names and descriptions are also indexed by their trigrams, so they
+    can be searched by any fragment, see search().
+
+    Entities are identified by their directory on disk, which must be
+    located somewhere under the catalog root.
+    """
+
+    CATALOG_FILE = ".catalog.sqlite"
+
+    def __init__(self, root: str) -> None:
+        """Open (or create) the catalog for the given storage root.
+
+        Args:
+            root: The path under which all pipeline data is stored
+        """
+        self._root = os.path.abspath(root)
+        self._path = os.path.join(self._root, Catalog.CATALOG_FILE)
+        self._created = not os.path.exists(self._path)
+
+        # the catalog can be shared by the objects of many threads, so
+        # we serialize access ourselves instead of letting sqlite refuse
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " parent TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " category TEXT NOT NULL DEFAULT '',"
+                " description TEXT NOT NULL DEFAULT '',"
+                " PRIMARY KEY (parent, name))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_category"
+                " ON entries (parent, category)"
+            )
+            searchable = self._connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'tokens'"
+            ).fetchone()
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " token TEXT NOT NULL,"
+                " parent TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " PRIMARY KEY (token, parent, name)) WITHOUT ROWID"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS tokens_entry ON tokens (parent, name)"
+            )
+            if not searchable:
+                # catalogs from before search was added only need their tokens
+                rows = self._connection.execute("SELECT * FROM entries").fetchall()
+                self._add_tokens(rows, replace=False)
+
+    def created(self) -> bool:
+        """True if the catalog file did not exist before it was opened."""
+        return self._created
+
+    def _split(self, path: os.PathLike) -> Tuple[str, str]:
+        """The (parent, name) key of the entity at the given path."""
+        relative = self._relative(path)
+        parent, _, name = relative.rpartition("/")
+        return parent, name
+
+    def _relative(self, path: os.PathLike) -> str:
+        """The path of an entity relative to the root, using '/' separators."""
+        relative = os.path.relpath(os.path.abspath(os.fspath(path)), self._root)
+        if relative == os.curdir:
+            return ""
+        return relative.replace(os.sep, "/")
+
+    def add(self, path: os.PathLike, metadata: Any) -> None:
+        """Add or replace the entity at the given path.
+
+        Args:
+            path: The directory of the show, shot or asset
+            metadata: The metadata dataclass of the entity
+        """
+        row = self._row(path, metadata)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", row
+            )
+            self._add_tokens([row])
+
+    def add_many(self, entries: Iterable[Tuple[os.PathLike, Any]]) -> None:
+        """Add or replace many entities in a single transaction.
+
+        Args:
+            entries: pairs of entity directory and metadata dataclass
+        """
+        rows = [self._row(path, metadata) for path, metadata in entries]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows
+            )
+            self._add_tokens(rows)
+
+    def remove(self, path: os.PathLike) -> None:
+        """Remove the entity at the given path along with everything below it."""
+        parent, name = self._split(path)
+        prefix = self._relative(path)
+        with self._lock, self._connection:
+            for table in ("entries", "tokens"):
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE parent = ? AND name = ?", (parent, name)
+                )
+            self._delete_below(prefix)
+
+    def rename(self, path: os.PathLike, name: str) -> None:
+        """Move the entity at the given path to a new name in the same parent."""
+        parent, old_name = self._split(path)
+        if old_name == name:
+            return
+
+        old_prefix = self._relative(path)
+        new_prefix = f"{parent}/{name}" if parent else name
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE entries SET name = ? WHERE parent = ? AND name = ?",
+                (name, parent, old_name),
+            )
+            # descendants are keyed by their parent path, so the whole
+            # subtree needs to be moved to the new prefix as well
+            for table in ("entries", "tokens"):
+                self._connection.execute(
+                    f"UPDATE {table} SET parent = ? || substr(parent, ?)"
+                    " WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                    (new_prefix, len(old_prefix) + 1, old_prefix,
+                     old_prefix + "/", old_prefix + "0"),
+                )
+            # the new name has tokens of its own
+            self._connection.execute(
+                "DELETE FROM tokens WHERE parent = ? AND name = ?", (parent, old_name)
+            )
+            rows = self._connection.execute(
+                "SELECT * FROM entries WHERE parent = ? AND name = ?", (parent, name)
+            ).fetchall()
+            self._add_tokens(rows)
+
+    def children(self, path: os.PathLike) -> List[str]:
+        """Get the names of the entities directly under the given path.
+
+        The order of the returned names is undetermined.
+        """
+        parent = self._relative(path)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name FROM entries WHERE parent = ?", (parent,)
+            ).fetchall()
+        return [name for name, in rows]
+
+    def children_by_category(self, path: os.PathLike, category: str) -> List[str]:
+        """Get the names of the entities under the given path with a category.
+
+        The order of the returned names is undetermined.
+        """
+        parent = self._relative(path)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name FROM entries WHERE parent = ? AND category = ?",
+                (parent, category),
+            ).fetchall()
+        return [name for name, in rows]
+
+    def assets(self, path: os.PathLike, categories: Optional[Set[str]] = None) -> List[Tuple[str, str, str, str]]:
+        """Find the assets below a show, or below every show if given the root.
+
+        Args:
+            path: The directory of a show or the root of the catalog
+            categories: Only return assets with one of these categories, None for all
+
+        Returns:
+            (show, shot, asset, category) for each asset, in no particular order
+        """
+        prefix = self._relative(path)
+        if prefix:
+            query = "SELECT parent, name, category FROM entries WHERE parent >= ? AND parent < ?"
+            parameters = [prefix + "/", prefix + "0"]
+        else:
+            query = "SELECT parent, name, category FROM entries WHERE parent LIKE '%/%'"
+            parameters = []
+
+        if categories is not None:
+            query += f" AND category IN ({', '.join('?' * len(categories))})"
+            parameters.extend(categories)
+
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+
+        found = []
+        for parent, name, category in rows:
+            # only assets live two levels down, in a show and then a shot
+            parts = parent.split("/")
+            if len(parts) == 2:
+                found.append((parts[0], parts[1], name, category))
+        return found
+
+    def search(self, tokens: Set[str], path: os.PathLike,
+               categories: Optional[Set[str]] = None) -> List[Tuple[str, str, str, str]]:
+        """Find the entities below a path whose name or description has every token.
+
+        Only the indexes are used, so this stays fast however many entities
+        there are. The candidates still need to be checked, see search.score().
+
+        Args:
+            tokens: The tokens to look for, see search.query_tokens()
+            path: The directory of a show or shot, or the root of the catalog
+            categories: Only return assets with one of these categories, None for all
+
+        Returns:
+            (path, name, category, description) for each candidate, the path
+            being relative to the root, in no particular order
+        """
+        if not tokens:
+            return []
+        query = (
+            "SELECT entries.parent, entries.name, category, description FROM entries"
+            " JOIN (SELECT parent, name FROM tokens"
+            f"  WHERE token IN ({', '.join('?' * len(tokens))})"
+            "  GROUP BY parent, name HAVING count(*) = ?) AS found"
+            " ON entries.parent = found.parent AND entries.name = found.name"
+        )
+        parameters: List[Any] = [*tokens, len(tokens)]
+
+        prefix = self._relative(path)
+        if prefix:
+            query += " WHERE (entries.parent = ? OR (entries.parent >= ? AND entries.parent < ?))"
+            parameters.extend((prefix, prefix + "/", prefix + "0"))
+        if categories is not None:
+            query += " AND" if prefix else " WHERE"
+            query += f" category IN ({', '.join('?' * len(categories))})"
+            parameters.extend(categories)
+
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [
+            (f"{parent}/{name}" if parent else name, name, category, description)
+            for parent, name, category, description in rows
+        ]
+
+    def rebuild(self, entries: Iterable[Tuple[os.PathLike, Any]]) -> None:
+        """Replace the whole contents of the catalog.
+
+        Args:
+            entries: pairs of entity directory and metadata dataclass
+        """
+        rows = [self._row(path, metadata) for path, metadata in entries]
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.execute("DELETE FROM tokens")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows
+            )
+            self._add_tokens(rows, replace=False)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _row(self, path: os.PathLike, metadata: Any) -> Tuple[str, str, str, str]:
+        parent, name = self._split(path)
+        return (
+            parent,
+            name,
+            getattr(metadata, "category", ""),
+            getattr(metadata, "description", ""),
+        )
+
+    def _add_tokens(self, rows: Iterable[Tuple[str, str, str, str]], replace: bool = True) -> None:
+        """Index the names and descriptions of some entries, replacing their old tokens."""
+        for parent, name, _, description in rows:
+            if replace:
+                self._connection.execute(
+                    "DELETE FROM tokens WHERE parent = ? AND name = ?", (parent, name)
+                )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO tokens VALUES (?, ?, ?)",
+                ((token, parent, name) for token in tokens_of(name, description)),
+            )
+
+    def _delete_below(self, prefix: str) -> None:
+        # '0' is the character right after '/', so this range matches
+        # every parent path that starts with the prefix directory
+        for table in ("entries", "tokens"):
+            self._connection.execute(
+                f"DELETE FROM {table} WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                (prefix, prefix + "/", prefix + "0"),
+            )
@@ -0,0 +1,383 @@
+"""
+The command line interface of the pipeline, run with python -m pipeline.
+
+Commands are answered by a daemon when one is running for the storage,
+which keeps the catalog, indexes, metadata cache and folder sizes warm between runs
+and follows changes made by other processes. Without a daemon the CLI
+reads the storage directly, with the same results.
+
+Eg:
+    python -m pipeline --root /mnt/pipeline daemon --detach
+    python -m pipeline --root /mnt/pipeline list my-show shot1
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from .storage import Storage
+
+SOCKET_FILE = ".pipeline.sock"
+"""The hidden Unix socket under the storage root which the daemon listens on."""
+
+ROOT_VARIABLE = "PIPELINE_ROOT"
+"""The environment variable holding the default storage root."""
+
+# the errors which are sent back to the client to be raised again there
+_ERRORS = {
+    error.__name__: error
+    for error in (FileNotFoundError, FileExistsError, PermissionError, ValueError, NotImplementedError)
+}
+
+
+def execute(storage: Storage, command: str, arguments: Dict[str, Any]) -> Any:
+    """Run a single command against a storage.
+
+    This is shared by the daemon and the direct fallback, so both give
+    the same answers.
+
+    Args:
+        storage: The storage to run the command against
+        command: One of list, query, create, archive, delete, purge or usage
+        arguments: The options of the command, as parsed from the command line
+
+    Returns:
+        The result of the command, made of plain json types
+
+    Raises:
+        ValueError: if the command is unknown
+    """
+    names = [name for name in arguments.get("names", ()) if name]
+    if command == "list":
+        if not names:
+            return sorted(storage.shows())
+        show = storage.load_show(names[0])
+        if len(names) == 1:
+            return sorted(show.shots())
+        shot = show.load_shot(names[1])
+        if arguments.get("category"):
+            return sorted(shot.assets_by_category(arguments["category"]))
+        return sorted(shot.assets())
+
+    if command == "query":
+        if arguments.get("text"):
+            return [
+                list(match) for match in storage.search(
+                    arguments["text"], arguments.get("category"), arguments.get("show"),
+                    arguments.get("shot"), arguments.get("limit") or 20,
+                )
+            ]
+        return sorted(list(match) for match in storage.find_assets(arguments.get("category"), arguments.get("show")))
+
+    if command == "create":
+        _check_names(names)
+        if len(names) == 1:
+            storage.create_show(names[0])
+        elif len(names) == 2:
+            storage.load_show(names[0]).create_shot(names[1])
+        else:
+            shot = storage.load_show(names[0]).load_shot(names[1])
+            shot.create_asset(names[2], arguments.get("category") or "")
+        return None
+
+    if command == "archive":
+        entity = _load(storage, names)
+        stats = entity.archive(
+            delete_original_folder=arguments.get("delete", False),
+            incremental=arguments.get("incremental", False),
+        )
+        return asdict(stats)
+
+    if command == "delete":
+        _load(storage, names).delete()
+        return None
+
+    if command == "purge":
+        return asdict(storage.purge())
+
+    if command == "usage":
+        refresh = arguments.get("refresh", False)
+        if names:
+            return asdict(_load(storage, names).disk_usage(refresh))
+        return [
+            list(entry) for entry in storage.usage_report(arguments.get("limit") or 20, arguments.get("level"), refresh)
+        ]
+
+    raise ValueError(f"unknown command: {command}")
+
+
+def request(socket_path: str, command: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+    """Send a command to a running daemon and wait for its result.
+
+    Raises:
+        ConnectionError: if no daemon is listening on the socket
+        FileNotFoundError: if there is no socket at all
+        OSError: or any of the errors the command itself raised in the daemon
+    """
+    with _connect(socket_path, timeout) as connection:
+        return _send(connection, socket_path, command, arguments)
+
+
+def _connect(socket_path: str, timeout: Optional[float] = None) -> socket.socket:
+    """Connect to the daemon listening on a socket.
+
+    Raises:
+        ConnectionError: if no daemon is listening on the socket
+        FileNotFoundError: if there is no socket at all
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+    except BaseException:
+        connection.close()
+        raise
+    return connection
+
+
+def _send(connection: socket.socket, socket_path: str, command: str, arguments: Dict[str, Any]) -> Any:
+    """Send a command over a connection to the daemon and wait for its result."""
+    connection.sendall(json.dumps({"command": command, "arguments": arguments}).encode() + b"\n")
+    with connection.makefile("rb") as replies:
+        line = replies.readline()
+    if not line:
+        raise ConnectionResetError(f"the daemon closed the connection: {socket_path}")
+
+    reply = json.loads(line)
+    if "error" in reply:
+        raise _ERRORS.get(reply["error"], RuntimeError)(reply["message"])
+    return reply["result"]
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers commands for one storage over a local Unix socket.
+
+    The daemon keeps a storage with a catalog open for as long as it runs,
+    and watches it, so changes made by other processes are picked up
+    without anyone having to walk the tree again, see Storage.watch().
+    Each client gets a thread of its own.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root: str, socket_path: Optional[str] = None) -> None:
+        """Open the storage and start listening, without answering anything yet.
+
+        Args:
+            root: The root of the pipeline storage
+            socket_path: Where to listen, defaults to the socket under the root
+
+        Raises:
+            FileExistsError: if another daemon is already running for the storage
+        """
+        self.storage = Storage(root, catalog=True)
+        self.socket_path = socket_path or os.path.join(os.path.abspath(root), SOCKET_FILE)
+        if os.path.exists(self.socket_path):
+            try:
+                request(self.socket_path, "ping", {}, timeout=1.0)
+            except OSError:
+                # left behind by a daemon which didn't shut down cleanly
+                os.remove(self.socket_path)
+            else:
+                raise FileExistsError(f"a daemon is already running: {self.socket_path}")
+        super().__init__(self.socket_path, _Handler)
+        # catch up on the changes made while no daemon was watching
+        self.storage.reindex()
+        self._watcher = self.storage.watch()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._watcher.stop()
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def answer(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """The reply to a single request."""
+        command = message.get("command")
+        if command == "ping":
+            return {"result": os.getpid()}
+        if command == "stop":
+            # shutdown() waits for serve_forever(), which is waiting for us
+            threading.Thread(target=self.shutdown).start()
+            return {"result": None}
+        try:
+            return {"result": execute(self.storage, command, message.get("arguments", {}))}
+        except tuple(_ERRORS.values()) as error:
+            return {"error": type(error).__name__, "message": str(error)}
+        except Exception as error:
+            return {"error": "RuntimeError", "message": f"{type(error).__name__}: {error}"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                reply = self.server.answer(json.loads(line))
+            except ValueError as error:
+                reply = {"error": "ValueError", "message": f"bad request: {error}"}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pipeline", description="Manage the shows, shots and assets of a pipeline.")
+    parser.add_argument("--root", default=os.environ.get(ROOT_VARIABLE, os.curdir),
+                        help=f"The root of the pipeline storage, defaults to ${ROOT_VARIABLE} or the current directory")
+    parser.add_argument("--socket", help="The socket of the daemon, defaults to one under the root")
+    parser.add_argument("--direct", action="store_true", help="Read the storage directly even if a daemon is running")
+    parser.add_argument("--json", action="store_true", help="Print results as json")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listing = commands.add_parser("list", help="List the shows, the shots of a show or the assets of a shot")
+    listing.add_argument("names", nargs="*", metavar="show [shot]")
+    listing.add_argument("--category", help="Only list the assets of a shot with this category")
+
+    query = commands.add_parser("query", help="Find assets by category, or anything by name and description")
+    query.add_argument("text", nargs="?", help="Words to search names and descriptions for, see Storage.search()")
+    query.add_argument("--category", action="append", help="Only find assets with this category, can be repeated")
+    query.add_argument("--show", help="Only search this show")
+    query.add_argument("--shot", help="Only search this shot of the show")
+    query.add_argument("--limit", type=int, help="The most matches of a search to print")
+
+    create = commands.add_parser("create", help="Create a show, shot or asset")
+    create.add_argument("names", nargs="+", metavar="show [shot [asset]]")
+    create.add_argument("--category", help="The category of a new asset")
+
+    archive = commands.add_parser("archive", help="Archive a show, shot or asset into a .zip file")
+    archive.add_argument("names", nargs="+", metavar="show [shot [asset]]")
+    archive.add_argument("--delete", action="store_true", help="Delete the original folder once archived")
+    archive.add_argument("--incremental", action="store_true", help="Only archive what changed since the last time")
+
+    delete = commands.add_parser("delete", help="Delete a show, shot or asset")
+    delete.add_argument("names", nargs="+", metavar="show [shot [asset]]")
+
+    commands.add_parser("purge", help="Remove everything deleted for good, without waiting for the undo window")
+
+    usage = commands.add_parser("usage", help="Show the size of a show, shot or asset, or rank the biggest ones")
+    usage.add_argument("names", nargs="*", metavar="show [shot [asset]]")
+    usage.add_argument("--level", choices=("show", "shot", "asset"), help="Only rank shows, shots or assets")
+    usage.add_argument("--limit", type=int, help="The most entities to rank")
+    usage.add_argument("--refresh", action="store_true", help="Scan every folder again, eg: after files were changed in place")
+
+    daemon = commands.add_parser("daemon", help="Run the daemon which keeps the storage warm for the other commands")
+    daemon.add_argument("--detach", action="store_true", help="Run it in the background and return once it is ready")
+    daemon.add_argument("--stop", action="store_true", help="Stop the running daemon")
+    options = parser.parse_args(args)
+
+    root = os.path.abspath(options.root)
+    socket_path = options.socket or os.path.join(root, SOCKET_FILE)
+    if options.command == "daemon":
+        return _daemon(root, socket_path, options)
+
+    arguments = {key: value for key, value in vars(options).items() if key not in ("root", "socket", "direct", "json")}
+    try:
+        result = _run(root, socket_path, options.command, arguments, options.direct)
+    except (OSError, ValueError, NotImplementedError, RuntimeError) as error:
+        # the daemon reports unexpected errors as a RuntimeError
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+    if options.json:
+        json.dump(result, sys.stdout)
+        print()
+    elif isinstance(result, list):
+        for item in result:
+            print(_format(item))
+    elif isinstance(result, dict):
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    return 0
+
+
+def _run(root: str, socket_path: str, command: str, arguments: Dict[str, Any], direct: bool) -> Any:
+    """Run a command on the daemon if there is one, or directly otherwise."""
+    if not direct:
+        try:
+            connection = _connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            # no daemon, or a dead one, go to the disk ourselves
+            pass
+        else:
+            # errors of the command itself are the answer, not a reason to retry
+            with connection:
+                return _send(connection, socket_path, command, arguments)
+    return execute(Storage(root), command, arguments)
+
+
+def _daemon(root: str, socket_path: str, options: argparse.Namespace) -> int:
+    if options.stop:
+        try:
+            request(socket_path, "stop", {})
+        except (FileNotFoundError, ConnectionRefusedError):
+            print(f"error: no daemon is running: {socket_path}", file=sys.stderr)
+            return 1
+        return 0
+
+    if options.detach:
+        command = [sys.executable, "-m", "pipeline", "--root", root, "--socket", socket_path, "daemon"]
+        # the daemon must import this same pipeline package, installed or not
+        environment = dict(os.environ)
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment["PYTHONPATH"] = os.pathsep.join(filter(None, [package_parent, environment.get("PYTHONPATH")]))
+        process = subprocess.Popen(
+            command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True, env=environment,
+        )
+        deadline = time.monotonic() + 30.0
+        while time.monotonic() < deadline:
+            try:
+                request(socket_path, "ping", {}, timeout=1.0)
+                return 0
+            except OSError:
+                if process.poll() is not None:
+                    break
+                time.sleep(0.05)
+        print(f"error: the daemon did not start: {socket_path}", file=sys.stderr)
+        return 1
+
+    try:
+        server = Daemon(root, socket_path)
+    except FileExistsError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def _check_names(names: List[str]) -> None:
+    if not 1 <= len(names) <= 3:
+        raise ValueError("expected a show, and optionally a shot and an asset")
+
+
+def _load(storage: Storage, names: List[str]) -> Any:
+    """The show, shot or asset with the given names."""
+    _check_names(names)
+    entity: Any = storage.load_show(names[0])
+    if len(names) > 1:
+        entity = entity.load_shot(names[1])
+    if len(names) > 2:
+        entity = entity.load_asset(names[2])
+    return entity
+
+
+def _format(item: Any) -> str:
+    """A line of output for one item of a listing or query."""
+    if isinstance(item, list):
+        # matches are names followed by a category, and a score for a search
+        names = "/".join(name for name in item[:3] if name)
+        return "\t".join([names, *(str(value) for value in item[3:])])
+    return str(item)
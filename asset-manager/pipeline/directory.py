@@ -1,32 +1,201 @@
+import ctypes
+import ctypes.util
+import functools
 import os
-import json
 import shutil
-from dataclasses import asdict
+import tempfile
 import zipfile
-from typing import Any
+from typing import Any, Callable, Hashable, Iterable, List, Optional, Tuple
+
+from .cache import MetadataCache
+from .codec import encode, to_dict
+from .trash import Trash
+from .usage import DiskUsage, UsageCache
+from .versions import Version, VersionConflict, version_of
+from .writer import MetadataWriter
 
 
 class Directory(os.PathLike):
     """An existing directory where pipeline data is stored.
 
+    This is also the interface of every storage backend. Shows, shots
+    and assets only go through the methods of their directory, so a
+    subclass can keep them anywhere, see backends.py. This class itself
+    is the filesystem backend: a folder with a metadata.json file for
+    each entity.
+
     Raises:
         FileNotFoundError: the directory does not yet exist
     """
 
     METADATA_FILE = "metadata.json"
 
-    def __init__(self, path: str) -> None:
+    # shared by every directory in the process so that opening the
+    # same show, shot or asset again doesn't parse its metadata again
+    cache = MetadataCache()
+
+    # shared by every directory in the process so that the sizes of
+    # folders are only summed again once they change
+    usage = UsageCache()
+
+    # used by directories which were not given a writer of their own
+    default_writer = MetadataWriter()
+
+    # the version stamp of the metadata file as it was last read or saved
+    # through this directory, which checked saves compare against
+    _version: Optional[Version] = None
+
+    def __init__(self, path: str, writer: Optional[MetadataWriter] = None) -> None:
+        """Open an existing directory.
+
+        Args:
+            path: The location of the directory on disk
+            writer: Decides how and when metadata is written, see MetadataWriter.
+        """
         if not os.path.exists(path):
             raise FileNotFoundError(path)
         self._root = path
+        self._writer = writer or Directory.default_writer
 
     @staticmethod
-    def create(path) -> "Directory":
+    def _unchecked(path: str, writer: Optional[MetadataWriter] = None) -> "Directory":
+        """A directory that is known to exist, or will be checked when it is used."""
+        directory = Directory.__new__(Directory)
+        directory._root = path
+        directory._writer = writer or Directory.default_writer
+        return directory
+
+    @staticmethod
+    def create(path, writer: Optional[MetadataWriter] = None) -> "Directory":
         """Create a new pipeline directory for storing data."""
         os.mkdir(path)
-        dir = Directory(path)
+        dir = Directory(path, writer)
+        if dir._writer.transaction is not None:
+            dir._writer.transaction.created(path)
         return dir
 
+    @staticmethod
+    def open(path: str, writer: Optional[MetadataWriter] = None) -> "Directory":
+        """Open an existing directory, or read it from its archive if it was archived.
+
+        A directory that was archived and deleted is read straight from its
+        .zip file, without extracting it, see archived.ArchivedDirectory.
+
+        Raises:
+            FileNotFoundError: the directory does not exist and was not archived
+        """
+        try:
+            return Directory(path, writer)
+        except FileNotFoundError:
+            from .archived import ArchivedDirectory
+
+            archived = ArchivedDirectory.open(path)
+            if archived is None:
+                raise
+            return archived
+
+    def child(self, name: str) -> "Directory":
+        """Open an existing directory inside this one, with the same writer.
+
+        Raises:
+            FileNotFoundError: the directory does not yet exist
+        """
+        return Directory.open(os.path.join(self._root, name), self._writer)
+
+    def create_child(self, name: str) -> "Directory":
+        """Create a new directory inside this one, with the same writer.
+
+        Raises:
+            FileExistsError: the directory already exists
+        """
+        return Directory.create(os.path.join(self._root, name), self._writer)
+
+    def rename(self, name: str) -> "Directory":
+        """Move this directory to a new name in the same parent.
+
+        Returns:
+            The directory at its new location
+        """
+        new_path = os.path.join(os.path.dirname(self._root), name)
+        transaction = self._writer.transaction
+        if transaction is not None:
+            transaction.renaming(self._root, new_path)
+        os.rename(self._root, new_path)
+        self._writer.move(self._root, new_path)
+        if transaction is not None:
+            transaction.renamed(self._root, new_path)
+        renamed = Directory(new_path, self._writer)
+        # the metadata file moved along unchanged
+        renamed._version = self._version
+        return renamed
+
+    def flush(self) -> None:
+        """Write out any metadata that the writer has buffered for this directory or below it."""
+        self._writer.flush(self._root)
+
+    @staticmethod
+    def create_many(parent: os.PathLike, entries: Iterable[Tuple[str, Any]], sync: bool = False,
+                    binary: bool = False) -> List[bool]:
+        """Create many new pipeline directories, each with its metadata already saved.
+
+        The whole batch is prepared in a hidden staging folder under the parent
+        and each directory is then published with a single rename, so it either
+        appears complete with its metadata or not at all.
+
+        Args:
+            parent: The directory in which the new directories are created
+            entries: Pairs of directory name and the metadata dataclass to save in it
+            sync: If set to True, a single barrier waits for the whole batch to
+                reach the disk before returning.
+            binary: If set to True, the metadata is saved in the binary encoding, see codec.py.
+
+        Returns:
+            For each entry in order, True if it was created or False if it already existed
+        """
+        parent = os.fspath(parent)
+        created: List[bool] = []
+        staged: List[Tuple[str, str, dict]] = []
+        names = set()
+
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=parent)
+        try:
+            for name, metadata in entries:
+                path = os.path.join(parent, name)
+                if name in names or os.path.exists(path):
+                    created.append(False)
+                    continue
+                names.add(name)
+
+                staged_path = os.path.join(staging, name)
+                os.mkdir(staged_path)
+                data = to_dict(metadata)
+                with open(os.path.join(staged_path, Directory.METADATA_FILE), "wb") as file:
+                    file.write(encode(data, binary))
+                staged.append((name, staged_path, data))
+                created.append(True)
+
+            published = iter(staged)
+            for index, was_created in enumerate(created):
+                if not was_created:
+                    continue
+                name, staged_path, data = next(published)
+                path = os.path.join(parent, name)
+                # rename would silently replace an empty directory that
+                # was made in the meantime, so check again right before
+                if os.path.exists(path):
+                    created[index] = False
+                    continue
+                os.rename(staged_path, path)
+                # renaming keeps the modification time and size of the
+                # metadata file, so it can go straight into the cache
+                Directory.cache.store(os.path.join(path, Directory.METADATA_FILE), data)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        if sync:
+            _sync_barrier([os.path.join(parent, name, Directory.METADATA_FILE) for name, _, _ in staged])
+        return created
+
     def __fspath__(self) -> str:
         return self._root
 
@@ -34,23 +203,181 @@ class Directory(os.PathLike):
         """The name of this directory on disk"""
         return os.path.basename(self._root)
 
+    def read_only(self) -> bool:
+        """True if this directory can't be changed, eg: because it is archived."""
+        return False
+
+    def on_disk(self) -> bool:
+        """True if this is a real folder, which can be archived, watched or deduplicated."""
+        return True
+
+    def key(self) -> Hashable:
+        """Identifies this directory among the directories of every backend in the process."""
+        return os.path.abspath(self._root)
+
+    def disk_usage(self, refresh: bool = False) -> DiskUsage:
+        """The number and size of the files in this directory and below it, see UsageCache."""
+        return Directory.usage.usage(self._root, refresh)
+
+    def parent(self) -> "Directory":
+        """The directory this one is in, with the same writer."""
+        # the parent of an existing directory exists, so don't check again
+        return Directory._unchecked(os.path.dirname(self._root), self._writer)
+
+    def child_directories(self) -> List[str]:
+        """The names of the directories inside this one, leaving out files and hidden entries."""
+        with os.scandir(self._root) as entries:
+            return [
+                entry.name for entry in entries
+                if not entry.name.startswith(".") and entry.is_dir()
+            ]
+
+    def create_children(self, entries: Iterable[Tuple[str, Any]], sync: bool = False) -> List[bool]:
+        """Create many new directories inside this one, see create_many().
+
+        Inside a transaction, the directories are created one by one instead,
+        and their metadata is only saved when the transaction is committed.
+        """
+        transaction = self._writer.transaction
+        if transaction is None:
+            return Directory.create_many(self._root, entries, sync, self._writer.binary)
+
+        created = []
+        for name, metadata in entries:
+            path = os.path.join(self._root, name)
+            try:
+                os.mkdir(path)
+            except FileExistsError:
+                created.append(False)
+                continue
+            transaction.created(path)
+            transaction.write(os.path.join(path, Directory.METADATA_FILE), to_dict(metadata))
+            created.append(True)
+        return created
+
+    def children(self) -> List[str]:
+        """The names of the entries inside this directory, without its own metadata file.
+
+        Hidden entries hold the bookkeeping of bulk operations and are left out.
+        """
+        return [
+            entry for entry in os.listdir(self._root)
+            if entry != Directory.METADATA_FILE and not entry.startswith(".")
+        ]
+
     def load_metadata(self) -> dict:
-        """Loads the current metadata from this directory."""
+        """Loads the current metadata from this directory.
+
+        The parsed file is cached until it is changed on disk, see MetadataCache.
+        """
 
         metadata_file = os.path.join(self._root, Directory.METADATA_FILE)
-        with open(metadata_file, "r") as file:
-            return json.load(file)
+        transaction = self._writer.transaction
+        pending = transaction.pending(metadata_file) if transaction is not None else None
+        if pending is None:
+            pending = self._writer.pending(metadata_file)
+        if pending is not None:
+            return dict(pending)
+        self._version, data = Directory.cache.load_versioned(metadata_file)
+        return data
 
     def save_metadata(self, metadata: dict) -> None:
         """Saves the given metadata into the directory for later retrieval.
 
         metadata: A data class holding the metadata to save
+
+        The file is replaced atomically, so a crash can't leave it half written.
+        Depending on the writer of this directory it may be saved a little later.
+
+        If the writer checks versions, the file is only replaced if nobody
+        changed it since it was last loaded through this directory.
+
+        Raises:
+            FileNotFoundError: the directory no longer exists
+            VersionConflict: the writer checks versions and the file was changed
         """
 
         metadata_file = os.path.join(self._root, Directory.METADATA_FILE)
-        with open(metadata_file, "w+") as file:
-            json.dump(asdict(metadata), file)
+        if not os.path.isdir(self._root):
+            raise FileNotFoundError(self._root)
+
+        data = to_dict(metadata)
+        if self._writer.transaction is not None:
+            if self._writer.check_versions and self._version is not None \
+                    and version_of(metadata_file) != self._version:
+                raise VersionConflict(f"the metadata was changed since it was read: {metadata_file}")
+            # saved when the transaction is committed
+            self._writer.transaction.write(metadata_file, data)
+        elif self._writer.check_versions:
+            version = self._writer.write_checked(metadata_file, data, self._version)
+            self._version = Directory.cache.store(metadata_file, data, version)
+        elif self._writer.write(metadata_file, data):
+            self._version = Directory.cache.store(metadata_file, data)
+
+    def delete(self, trash: Optional[Trash] = None) -> None:
+        """Delete this directory and everything within it.
+
+        Args:
+            trash: If given, the directory is only moved into this trash, which
+                is instant, and removed later, see Trash. Backends which keep
+                nothing on disk free everything at once and ignore it. Inside
+                a transaction, it is held until the transaction is over and only
+                goes into the storage's trash on commit.
+        """
+        self._writer.discard(self._root)
+        transaction = self._writer.transaction
+        if transaction is not None:
+            # held aside, so the transaction can still bring it back
+            transaction.delete(self._root)
+        elif trash is not None:
+            trash.move(self._root)
+        else:
+            shutil.rmtree(self)
+
+
+def _sync_barrier(files: List[str]) -> None:
+    """Wait for the given files, and the folders they were renamed into, to reach the disk.
+
+    On Linux a single syncfs() of each file system the files are on flushes
+    the whole batch at once. Elsewhere each file and folder is flushed on its own.
+    """
+    # a new folder has to be flushed too, and so does the parent it was published in
+    folders = {os.path.dirname(path) for path in files}
+    folders.update([os.path.dirname(folder) for folder in folders])
+
+    syncfs = _syncfs()
+    if syncfs is not None:
+        devices = set()
+        for folder in folders:
+            try:
+                descriptor = os.open(folder, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                device = os.fstat(descriptor).st_dev
+                if device not in devices and syncfs(descriptor) == 0:
+                    devices.add(device)
+            finally:
+                os.close(descriptor)
+        if devices:
+            return
+
+    # folders can only be flushed where they can be opened like files
+    for path in [*files, *(folders if hasattr(os, "O_DIRECTORY") else ())]:
+        try:
+            descriptor = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
 
-    def delete(self) -> None:
-        """Delete this directory and everything within it."""
-        shutil.rmtree(self)
+@functools.lru_cache(maxsize=None)
+def _syncfs() -> Optional[Callable[[int], int]]:
+    """The syncfs() of the C library, or None where there is no such call."""
+    library = ctypes.util.find_library("c")
+    if library is None:
+        return None
+    return getattr(ctypes.CDLL(library, use_errno=True), "syncfs", None)
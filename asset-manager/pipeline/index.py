@@ -0,0 +1,127 @@
+import os
+import threading
+from typing import Dict, Hashable, List, Optional, Set
+
+from .directory import Directory
+
+
+class AssetIndex:
+    """A reverse index of the shots that use each asset name in a show.
+
+    There is a single index per show directory in the process, shared
+    by every Show, Shot and Asset instance which points at that show.
+    The index is built from disk the first time it is queried and is
+    then kept up to date by the create, rename and delete operations,
+    so looking up the shots of an asset doesn't touch the filesystem.
+
+    Changes made by other processes are not seen until rebuild() is called.
+    """
+
+    _indexes: Dict[str, "AssetIndex"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, show_path: str, show: Optional[Directory] = None) -> None:
+        self._show_path = show_path
+        self._show = show
+        self._shots: Optional[Dict[str, Set[str]]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_show(cls, show_path: os.PathLike) -> "AssetIndex":
+        """Get the shared index of the show in the given directory.
+
+        Args:
+            show_path: The Directory of the show, or its path on disk
+        """
+        key = _key(show_path)
+        with cls._registry_lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                show = show_path if isinstance(show_path, Directory) else None
+                index = cls._indexes[key] = AssetIndex(os.path.abspath(os.fspath(show_path)), show)
+            return index
+
+    @classmethod
+    def forget(cls, show_path: os.PathLike) -> None:
+        """Drop the index of a show, eg: because it no longer exists."""
+        with cls._registry_lock:
+            cls._indexes.pop(_key(show_path), None)
+
+    def shots(self, name: str) -> List[str]:
+        """Get the list of shots that contain an asset with the given name.
+
+        The order of the returned shots is undetermined.
+        """
+        with self._lock:
+            if self._shots is None:
+                self._shots = self._scan()
+            return list(self._shots.get(name, ()))
+
+    def add(self, shot: str, name: str) -> None:
+        """Record that the given shot contains an asset."""
+        with self._lock:
+            if self._shots is not None:
+                self._shots.setdefault(name, set()).add(shot)
+
+    def remove(self, shot: str, name: str) -> None:
+        """Record that the given shot no longer contains an asset."""
+        with self._lock:
+            if self._shots is not None:
+                self._discard(shot, name)
+
+    def rename(self, shot: str, old_name: str, new_name: str) -> None:
+        """Record that an asset of the given shot has changed its name."""
+        with self._lock:
+            if self._shots is not None:
+                self._discard(shot, old_name)
+                self._shots.setdefault(new_name, set()).add(shot)
+
+    def remove_shot(self, shot: str) -> None:
+        """Record that a shot and all of its assets are gone."""
+        with self._lock:
+            if self._shots is None:
+                return
+            for name in list(self._shots):
+                self._discard(shot, name)
+
+    def rebuild(self) -> None:
+        """Discard what is known and read the show again from disk."""
+        shots = self._scan()
+        with self._lock:
+            self._shots = shots
+
+    def _discard(self, shot: str, name: str) -> None:
+        shots = self._shots.get(name)
+        if shots is None:
+            return
+        shots.discard(shot)
+        if not shots:
+            del self._shots[name]
+
+    def _scan(self) -> Dict[str, Set[str]]:
+        shots: Dict[str, Set[str]] = {}
+        show = self._show
+        if show is None or show.on_disk():
+            if os.path.isdir(self._show_path):
+                with os.scandir(self._show_path) as show_entries:
+                    for shot in show_entries:
+                        if shot.name.startswith(".") or not shot.is_dir():
+                            continue
+                        with os.scandir(shot.path) as shot_entries:
+                            for asset in shot_entries:
+                                if not asset.name.startswith(".") and asset.is_dir():
+                                    shots.setdefault(asset.name, set()).add(shot.name)
+                return shots
+            # an archived show is listed from its archive instead
+            show = Directory.open(self._show_path)
+
+        for shot in show.child_directories():
+            for asset in show.child(shot).child_directories():
+                shots.setdefault(asset, set()).add(shot)
+        return shots
+
+
+def _key(show_path: os.PathLike) -> Hashable:
+    if isinstance(show_path, Directory):
+        return show_path.key()
+    return os.path.abspath(os.fspath(show_path))
@@ -0,0 +1,446 @@
+"""
+Instrumentation of the pipeline library.
+
+While at least one sink is enabled, every public method of Storage, Show,
+Shot, Asset and Directory is timed, and the bytes and system calls each
+call causes are counted. Each finished call is handed to the sinks as an
+OperationRecord. When no sink is enabled the original methods are put back
+in place, so there is no overhead at all.
+
+A sink enabled with instrument() only gets the calls made inside its with
+block, by the thread running it. Other threads using the library at the
+same time, like the purger or the watcher, are not recorded and only pay
+for a check that nothing is listening to them.
+
+    stats = pipeline.StatsSink()
+    with pipeline.instrument(stats):
+        storage.load_show("show").shots()
+    print(stats.report())
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class OperationRecord:
+    """One finished call of an instrumented method.
+
+    The counts of a call include those of every instrumented call it made,
+    but not the work it handed to other threads.
+
+        Attributes:
+            name (str): The name of the method, eg: "Show.shots".
+            seconds (float): How long the call took.
+            bytes_read (int): The bytes read from files (characters for text files).
+            bytes_written (int): The bytes written to files (characters for text files).
+            syscalls (dict): The number of each kind of system call, eg: {"stat": 2}.
+            error (str): The name of the exception raised by the call, if any.
+    """
+    name: str
+    seconds: float = 0.0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    syscalls: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class Histogram:
+    """A latency histogram with buckets that double in size from one microsecond."""
+
+    BUCKETS = 26
+
+    def __init__(self) -> None:
+        self.counts = [0] * (Histogram.BUCKETS + 1)
+
+    @staticmethod
+    def bounds() -> List[float]:
+        """The upper bound in seconds of each bucket, the last one has no bound."""
+        return [2 ** bucket / 1e6 for bucket in range(Histogram.BUCKETS)] + [float("inf")]
+
+    def add(self, seconds: float) -> None:
+        microseconds = int(seconds * 1e6)
+        self.counts[min(microseconds.bit_length(), Histogram.BUCKETS)] += 1
+
+    def percentile(self, percent: float) -> float:
+        """The upper bound of the bucket holding the given percentile, 0 if empty."""
+        total = sum(self.counts)
+        if not total:
+            return 0.0
+        seen = 0
+        for bound, count in zip(Histogram.bounds(), self.counts):
+            seen += count
+            if seen >= total * percent / 100:
+                return bound
+        return float("inf")
+
+
+@dataclass
+class OperationStats:
+    """The totals of every call of one method, kept by a StatsSink.
+
+        Attributes:
+            calls (int): The number of calls.
+            errors (int): The number of calls which raised an exception.
+            seconds (float): The total time spent in the calls.
+            bytes_read (int): The total bytes read.
+            bytes_written (int): The total bytes written.
+            syscalls (dict): The total number of each kind of system call.
+            histogram (Histogram): The distribution of the latency of the calls.
+    """
+    calls: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    syscalls: Dict[str, int] = field(default_factory=dict)
+    histogram: Histogram = field(default_factory=Histogram)
+
+    def mean(self) -> float:
+        """The mean time of a call in seconds."""
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+class StatsSink:
+    """A sink which keeps the totals of each method in memory."""
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record: OperationRecord) -> None:
+        with self._lock:
+            stats = self._stats.get(record.name)
+            if stats is None:
+                stats = self._stats[record.name] = OperationStats()
+            stats.calls += 1
+            stats.errors += record.error is not None
+            stats.seconds += record.seconds
+            stats.bytes_read += record.bytes_read
+            stats.bytes_written += record.bytes_written
+            for name, count in record.syscalls.items():
+                stats.syscalls[name] = stats.syscalls.get(name, 0) + count
+            stats.histogram.add(record.seconds)
+
+    def stats(self) -> Dict[str, OperationStats]:
+        """Get the totals of each method that was called, by method name."""
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._stats.clear()
+
+    def report(self) -> str:
+        """Format the totals as a table, slowest method first."""
+        lines = [f"{'operation':<28}{'calls':>8}{'total ms':>12}{'p50 ms':>10}{'p99 ms':>10}"
+                 f"{'read':>10}{'written':>10}{'syscalls':>10}"]
+        for name, stats in sorted(self.stats().items(), key=lambda item: -item[1].seconds):
+            lines.append(
+                f"{name:<28}{stats.calls:>8}{stats.seconds * 1e3:>12.2f}"
+                f"{stats.histogram.percentile(50) * 1e3:>10.3f}{stats.histogram.percentile(99) * 1e3:>10.3f}"
+                f"{stats.bytes_read:>10}{stats.bytes_written:>10}{sum(stats.syscalls.values()):>10}"
+            )
+        return "\n".join(lines)
+
+
+class LoggingSink:
+    """A sink which logs every call."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.DEBUG) -> None:
+        self._logger = logger or logging.getLogger("pipeline")
+        self._level = level
+
+    def __call__(self, record: OperationRecord) -> None:
+        self._logger.log(
+            self._level, "%s took %.3fms, read %d bytes, wrote %d bytes, %d syscalls%s",
+            record.name, record.seconds * 1e3, record.bytes_read, record.bytes_written,
+            sum(record.syscalls.values()), f", raised {record.error}" if record.error else "",
+        )
+
+
+Sink = Callable[[OperationRecord], None]
+
+_sinks: List[Sink] = []
+_lock = threading.Lock()
+_current: contextvars.ContextVar[Optional["_Call"]] = contextvars.ContextVar("pipeline_call", default=None)
+# the sinks of the instrument() blocks the current thread is in
+_scoped: contextvars.ContextVar[Tuple[Sink, ...]] = contextvars.ContextVar("pipeline_sinks", default=())
+_originals: List[tuple] = []
+# the enabled sinks and open instrument() blocks, the library is patched while there are any
+_users = 0
+
+
+def enable(sink: Sink) -> None:
+    """Start sending a record of each call, from every thread, to the given sink.
+
+    Args:
+        sink: A StatsSink, LoggingSink or any function taking an OperationRecord
+    """
+    with _lock:
+        _sinks.append(sink)
+        _acquire()
+
+
+def disable(sink: Optional[Sink] = None) -> None:
+    """Stop sending records to a sink, or to every sink if none is given."""
+    with _lock:
+        removed = list(_sinks) if sink is None else [sink] if sink in _sinks else []
+        for each in removed:
+            _sinks.remove(each)
+            _release()
+
+
+@contextlib.contextmanager
+def instrument(sink: Sink) -> Iterator[Sink]:
+    """Send a record of each call made within a with block, by the thread running it, to the given sink."""
+    with _lock:
+        _acquire()
+    token = _scoped.set(_scoped.get() + (sink,))
+    try:
+        yield sink
+    finally:
+        _scoped.reset(token)
+        with _lock:
+            _release()
+
+
+def _acquire() -> None:
+    global _users
+    if _users == 0:
+        _patch()
+    _users += 1
+
+
+def _release() -> None:
+    global _users
+    _users -= 1
+    if _users == 0:
+        _unpatch()
+
+
+def _listening() -> bool:
+    """True if a call made right now would be recorded."""
+    return bool(_sinks) or bool(_scoped.get())
+
+
+def count_bytes(read: int = 0, written: int = 0) -> None:
+    """Add bytes moved outside of a file opened by the library to the current call."""
+    call = _current.get()
+    if call is not None:
+        call.record.bytes_read += read
+        call.record.bytes_written += written
+
+
+class _Call:
+    """An instrumented call which is still running."""
+
+    __slots__ = ("record", "parent", "scoped")
+
+    def __init__(self, name: str) -> None:
+        self.record = OperationRecord(name)
+        self.parent = _current.get()
+        # a generator may finish outside of the block it was started in
+        self.scoped = _scoped.get()
+
+    def finish(self, seconds: float) -> None:
+        record = self.record
+        record.seconds += seconds
+        if self.parent is not None:
+            parent = self.parent.record
+            parent.bytes_read += record.bytes_read
+            parent.bytes_written += record.bytes_written
+            for name, count in record.syscalls.items():
+                parent.syscalls[name] = parent.syscalls.get(name, 0) + count
+        for sink in list(_sinks) + [sink for sink in self.scoped if sink not in _sinks]:
+            sink(record)
+
+
+def _traced(name: str, func: Callable) -> Callable:
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator(*args, **kwargs):
+            if not _listening():
+                return func(*args, **kwargs)
+            return _traced_generator(name, func(*args, **kwargs))
+        return generator
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _listening():
+            return func(*args, **kwargs)
+        call = _Call(name)
+        token = _current.set(call)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BaseException as error:
+            call.record.error = type(error).__name__
+            raise
+        finally:
+            _current.reset(token)
+            call.finish(time.perf_counter() - start)
+    return wrapper
+
+
+def _traced_generator(name: str, generator: Iterator) -> Iterator:
+    # only the time spent inside the generator is counted, not the
+    # time the caller spends on each item in between
+    call = _Call(name)
+    seconds = 0.0
+    try:
+        while True:
+            token = _current.set(call)
+            start = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            except BaseException as error:
+                call.record.error = type(error).__name__
+                raise
+            finally:
+                seconds += time.perf_counter() - start
+                _current.reset(token)
+            yield item
+    finally:
+        generator.close()
+        call.finish(seconds)
+
+
+def _counted(name: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = _current.get()
+        if call is not None:
+            call.record.syscalls[name] = call.record.syscalls.get(name, 0) + 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+class _CountingModule:
+    """Stands in for a module like os, counting the calls to some of its functions."""
+
+    def __init__(self, module: Any, counted: Dict[str, str], **attributes) -> None:
+        self._module = module
+        for name, syscall in counted.items():
+            setattr(self, name, _counted(syscall, getattr(module, name)))
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._module, name)
+
+
+class _CountingFile:
+    """Wraps a file opened by the library, counting the data read and written."""
+
+    def __init__(self, file: Any, call: Optional[_Call]) -> None:
+        self._file = file
+        self._call = call
+
+    def __enter__(self) -> "_CountingFile":
+        self._file.__enter__()
+        return self
+
+    def __exit__(self, *args) -> Any:
+        return self._file.__exit__(*args)
+
+    def __iter__(self) -> Iterator:
+        for line in self._file:
+            self._add(len(line), 0)
+            yield line
+
+    def read(self, *args) -> Any:
+        data = self._file.read(*args)
+        self._add(len(data), 0)
+        return data
+
+    def readline(self, *args) -> Any:
+        data = self._file.readline(*args)
+        self._add(len(data), 0)
+        return data
+
+    def write(self, data: Any) -> int:
+        self._add(0, len(data))
+        return self._file.write(data)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+    def _add(self, read: int, written: int) -> None:
+        if self._call is not None:
+            self._call.record.bytes_read += read
+            self._call.record.bytes_written += written
+
+
+def _open(*args, **kwargs) -> _CountingFile:
+    call = _current.get()
+    if call is not None:
+        call.record.syscalls["open"] = call.record.syscalls.get("open", 0) + 1
+    return _CountingFile(open(*args, **kwargs), call)
+
+
+def _counting_os() -> _CountingModule:
+    names = ["stat", "lstat", "scandir", "listdir", "mkdir", "makedirs", "rmdir", "remove",
+             "unlink", "rename", "replace", "open", "close", "fsync", "sync"]
+    path = _CountingModule(os.path, {name: "stat" for name in ["exists", "isdir", "isfile", "getsize"]})
+    return _CountingModule(os, {name: name for name in names if hasattr(os, name)}, path=path)
+
+
+def _patch() -> None:
+    from .asset import Asset
+    from .directory import Directory
+    from .shot import Shot
+    from .show import Show
+    from .storage import Storage
+
+    for cls in (Storage, Show, Shot, Asset, Directory):
+        for name, attribute in list(vars(cls).items()):
+            if name.startswith("_"):
+                continue
+            if isinstance(attribute, (staticmethod, classmethod)):
+                wrapped = type(attribute)(_traced(f"{cls.__name__}.{name}", attribute.__func__))
+            elif inspect.isfunction(attribute):
+                wrapped = _traced(f"{cls.__name__}.{name}", attribute)
+            else:
+                continue
+            _originals.append((cls, name, attribute))
+            setattr(cls, name, wrapped)
+
+    # system calls are only counted when the library makes them, so
+    # the os module of the rest of the program is left alone
+    counting_os = _counting_os()
+    for module in _modules():
+        if getattr(module, "os", None) is os:
+            _originals.append((module, "os", os))
+            module.os = counting_os
+        _originals.append((module, "open", None))
+        module.open = _open
+
+
+def _unpatch() -> None:
+    while _originals:
+        target, name, original = _originals.pop()
+        if original is None:
+            delattr(target, name)
+        else:
+            setattr(target, name, original)
+
+
+def _modules() -> List[Any]:
+    prefix = __package__ + "."
+    return [
+        module for name, module in list(sys.modules.items())
+        if name.startswith(prefix) and module is not None and module is not sys.modules[__name__]
+    ]
@@ -0,0 +1,303 @@
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from .directory import _sync_barrier
+from .trash import Trash
+from .writer import MetadataWriter, _write_atomic
+
+JOURNAL_FILE = ".journal"
+"""The hidden file under the storage root which holds the open transaction."""
+
+HELD_FOLDER = ".held"
+"""The hidden folder under the storage root where deleted directories wait until their transaction is over."""
+
+CREATE = "create"
+RENAME = "rename"
+DELETE = "delete"
+COMMIT = "commit"
+
+
+class Transaction:
+    """A set of changes to shows, shots and assets which happen all together or not at all.
+
+    While a transaction is open, metadata is not written but buffered,
+    and reads of it see the buffered data. Directories are still created,
+    renamed and deleted right away, since each of those is a single
+    rename, but every one of them is first recorded in the journal so
+    it can be undone. Deleted directories are held aside meanwhile, out
+of reach of the purger, and only go into the trash on commit.
+
+    On commit the buffered metadata is recorded in the journal, which is
+    flushed to the disk once. Only then are the files written, without
+    waiting on each of them, and a single barrier waits for them all
+    before the journal is removed.
+
+    If the process dies before the commit is recorded, the next Storage
+    opened on the same root undoes every recorded change. If it dies
+    after, the metadata is written again from the journal. See recover().
+
+    Every change made through the storage while its transaction is open,
+    from any thread, is part of it. The journal stays locked while it is,
+    so no other process mistakes it for one left behind.
+    """
+
+    def __init__(self, root: str, writer: MetadataWriter) -> None:
+        """Start a new transaction, creating its journal.
+
+        Args:
+            root: The root of the pipeline storage
+            writer: The writer of the storage, which commits the metadata
+
+        Raises:
+            RuntimeError: if another transaction is open on the same root,
+                or one was left behind and was not recovered
+        """
+        self._root = os.path.abspath(root)
+        self._writer = writer
+        self._path = os.path.join(self._root, JOURNAL_FILE)
+        self._lock = threading.RLock()
+        self._writes: Dict[str, dict] = {}
+        self._records: List[dict] = []
+        self._file = _create_journal(self._path)
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def write(self, path: str, data: dict) -> None:
+        """Buffer the metadata to write into a file on commit."""
+        with self._lock:
+            self._writes[path] = data
+
+    def pending(self, path: str) -> Optional[dict]:
+        """The metadata buffered for a file, if any."""
+        with self._lock:
+            return self._writes.get(path)
+
+    def created(self, path: str) -> None:
+        """Record that a directory was created."""
+        self._record({"op": CREATE, "path": self._relative(path)})
+
+    def renaming(self, path: str, new_path: str) -> None:
+        """Record that a directory is about to be renamed, before it is."""
+        self._record({"op": RENAME, "path": self._relative(path), "to": self._relative(new_path)})
+
+    def renamed(self, path: str, new_path: str) -> None:
+        """Follow a renamed directory with the metadata buffered inside it."""
+        prefix = os.path.join(path, "")
+        with self._lock:
+            for old in [old for old in self._writes if old.startswith(prefix)]:
+                self._writes[os.path.join(new_path, old[len(prefix):])] = self._writes.pop(old)
+
+    def delete(self, path: str) -> None:
+        """Delete a directory by holding it aside until the transaction is over.
+
+        Raises:
+            OSError: if the directory can't be moved in one rename, eg: it is
+                on another file system, in which case it is left in place
+        """
+        id = Trash.new_id()
+        self._record({"op": DELETE, "path": self._relative(path), "trash": id})
+        prefix = os.path.join(path, "")
+        with self._lock:
+            for old in [old for old in self._writes if old.startswith(prefix)]:
+                del self._writes[old]
+        os.makedirs(os.path.join(self._root, HELD_FOLDER), exist_ok=True)
+        os.rename(path, _held(self._root, id))
+
+    def commit(self) -> None:
+        """Make every change of the transaction permanent."""
+        with self._lock:
+            writes = [(self._relative(path), data) for path, data in self._writes.items()]
+            # this is the single point after which the transaction happened
+            self._file.write(json.dumps({"op": COMMIT, "writes": writes}) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+            _apply(self._root, writes, self._writer.binary)
+            _sync_barrier([os.path.join(self._root, path) for path, _ in writes])
+            _release(self._root, self._records)
+            os.remove(self._path)
+
+    def rollback(self) -> None:
+        """Undo every change of the transaction.
+
+        Raises:
+            FileNotFoundError: if directories deleted in the transaction are
+                gone and could not be brought back, once everything else is undone
+        """
+        with self._lock:
+            self._file.close()
+            self._writes.clear()
+            missing = _undo(self._root, self._records)
+            os.remove(self._path)
+            _check_restored(missing)
+
+    def changed(self) -> List[str]:
+        """The paths of the directories which were changed, relative to the root."""
+        with self._lock:
+            return [record["path"] for record in self._records]
+
+    def _record(self, record: dict) -> None:
+        # each record only needs to survive the process dying, not the whole
+        # machine, as an unrecorded change is never more than a single rename
+        with self._lock:
+            self._records.append(record)
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self._root)
+
+
+def _create_journal(path: str) -> TextIO:
+    """Create the journal of a new transaction, locked.
+
+    Raises:
+        RuntimeError: if the journal exists already
+    """
+    import fcntl
+
+    # the journal is locked before it appears, so it is never seen unlocked while in use
+    temporary = f"{path}.{Trash.new_id()}"
+    file = open(temporary, "w")
+    fcntl.flock(file, fcntl.LOCK_EX)
+    try:
+        os.link(temporary, path)
+        return file
+    except FileExistsError:
+        file.close()
+        raise RuntimeError(f"a transaction is already open: {path}") from None
+    except OSError:
+        # the file system has no hard links
+        file.close()
+    finally:
+        os.remove(temporary)
+
+    while True:
+        try:
+            descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            raise RuntimeError(f"a transaction is already open: {path}") from None
+        file = os.fdopen(descriptor, "w")
+        fcntl.flock(file, fcntl.LOCK_EX)
+        # it is unlocked for a moment, in which another process can take it
+        # for one left behind and remove it, so make sure it is still ours
+        try:
+            if os.path.samestat(os.fstat(descriptor), os.stat(path)):
+                return file
+        except FileNotFoundError:
+            pass
+        file.close()
+
+
+def recover(root: str, writer: MetadataWriter) -> bool:
+    """Finish or undo a transaction which was left open by a process that died.
+
+    A transaction which was committed has its metadata written again,
+    anything else is undone. A transaction which is still open in another
+    process is left alone.
+
+    Returns:
+        True if there was a transaction to recover
+
+    Raises:
+        FileNotFoundError: if directories deleted in the transaction are
+            gone and could not be brought back, once everything else is undone
+    """
+    import fcntl
+
+    path = os.path.join(os.path.abspath(root), JOURNAL_FILE)
+    try:
+        file = open(path, "r")
+    except FileNotFoundError:
+        return False
+    with file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        lines = file.read().splitlines()
+        if not os.path.exists(path):
+            # recovered by someone else while we waited
+            return False
+        missing = _recover(root, lines, writer)
+        os.remove(path)
+    _check_restored(missing)
+    return True
+
+
+def _recover(root: str, lines: List[str], writer: MetadataWriter) -> List[str]:
+
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # the last record was cut short, so it never happened
+            break
+
+    if records and records[-1]["op"] == COMMIT:
+        writes = [(relative, data) for relative, data in records[-1]["writes"]]
+        _apply(root, writes, writer.binary)
+        _sync_barrier([os.path.join(root, relative) for relative, _ in writes])
+        _release(root, records)
+        return []
+    return _undo(root, records)
+
+
+def _apply(root: str, writes: List[Tuple[str, dict]], binary: bool) -> None:
+    for relative, data in writes:
+        path = os.path.join(root, relative)
+        if os.path.isdir(os.path.dirname(path)):
+            _write_atomic(path, data, False, binary)
+
+
+def _held(root: str, id: str) -> str:
+    return os.path.join(root, HELD_FOLDER, id)
+
+
+def _release(root: str, records: List[dict]) -> None:
+    """Move the directories held aside by a committed transaction into the trash."""
+    trash = Trash.for_root(root)
+    for record in records:
+        held = _held(root, record["trash"]) if record["op"] == DELETE else None
+        # it was released already, if we died after that
+        if held is not None and os.path.exists(held):
+            trash.move(held, record["trash"], origin=record["path"])
+
+
+def _undo(root: str, records: List[dict]) -> List[str]:
+    """Undo the recorded changes, the last one first.
+
+    Returns:
+        The paths of the deleted directories which could not be brought back
+    """
+    missing = []
+    for record in reversed(records):
+        path = os.path.join(root, record["path"])
+        if record["op"] == CREATE:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+        elif record["op"] == RENAME:
+            new_path = os.path.join(root, record["to"])
+            # it may never have been renamed, if we died right before
+            if os.path.exists(new_path) and not os.path.exists(path):
+                os.rename(new_path, path)
+        elif record["op"] == DELETE:
+            held = _held(root, record["trash"])
+            if os.path.exists(held):
+                os.rename(held, path)
+            elif not os.path.exists(path):
+                missing.append(record["path"])
+            # else it was never moved, if we died right before
+    return missing
+
+
+def _check_restored(missing: List[str]) -> None:
+    if missing:
+        raise FileNotFoundError(f"deleted directories could not be restored: {', '.join(missing)}")
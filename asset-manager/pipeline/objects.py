@@ -0,0 +1,327 @@
+import hashlib
+import os
+import shutil
+import stat
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+
+from .directory import Directory
+
+
+OBJECTS_FOLDER = ".objects"
+"""The hidden folder under the storage root which holds the shared files."""
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# the linux ioctl which makes a copy-on-write clone of a file
+FICLONE = 0x40049409
+
+# the extended attribute which remembers the digest of a cloned file
+DIGEST_XATTR = "user.pipeline.sha256"
+
+
+@dataclass(frozen=True)
+class DedupeStats:
+    """A dataclass describing a finished deduplication pass.
+
+        Attributes:
+            files (int): The number of files looked at.
+            hashed (int): The number of files which had to be hashed.
+            linked (int): The number of files replaced by a link to a shared copy.
+            bytes_saved (int): The disk space freed by the files which were linked.
+            skipped (int): The number of files which changed while they were
+                being hashed, or which could not be linked, eg: across file systems.
+            seconds (float): The time it took.
+    """
+    files: int
+    hashed: int
+    linked: int
+    bytes_saved: int
+    skipped: int
+    seconds: float
+
+
+class ObjectStore:
+    """A content-addressed store of files shared between assets.
+
+    Each distinct file content is kept once under the .objects folder of
+    the storage, named after its sha256 digest. Identical files in assets
+    are replaced by hard links to it, or copy-on-write clones with reflink,
+    so they only use the disk space of one copy.
+
+    Hard linked files share their data, so they are made read-only: tools
+    must save a new file over them, as the metadata writer does, rather
+    than editing them in place, which would change every shot at once.
+    Clones don't share anything once written, so they are left writable.
+    They keep their own inodes, so each one remembers its digest along with
+    its modification time and size in an extended attribute instead.
+    """
+
+    def __init__(self, root: str, reflink: bool = False) -> None:
+        """Open (or create) the object store of a storage root.
+
+        Args:
+            root: The root of the pipeline storage
+            reflink: If set to True, files are shared as copy-on-write clones
+                instead of hard links. This needs a file system which supports
+                them, like btrfs or xfs.
+        """
+        self._root = os.path.abspath(root)
+        self._path = os.path.join(self._root, OBJECTS_FOLDER)
+        self._reflink = reflink
+        os.makedirs(self._path, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        """The path of the shared copy of the file with the given digest."""
+        return os.path.join(self._path, digest[:2], digest[2:])
+
+    def digests(self) -> Dict[Tuple[int, int], str]:
+        """Get the digest of every shared file by its (device, inode)."""
+        found = {}
+        with os.scandir(self._path) as folders:
+            for folder in folders:
+                if not folder.is_dir():
+                    continue
+                with os.scandir(folder.path) as entries:
+                    for entry in entries:
+                        if not entry.name.startswith("."):
+                            info = entry.stat()
+                            found[(info.st_dev, info.st_ino)] = folder.name + entry.name
+        return found
+
+    def add(self, path: str, digest: Optional[str] = None) -> str:
+        """Share a file through the store, replacing it with a link to the shared copy.
+
+        Args:
+            path: The file to share
+            digest: The sha256 digest of the file, if it is already known
+
+        Returns:
+            The digest of the file
+        """
+        digest = digest or hash_file(path)
+        shared = self.path(digest)
+        if not os.path.exists(shared):
+            os.makedirs(os.path.dirname(shared), exist_ok=True)
+            self._share(path, shared)
+        else:
+            self._link(shared, path)
+        self._remember(path, digest)
+        return digest
+
+    def copy(self, source: str, destination: str) -> str:
+        """Copy a file into an asset through the store.
+
+        If the store already has the same content, nothing is copied at all.
+
+        Returns:
+            The digest of the file
+        """
+        digest = hash_file(source)
+        shared = self.path(digest)
+        if not os.path.exists(shared):
+            os.makedirs(os.path.dirname(shared), exist_ok=True)
+            temporary = _temporary(shared)
+            shutil.copyfile(source, temporary)
+            self._seal(temporary)
+            os.replace(temporary, shared)
+        self._link(shared, destination)
+        self._remember(destination, digest)
+        return digest
+
+    def collect(self) -> int:
+        """Remove the shared files which are no longer used by any asset.
+
+        Only hard linked files can be told apart this way, as clones
+        don't keep track of each other.
+
+        Returns:
+            The number of bytes freed
+        """
+        if self._reflink:
+            return 0
+        freed = 0
+        for digest in self.digests().values():
+            shared = self.path(digest)
+            info = os.stat(shared)
+            if info.st_nlink == 1:
+                os.remove(shared)
+                freed += info.st_size
+        return freed
+
+    def _share(self, path: str, shared: str) -> None:
+        """Make the given file the shared copy of its content."""
+        if self._reflink:
+            temporary = _temporary(shared)
+            _clone(path, temporary)
+            os.replace(temporary, shared)
+        else:
+            try:
+                os.link(path, shared)
+            except FileExistsError:
+                # someone else shared the same content in the meantime
+                self._link(shared, path)
+                return
+            self._seal(shared)
+
+    def _link(self, shared: str, path: str) -> None:
+        """Replace a file with a link to the shared copy in one rename."""
+        temporary = _temporary(path)
+        try:
+            if self._reflink:
+                _clone(shared, temporary)
+            else:
+                os.link(shared, temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.lexists(temporary):
+                os.remove(temporary)
+            raise
+
+    def _remember(self, path: str, digest: str) -> None:
+        """Keep the digest of a clone, which its inode can't tell."""
+        if self._reflink:
+            _set_digest(path, digest)
+
+    def _seal(self, path: str) -> None:
+        if not self._reflink:
+            mode = os.stat(path).st_mode
+            os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def hash_file(path: str) -> str:
+    """The sha256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dedupe(root: str, store: ObjectStore, min_size: int = 64 * 1024, workers: Optional[int] = None) -> DedupeStats:
+    """Share every identical file in the assets of a storage through its object store.
+
+    Files which are already shared are recognised without hashing them
+    again: links by their inode and clones by the digest they remember,
+    as long as their modification time and size are unchanged. Where the
+    file system has no extended attributes, clones are always hashed. The
+    others are hashed in parallel, hashlib releases the GIL on large reads,
+    and then linked to the shared copy one by one.
+
+    Args:
+        root: The root of the pipeline storage
+        store: The object store to share the files through
+        min_size: Files smaller than this many bytes are left alone
+        workers: The number of hashing threads, defaults to the number of cpus
+    """
+    started = time.perf_counter()
+    known = store.digests()
+    candidates = []
+    files = 0
+    for path, info in _asset_files(root):
+        files += 1
+        if info.st_size >= min_size and (info.st_dev, info.st_ino) not in known and \
+                not (store._reflink and _remembered(path, info) is not None):
+            candidates.append((path, info))
+
+    def hashed(candidate):
+        path, info = candidate
+        try:
+            return path, info, hash_file(path)
+        except OSError:
+            return path, info, None
+
+    linked = bytes_saved = skipped = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for path, info, digest in executor.map(hashed, candidates):
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if digest is None or current is None or \
+                    (current.st_mtime_ns, current.st_size) != (info.st_mtime_ns, info.st_size):
+                # it was changed while we were reading it
+                skipped += 1
+                continue
+
+            shared_before = os.path.exists(store.path(digest))
+            try:
+                store.add(path, digest)
+            except OSError:
+                skipped += 1
+                continue
+            if shared_before:
+                linked += 1
+                bytes_saved += info.st_size
+
+    return DedupeStats(
+        files=files,
+        hashed=len(candidates),
+        linked=linked,
+        bytes_saved=bytes_saved,
+        skipped=skipped,
+        seconds=time.perf_counter() - started,
+    )
+
+
+def _asset_files(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yield every payload file in the assets below root, with its stat."""
+    def files(path: str, depth: int) -> Iterator[Tuple[str, os.stat_result]]:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from files(entry.path, depth + 1)
+                elif depth >= 3 and entry.is_file(follow_symlinks=False) and \
+                        not (depth == 3 and entry.name == Directory.METADATA_FILE):
+                    yield entry.path, entry.stat(follow_symlinks=False)
+
+    yield from files(root, 0)
+
+
+def _set_digest(path: str, digest: str) -> None:
+    """Remember the digest of a file in an extended attribute, if the file system has them."""
+    try:
+        info = os.stat(path)
+        os.setxattr(path, DIGEST_XATTR, f"{digest} {info.st_mtime_ns} {info.st_size}".encode())
+    except (AttributeError, OSError):
+        pass
+
+
+def _remembered(path: str, info: os.stat_result) -> Optional[str]:
+    """The digest remembered for a file, unless it changed since."""
+    try:
+        digest, mtime_ns, size = os.getxattr(path, DIGEST_XATTR).decode().split()
+    except (AttributeError, OSError, ValueError):
+        return None
+    if (int(mtime_ns), int(size)) != (info.st_mtime_ns, info.st_size):
+        return None
+    return digest
+
+
+def _temporary(path: str) -> str:
+    """A hidden name next to the given file, which listings and digests() skip."""
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.{uuid.uuid4().hex}.tmp")
+
+
+def _clone(source: str, destination: str) -> None:
+    """Make a copy-on-write clone of a file.
+
+    Raises:
+        OSError: if the file system can't clone files
+    """
+    import fcntl
+
+    with open(source, "rb") as source_file, open(destination, "xb") as destination_file:
+        try:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            destination_file.close()
+            os.remove(destination)
+            raise
+    shutil.copystat(source, destination)
@@ -0,0 +1,84 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, NamedTuple, Optional, Set, Union
+
+from .directory import Directory
+
+
+class AssetMatch(NamedTuple):
+    """An asset found by a show or storage wide query.
+
+        Attributes:
+            show (str): The name of the show the asset is in.
+            shot (str): The name of the shot the asset is in.
+            asset (str): The name of the asset.
+            category (str): The category of the asset.
+    """
+    show: str
+    shot: str
+    asset: str
+    category: str
+
+
+def categories_of(category: Union[None, str, Iterable[str]]) -> Optional[Set[str]]:
+    """Turn a category argument into a set of categories, None matches them all."""
+    if category is None:
+        return None
+    if isinstance(category, str):
+        return {category}
+    return set(category)
+
+
+def find_assets(shows: Iterable[Directory], categories: Optional[Set[str]],
+                workers: Optional[int] = None) -> Iterator[AssetMatch]:
+    """Find the assets with any of the given categories in some shows.
+
+    The metadata files are read by a pool of threads, since on network
+    storage the time goes to waiting on each read rather than parsing it.
+    Matches are yielded as soon as they are read, in no particular order.
+
+    Args:
+        shows: The directories of the shows to search
+        categories: The categories to look for, None matches every asset
+        workers: The number of reading threads, defaults to 4 per cpu.
+    """
+    workers = workers or 4 * (os.cpu_count() or 1)
+
+    def read(show: str, shot: str, directory: Directory) -> Optional[AssetMatch]:
+        try:
+            category = directory.load_metadata().get("category", "")
+        except FileNotFoundError:
+            # assets that were never opened don't have metadata yet
+            category = ""
+        if categories is None or category in categories:
+            return AssetMatch(show, shot, directory.name(), category)
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for show in shows:
+            for shot in _subdirectories(show):
+                for asset in _subdirectories(shot):
+                    pending.add(executor.submit(read, show.name(), shot.name(), asset))
+
+                    # only keep a bounded number of reads in flight, and
+                    # hand out whatever has finished while we wait
+                    if len(pending) >= workers * 4:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from _matches(done)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from _matches(done)
+
+
+def _matches(done) -> Iterator[AssetMatch]:
+    for future in done:
+        match = future.result()
+        if match is not None:
+            yield match
+
+
+def _subdirectories(directory: Directory) -> Iterator[Directory]:
+    for name in directory.child_directories():
+        yield directory.child(name)
@@ -0,0 +1,112 @@
+import re
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# words are runs of letters and digits, so "hero_car" is found by "car" too
+_WORD = re.compile(r"[^\W_]+")
+
+# terms shorter than a trigram only match the start of words
+PREFIX_MARK = "^"
+
+
+class SearchMatch(NamedTuple):
+    """A show, shot or asset found by Storage.search(), best matches first.
+
+        Attributes:
+            show (str): The name of the show.
+            shot (str): The name of the shot, or None for a show.
+            asset (str): The name of the asset, or None for a show or shot.
+            category (str): The category of an asset, or an empty string.
+            score (float): How well it matched, higher is better.
+    """
+    show: str
+    shot: Optional[str]
+    asset: Optional[str]
+    category: str
+    score: float
+
+
+def terms_of(text: str) -> List[str]:
+    """Split a query, name or description into lowercase words."""
+    return _WORD.findall(text.lower())
+
+
+def tokens_of(name: str, description: str) -> Set[str]:
+    """The tokens an entity is indexed under: the trigrams of its words and their first letters."""
+    tokens = set()
+    for word in terms_of(name + " " + description):
+        tokens.add(PREFIX_MARK + word[:1])
+        tokens.add(PREFIX_MARK + word[:2])
+        tokens.update(word[index:index + 3] for index in range(len(word) - 2))
+    return tokens
+
+
+def query_tokens(terms: Iterable[str]) -> Set[str]:
+    """The tokens an entity must have to possibly match every term.
+
+    This narrows the search down to a few candidates, which score()
+    then checks, since a word can have every trigram of a term without
+    holding the term itself.
+    """
+    tokens = set()
+    for term in terms:
+        if len(term) < 3:
+            tokens.add(PREFIX_MARK + term)
+        else:
+            tokens.update(term[index:index + 3] for index in range(len(term) - 2))
+    return tokens
+
+
+def score(terms: List[str], name: str, description: str) -> float:
+    """Rank an entity against the terms of a query.
+
+    Matching the name counts for more than matching the description, and
+    whole words for more than their start, which counts for more than
+    anything in between.
+
+    Returns:
+        0 if any term does not match, otherwise higher for better matches
+    """
+    name_words = terms_of(name)
+    description_words = terms_of(description)
+    total = 0.0
+    for term in terms:
+        best = max(_word_score(term, name_words) * 4, _word_score(term, description_words))
+        if not best:
+            return 0.0
+        total += best
+    if " ".join(terms) == " ".join(name_words):
+        total += 10
+    # prefer short names, which the query covers more of
+    return total + 1 / (1 + len(name))
+
+
+def rank(terms: List[str], entities: Iterable[Tuple[str, str, str, str]], limit: int) -> List[SearchMatch]:
+    """Score entities and keep the best ones.
+
+    Args:
+        terms: The words of the query, see terms_of()
+        entities: (path, name, category, description) of each entity, the
+            path being its names from the storage root joined by "/"
+        limit: The most matches to return
+    """
+    matches = []
+    for path, name, category, description in entities:
+        value = score(terms, name, description)
+        if value:
+            names = path.split("/")
+            names += [None] * (3 - len(names))
+            matches.append(SearchMatch(names[0], names[1], names[2], category, value))
+    matches.sort(key=lambda match: (-match.score, [name or "" for name in match[:3]]))
+    return matches[:limit]
+
+
+def _word_score(term: str, words: List[str]) -> float:
+    best = 0.0
+    for word in words:
+        if word == term:
+            return 3.0
+        if word.startswith(term):
+            best = max(best, 2.0)
+        elif len(term) >= 3 and term in word:
+            best = max(best, 1.0)
+    return best
@@ -1,11 +1,16 @@
-from dataclasses import dataclass, asdict
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 import os
 import json
-import shutil
+from threading import Event
 
+from .archive import ArchiveStats, make_archive, make_incremental_archive
+from .catalog import Catalog
 from .directory import Directory
-from .asset import Asset
+from .index import AssetIndex
+from .trash import Trash
+from .usage import DiskUsage
+from .asset import Asset, AssetMetadata
 
 
 @dataclass(frozen=True)
@@ -26,40 +31,70 @@ class Shot:
         Attributes:
             _directory (Directory): The directory where the shot is located.
             _metadata (ShotMetadata): The metadata of the shot.
+            _catalog (Catalog): The optional catalog kept up to date with this shot.
+            _trash (Trash): The optional trash of the storage this shot is in.
     """
-    def __init__(self, directory: Directory) -> None:
+    def __init__(self, directory: Directory, catalog: Optional[Catalog] = None, lazy: bool = False,
+                 trash: Optional[Trash] = None) -> None:
         """Open a shot in the given directory.
         
         This will load any existing metadata or save the default as needed.
+
+        Args:
+            directory: The directory where the shot is located.
+            catalog: If given, listings are answered by this catalog and
+                any changes to the shot are recorded in it.
+            lazy: If set to True, no metadata is read or written until it is first needed.
+                Assets loaded from this shot are lazy as well.
+            trash: If given, the shot and its assets are moved into this trash
+                when deleted, see Trash. Otherwise they are removed right away.
         """
         self._directory = directory
+        # archived entities are read from their archive, not the catalog
+        self._catalog = None if directory.read_only() else catalog
+        self._lazy = lazy
+        self._trash = trash
 
+        self._metadata: Optional[ShotMetadata] = None
+        if not lazy:
+            self._metadata = self._load_metadata()
+
+    def _load_metadata(self) -> ShotMetadata:
+        """Read the metadata of this shot, saving the default if there is none yet."""
         try:
-            metadata = ShotMetadata(**directory.load_metadata())
+            return ShotMetadata(**self._directory.load_metadata())
         except FileNotFoundError:
-            # the directory is created, but if this is a new show, it
+            # the directory is created, but if this is a new shot, it
             # might not have any metadata yet, so we can instead save
             # a default file
-            metadata = ShotMetadata(name=directory.name())
-            directory.save_metadata(metadata)
-
-        self._metadata = metadata
+            metadata = ShotMetadata(name=self._directory.name())
+            self._directory.save_metadata(metadata)
+            if self._catalog is not None:
+                self._catalog.add(self._directory, metadata)
+            return metadata
+
+    def _current_metadata(self) -> ShotMetadata:
+        """The metadata of this shot, loading it first in lazy mode."""
+        if self._metadata is None:
+            self._metadata = self._load_metadata()
+        return self._metadata
 
     def metadata(self) -> ShotMetadata:
         """Returns the available metadata for this shot."""
-        # we want to copy this metadata into a new instance
-        # because editing it should not change this class unless
-        # update_metadat is called specifically
-        return ShotMetadata(**asdict(self._metadata))
+        # the metadata is frozen, so it can be handed out as it is
+        # without any risk of the caller changing it behind our back
+        return self._current_metadata()
 
     def update_metadata(self, metadata: ShotMetadata) -> None:
         """Modify the metadata for this shot."""
         # call save_metadata first in case it fails we don't want this
         # class to have bad data on it.
         self._directory.save_metadata(metadata)
-        # also make a copy so that the caller can't further modify
-        # the data that we have without calling update_metadata again
-        self._metadata = ShotMetadata(**asdict(metadata))
+        # frozen metadata can't be modified further by the caller, so
+        # there is no need to keep a copy of it
+        self._metadata = metadata
+        if self._catalog is not None:
+            self._catalog.add(self._directory, self._metadata)
 
     def assets_by_category(self, category: str) -> List[str]:
         """Get the list of assets of a given category in the pipeline.
@@ -70,19 +105,21 @@ class Shot:
             category (str): The category of assets to be listed.
 
         """
-        entries = os.listdir(self._directory)
-        entries.remove(self._directory.METADATA_FILE)
+        if self._catalog is not None:
+            return self._catalog.children_by_category(self._directory, category)
+
+        # a lazy parent may not have saved its own metadata file yet
+        entries = self._directory.children()
 
         assets: List = [str]
 
         for asset in entries:
-            metadata_file_path = os.path.join(asset, Directory.METADATA_FILE)
-            metadata_file = os.path.join(self._directory, metadata_file_path)
-            with open(metadata_file, "r") as file:
-                metadata_json = json.load(file)
+            # go through the directory so that cached and buffered
+            # metadata is used instead of always reading the file
+            metadata_json = self._directory.child(asset).load_metadata()
 
-                if metadata_json["category"] == category:
-                    assets.append(asset)
+            if metadata_json["category"] == category:
+                assets.append(asset)
 
         del assets[0]
         return assets
@@ -92,8 +129,11 @@ class Shot:
 
         The order of the returned assets is undetermined.
         """
-        entries = os.listdir(self._directory)
-        entries.remove(self._directory.METADATA_FILE)
+        if self._catalog is not None:
+            return self._catalog.children(self._directory)
+
+        # a lazy parent may not have saved its own metadata file yet
+        entries = self._directory.children()
         return entries
 
     def load_asset(self, name: str) -> Asset:
@@ -106,9 +146,8 @@ class Shot:
             FileNotFoundError: if the shot does not exist
         """
 
-        asset_dir = os.path.join(self._directory, name)
-        directory = Directory(asset_dir)
-        return Asset(directory)
+        directory = self._directory.child(name)
+        return Asset(directory, catalog=self._catalog, lazy=self._lazy, trash=self._trash)
 
     def create_asset(self, name: str, category: str = "") -> Asset:
         """Create a new asset inside the pipeline storage.
@@ -120,25 +159,110 @@ class Shot:
         Raises:
             FileExistsError: If the asset already exists
         """
-        asset_dir = os.path.join(self._directory, name)
-        directory = Directory.create(asset_dir)
-        return Asset(directory, category)
+        directory = self._directory.create_child(name)
+        asset = Asset(directory, category, self._catalog, self._lazy, self._trash)
+        # new assets always get their default metadata file right away
+        asset._current_metadata()
+        self._index().add(self._directory.name(), name)
+        return asset
+
+    def create_assets(self, assets: Iterable[Union[str, Tuple[str, str]]], sync: bool = False) -> Dict[str, bool]:
+        """Create many new assets inside the pipeline storage at once.
+
+        This is much faster than calling create_asset() in a loop, see
+        Directory.create_children(). Assets that already exist are left untouched.
 
-    def archive(self, delete_original_folder: bool = False) -> None:
+        Args:
+            assets: The names of the assets to create, or (name, category) pairs
+            sync: If set to True, wait for the whole batch to reach the disk
+
+        Returns:
+            For each name, True if the asset was created or False if it already existed
+        """
+        metadata = []
+        for asset in assets:
+            if isinstance(asset, str):
+                metadata.append(AssetMetadata(name=asset, category=""))
+            else:
+                name, category = asset
+                metadata.append(AssetMetadata(name=name, category=category))
+        created = self._directory.create_children([(item.name, item) for item in metadata], sync)
+
+        new_assets = [item for item, was_created in zip(metadata, created) if was_created]
+        index = self._index()
+        for item in new_assets:
+            index.add(self._directory.name(), item.name)
+        if self._catalog is not None:
+            self._catalog.add_many((os.path.join(self._directory, item.name), item) for item in new_assets)
+
+        results: Dict[str, bool] = {}
+        for item, was_created in zip(metadata, created):
+            results[item.name] = results.get(item.name, False) or was_created
+        return results
+
+    def archive(self, delete_original_folder: bool = False, workers: Optional[int] = None,
+                incremental: bool = False, cancel: Optional[Event] = None) -> ArchiveStats:
         """Archive this shot into a .zip file
 
+        The files are compressed in parallel, see archive.make_archive().
+
         Args:
             delete_original_folder: If set to True, the directory being zipped will be deleted.
+            workers: The number of compression threads, defaults to the number of cpus.
+            incremental: If set to True, only the files that changed since the last
+                incremental archive are written, see archive.make_incremental_archive().
+            cancel: If given, setting this event from another thread stops the archive.
+
+        Returns:
+            The size, duration and throughput of the archive that was written.
 
+        Raises:
+            ArchiveCancelled: If the cancel event was set, the original folder is kept.
+            NotImplementedError: If the shot is not kept in a folder on disk
         """
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"only shots on disk can be archived: {os.fspath(self._directory)}")
         path = os.path.join(os.path.dirname(self._directory), self._directory)
-        shutil.make_archive(path, "zip", path)
+        # metadata buffered in write-back mode belongs in the archive too
+        self._directory.flush()
+        if incremental:
+            stats = make_incremental_archive(path, path, workers, cancel=cancel)
+        else:
+            stats = make_archive(path, path, workers, cancel=cancel)
 
         if delete_original_folder:
-            shutil.rmtree(path)
+            # removed the way any other delete is, so nothing buffered lands in it later
+            self.delete()
         else:
             pass
 
+        return stats
+
+    def disk_usage(self, refresh: bool = False) -> DiskUsage:
+        """Get the number and total size of the files of this shot, its assets included.
+
+        Sizes are cached for each folder, which is only scanned again once
+        something is added, removed or renamed in it, see usage.UsageCache.
+
+        Args:
+            refresh: If set to True, every folder is scanned again, eg: to see
+                files that other programs changed in place.
+
+        Raises:
+            NotImplementedError: If the shot is not kept in a folder on disk
+        """
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"only shots on disk can be measured: {os.fspath(self._directory)}")
+        return self._directory.disk_usage(refresh)
+
     def delete(self) -> None:
         """Remove this shot and all associated data."""
-        self._directory.delete()
+        # in a storage the data is only moved into its trash and removed in the background
+        self._directory.delete(self._trash)
+        self._index().remove_shot(self._directory.name())
+        if self._catalog is not None:
+            self._catalog.remove(self._directory)
+
+    def _index(self) -> AssetIndex:
+        """The reverse asset index of the show this shot belongs to."""
+        return AssetIndex.for_show(self._directory.parent())
@@ -1,10 +1,17 @@
 import os
-from dataclasses import dataclass, asdict
-from typing import List
-import shutil
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from threading import Event
 
+from .archive import ArchiveStats, make_archive, make_incremental_archive
+from .catalog import Catalog
+from .codec import to_dict
 from .directory import Directory
-from .shot import Shot
+from .index import AssetIndex
+from .trash import Trash
+from .usage import DiskUsage
+from .query import AssetMatch, categories_of, find_assets
+from .shot import Shot, ShotMetadata
 
 
 @dataclass(slots=True, eq=True)
@@ -25,31 +32,60 @@ class Show:
         Attributes:
             _directory (Directory): The directory where the show is located.
             _metadata (ShowMetadata): The metadata of the show.
+            _catalog (Catalog): The optional catalog kept up to date with this show.
+            _trash (Trash): The optional trash of the storage this show is in.
     """
-    def __init__(self, directory: Directory) -> None:
+    def __init__(self, directory: Directory, catalog: Optional[Catalog] = None, lazy: bool = False,
+                 trash: Optional[Trash] = None) -> None:
         """Open a show in the given directory.
         
         This will load any existing metadata or save the default as needed.
+
+        Args:
+            directory: The directory where the show is located.
+            catalog: If given, listings are answered by this catalog and
+                any changes to the show are recorded in it.
+            lazy: If set to True, no metadata is read or written until it is first needed.
+                Shots loaded from this show are lazy as well.
+            trash: If given, the show and its shots and assets are moved into this
+                trash when deleted, see Trash. Otherwise they are removed right away.
         """
         self._directory = directory
+        # archived entities are read from their archive, not the catalog
+        self._catalog = None if directory.read_only() else catalog
+        self._lazy = lazy
+        self._trash = trash
 
+        self._metadata: Optional[ShowMetadata] = None
+        if not lazy:
+            self._metadata = self._load_metadata()
+
+    def _load_metadata(self) -> ShowMetadata:
+        """Read the metadata of this show, saving the default if there is none yet."""
         try:
-            metadata = ShowMetadata(**directory.load_metadata())
+            return ShowMetadata(**self._directory.load_metadata())
         except FileNotFoundError:
             # the directory is created, but if this is a new show, it
             # might not have any metadata yet, so we can instead save
             # a default file
-            metadata = ShowMetadata(name=directory.name())
-            directory.save_metadata(metadata)
-
-        self._metadata = metadata
+            metadata = ShowMetadata(name=self._directory.name())
+            self._directory.save_metadata(metadata)
+            if self._catalog is not None:
+                self._catalog.add(self._directory, metadata)
+            return metadata
+
+    def _current_metadata(self) -> ShowMetadata:
+        """The metadata of this show, loading it first in lazy mode."""
+        if self._metadata is None:
+            self._metadata = self._load_metadata()
+        return self._metadata
 
     def metadata(self) -> ShowMetadata:
         """Returns the available metadata for this show."""
         # we want to copy this metadata into a new instance
         # because editing it should not change this class unless
         # update_metadat is called specifically
-        return ShowMetadata(**asdict(self._metadata))
+        return ShowMetadata(**to_dict(self._current_metadata()))
 
     def update_metadata(self, metadata: ShowMetadata) -> None:
         """Modify the metadata for this show."""
@@ -58,17 +94,49 @@ class Show:
         self._directory.save_metadata(metadata)
         # also make a copy so that the caller can't further modify
         # the data that we have without calling update_metadata again
-        self._metadata = ShowMetadata(**asdict(metadata))
+        self._metadata = ShowMetadata(**to_dict(metadata))
+        if self._catalog is not None:
+            self._catalog.add(self._directory, self._metadata)
 
     def shots(self) -> List[str]:
         """Get the list of shots in the pipeline.
 
         The order of the returned shots is undetermined.
         """
-        entries = os.listdir(self._directory)
-        entries.remove(self._directory.METADATA_FILE)
+        if self._catalog is not None:
+            return self._catalog.children(self._directory)
+
+        # a lazy parent may not have saved its own metadata file yet
+        entries = self._directory.children()
         return entries
 
+    def assets_by_category(self, category: Union[str, Iterable[str]],
+                           workers: Optional[int] = None) -> Iterator[AssetMatch]:
+        """Find the assets of one or more categories in every shot of this show.
+
+        The metadata of the assets is read in parallel and matches are
+        yielded as soon as they are found, so the order is undetermined.
+
+        Args:
+            category: The category, or several categories, of assets to find.
+            workers: The number of reading threads, see query.find_assets().
+        """
+        categories = categories_of(category)
+        if self._catalog is not None:
+            for match in self._catalog.assets(self._directory, categories):
+                yield AssetMatch(*match)
+            return
+
+        yield from find_assets([self._directory], categories, workers)
+
+    def reindex_assets(self) -> None:
+        """Rebuild the index used by Asset.shots() from the shots on disk.
+
+        This is only needed when assets were created, renamed or deleted
+        without going through this library.
+        """
+        AssetIndex.for_show(self._directory).rebuild()
+
     def load_shot(self, name: str) -> Shot:
         """Load the data for a shot in the storage.
 
@@ -79,9 +147,8 @@ class Show:
             FileNotFoundError: if the shot does not exist
         """
 
-        shot_dir = os.path.join(self._directory, name)
-        directory = Directory(shot_dir)
-        return Shot(directory)
+        directory = self._directory.child(name)
+        return Shot(directory, self._catalog, self._lazy, self._trash)
 
     def create_shot(self, name: str) -> Shot:
         """Create a new shot inside the pipeline storage.
@@ -90,25 +157,98 @@ class Show:
             FileExistsError: If the shot already exists
         """
 
-        shot_dir = os.path.join(self._directory, name)
-        directory = Directory.create(shot_dir)
-        return Shot(directory)
+        directory = self._directory.create_child(name)
+        shot = Shot(directory, self._catalog, self._lazy, self._trash)
+        # new shots always get their default metadata file right away
+        shot._current_metadata()
+        return shot
+
+    def create_shots(self, names: Iterable[str], sync: bool = False) -> Dict[str, bool]:
+        """Create many new shots inside the pipeline storage at once.
+
+        This is much faster than calling create_shot() in a loop, see
+        Directory.create_children(). Shots that already exist are left untouched.
 
-    def archive(self, delete_original_folder: bool = False) -> None:
+        Args:
+            names: The names of the shots to create
+            sync: If set to True, wait for the whole batch to reach the disk
+
+        Returns:
+            For each name, True if the shot was created or False if it already existed
+        """
+        metadata = [ShotMetadata(name=name) for name in names]
+        created = self._directory.create_children([(item.name, item) for item in metadata], sync)
+
+        if self._catalog is not None:
+            self._catalog.add_many(
+                (os.path.join(self._directory, item.name), item)
+                for item, was_created in zip(metadata, created) if was_created
+            )
+
+        results: Dict[str, bool] = {}
+        for item, was_created in zip(metadata, created):
+            results[item.name] = results.get(item.name, False) or was_created
+        return results
+
+    def archive(self, delete_original_folder: bool = False, workers: Optional[int] = None,
+                incremental: bool = False, cancel: Optional[Event] = None) -> ArchiveStats:
         """Archive this show into a .zip file
 
+        The files are compressed in parallel, see archive.make_archive().
+
         Args:
             delete_original_folder: If set to True, the directory being zipped will be deleted.
+            workers: The number of compression threads, defaults to the number of cpus.
+            incremental: If set to True, only the files that changed since the last
+                incremental archive are written, see archive.make_incremental_archive().
+            cancel: If given, setting this event from another thread stops the archive.
 
+        Returns:
+            The size, duration and throughput of the archive that was written.
+
+        Raises:
+            ArchiveCancelled: If the cancel event was set, the original folder is kept.
+            NotImplementedError: If the show is not kept in a folder on disk
         """
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"only shows on disk can be archived: {os.fspath(self._directory)}")
         path = os.path.join(os.path.dirname(self._directory), self._directory)
-        shutil.make_archive(path, "zip", path)
+        # metadata buffered in write-back mode belongs in the archive too
+        self._directory.flush()
+        if incremental:
+            stats = make_incremental_archive(path, path, workers, cancel=cancel)
+        else:
+            stats = make_archive(path, path, workers, cancel=cancel)
 
         if delete_original_folder:
-            shutil.rmtree(path)
+            # removed the way any other delete is, so nothing buffered lands in it later
+            self.delete()
         else:
             pass
 
+        return stats
+
+    def disk_usage(self, refresh: bool = False) -> DiskUsage:
+        """Get the number and total size of the files of this show, its shots and assets included.
+
+        Sizes are cached for each folder, which is only scanned again once
+        something is added, removed or renamed in it, see usage.UsageCache.
+
+        Args:
+            refresh: If set to True, every folder is scanned again, eg: to see
+                files that other programs changed in place.
+
+        Raises:
+            NotImplementedError: If the show is not kept in a folder on disk
+        """
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"only shows on disk can be measured: {os.fspath(self._directory)}")
+        return self._directory.disk_usage(refresh)
+
     def delete(self) -> None:
         """Remove this show and all associated shots and data."""
-        self._directory.delete()
+        # in a storage the data is only moved into its trash and removed in the background
+        self._directory.delete(self._trash)
+        AssetIndex.forget(self._directory)
+        if self._catalog is not None:
+            self._catalog.remove(self._directory)
@@ -0,0 +1,180 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class Row:
+    """A view of one entity in a Snapshot, without copying any of its data."""
+
+    __slots__ = ("_snapshot", "_index")
+
+    def __init__(self, snapshot: "Snapshot", index: int) -> None:
+        self._snapshot = snapshot
+        self._index = index
+
+    @property
+    def index(self) -> int:
+        """The position of this row in the snapshot."""
+        return self._index
+
+    @property
+    def level(self) -> int:
+        """Snapshot.SHOW, Snapshot.SHOT or Snapshot.ASSET"""
+        return self._snapshot._levels[self._index]
+
+    @property
+    def name(self) -> str:
+        return self._snapshot._string(self._snapshot._names, self._index)
+
+    @property
+    def category(self) -> str:
+        """The category of an asset, or an empty string for shows and shots."""
+        return self._snapshot._string(self._snapshot._categories, self._index)
+
+    @property
+    def description(self) -> str:
+        return self._snapshot._string(self._snapshot._descriptions, self._index)
+
+    @property
+    def parent(self) -> Optional["Row"]:
+        """The show of a shot, the shot of an asset, or None for a show."""
+        parent = self._snapshot._parents[self._index]
+        return None if parent < 0 else Row(self._snapshot, parent)
+
+    def path(self) -> List[str]:
+        """The names of the show, shot and asset leading to this row."""
+        names = []
+        row: Optional[Row] = self
+        while row is not None:
+            names.append(row.name)
+            row = row.parent
+        return names[::-1]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Row) and other._snapshot is self._snapshot and other._index == self._index
+
+    def __hash__(self) -> int:
+        return hash((id(self._snapshot), self._index))
+
+    def __repr__(self) -> str:
+        return f"Row({'/'.join(self.path())!r})"
+
+
+class Snapshot:
+    """An immutable, compact copy of every show, shot and asset in a storage.
+
+    Instead of one object per entity, each attribute is stored as a column
+    of integers, and each distinct string (name, category or description) is
+    kept only once. Queries run over the columns directly, and Row views are
+    only made for the results that are handed out.
+
+    Use Storage.snapshot() to take one.
+    """
+
+    SHOW = 0
+    SHOT = 1
+    ASSET = 2
+
+    __slots__ = ("_strings", "_string_ids", "_levels", "_names", "_categories",
+                 "_descriptions", "_parents", "_shows")
+
+    def __init__(self, entries: Iterable) -> None:
+        """Build a snapshot from the entries of Storage.walk(with_metadata=True).
+
+        Every show must come before its shots, and every shot before its assets.
+        """
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self._levels = array("b")
+        self._names = array("l")
+        self._categories = array("l")
+        self._descriptions = array("l")
+        self._parents = array("l")
+        self._shows = array("l")
+
+        show = shot = -1
+        for entry in entries:
+            metadata = entry.metadata or {}
+            index = len(self._levels)
+            if entry.shot is None:
+                level, parent, show = Snapshot.SHOW, -1, index
+                name = entry.show
+            elif entry.asset is None:
+                level, parent, shot = Snapshot.SHOT, show, index
+                name = entry.shot
+            else:
+                level, parent = Snapshot.ASSET, shot
+                name = entry.asset
+
+            self._levels.append(level)
+            self._names.append(self._intern(name))
+            self._categories.append(self._intern(metadata.get("category", "")))
+            self._descriptions.append(self._intern(metadata.get("description", "")))
+            self._parents.append(parent)
+            self._shows.append(show)
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    def __getitem__(self, index: int) -> Row:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return Row(self, index % len(self))
+
+    def __iter__(self) -> Iterator[Row]:
+        return (Row(self, index) for index in range(len(self)))
+
+    def filter(self, level: Optional[int] = None, category: Optional[str] = None,
+               show: Optional[str] = None) -> Iterator[Row]:
+        """Find the rows matching all of the given conditions.
+
+        Args:
+            level: Only match Snapshot.SHOW, Snapshot.SHOT or Snapshot.ASSET rows.
+            category: Only match assets of this category.
+            show: Only match the rows of the show with this name.
+        """
+        return (Row(self, index) for index in self._matching(level, category, show))
+
+    def count(self, level: Optional[int] = None, category: Optional[str] = None,
+              show: Optional[str] = None) -> int:
+        """Count the rows matching all of the given conditions, see filter()."""
+        return sum(1 for _ in self._matching(level, category, show))
+
+    def group_by_category(self, show: Optional[str] = None) -> Dict[str, List[int]]:
+        """Group the indexes of all assets, or the assets of one show, by category."""
+        groups: Dict[int, List[int]] = {}
+        for index in self._matching(Snapshot.ASSET, None, show):
+            groups.setdefault(self._categories[index], []).append(index)
+        return {self._strings[category]: indexes for category, indexes in groups.items()}
+
+    def _matching(self, level: Optional[int], category: Optional[str], show: Optional[str]) -> Iterator[int]:
+        # comparing interned ids is enough, and a string that was never
+        # seen can't match anything at all
+        conditions = []
+        if level is not None:
+            conditions.append((self._levels, level))
+        if category is not None:
+            if category not in self._string_ids:
+                return
+            conditions.append((self._levels, Snapshot.ASSET))
+            conditions.append((self._categories, self._string_ids[category]))
+        show_id = None
+        if show is not None:
+            if show not in self._string_ids:
+                return
+            show_id = self._string_ids[show]
+
+        for index in range(len(self._levels)):
+            if show_id is not None and self._names[self._shows[index]] != show_id:
+                continue
+            if all(column[index] == value for column, value in conditions):
+                yield index
+
+    def _intern(self, value: str) -> int:
+        index = self._string_ids.get(value)
+        if index is None:
+            index = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return index
+
+    def _string(self, column: array, index: int) -> str:
+        return self._strings[column[index]]
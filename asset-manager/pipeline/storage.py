@@ -1,29 +1,134 @@
-from typing import List
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Any, Union
+import contextlib
+import heapq
+import itertools
+import logging
 import os
 
-from .show import Show
+from . import codec
+from .archive import restore_archive
+from .catalog import Catalog
+from .show import Show, ShowMetadata
+from .shot import ShotMetadata
+from .asset import AssetMetadata
+from .backends import open_root
 from .directory import Directory
+from .index import AssetIndex
+from .journal import Transaction, recover
+from .objects import DedupeStats, ObjectStore, dedupe
+from .query import AssetMatch, categories_of, find_assets
+from .search import SearchMatch, query_tokens, rank, terms_of
+from .snapshot import Snapshot
+from .trash import PurgeStats, Trash
+from .usage import UsageEntry
+from .watch import CREATED, DELETED, LEVELS, RENAMED, UPDATED, ChangeEvent, Watcher
+from .writer import MetadataWriter, WriteBackWriter
+
+_logger = logging.getLogger("pipeline")
+
+class WalkEntry(NamedTuple):
+    """A lightweight record of one show, shot or asset found by Storage.walk().
+
+        Attributes:
+            show (str): The name of the show.
+            shot (str): The name of the shot, or None for a show.
+            asset (str): The name of the asset, or None for a show or shot.
+            metadata (dict): The raw contents of the metadata file, or None if
+                it was not requested or the entity has no metadata yet.
+    """
+    show: str
+    shot: Optional[str] = None
+    asset: Optional[str] = None
+    metadata: Optional[dict] = None
 
 
 class Storage:
-    def __init__(self, root: str) -> None:
+    def __init__(self, root: str, catalog: bool = False, lazy: bool = False,
+                 durability: str = "atomic", flush_delay: float = 1.0, backend: str = "filesystem",
+                 undo_window: float = 60.0, metadata_format: str = "json", check_versions: bool = False) -> None:
         """Create a new pipeline storage.
 
         Args:
             root: The path under which all pipeline data is stored
+            catalog: If set to True, an on-disk catalog is kept under the root
+                and used to answer listing and category queries. A catalog
+                that does not exist yet is built from the directory tree.
+            lazy: If set to True, shows, shots and assets are loaded without
+                reading their metadata until it is first needed.
+            durability: How metadata is saved. "atomic" replaces each file in a
+                single rename, "fsync" also waits for it to reach the disk and
+                "write-back" buffers and coalesces updates until flush() is
+                called or flush_delay seconds have passed.
+            flush_delay: The delay before buffered metadata is saved in write-back mode.
+            backend: Where shows, shots and assets are kept. "filesystem" makes a folder
+                with a metadata file for each, "memory" keeps them in memory only and
+                "packed" keeps all the metadata of each show in a single file, see
+                backends.py. Durability only applies to the filesystem backend.
+            undo_window: How many seconds deleted shows, shots and assets are kept in
+                the trash, where undelete() can bring them back, before they are purged.
+            metadata_format: How metadata files are encoded, "json" or the more compact
+                "binary", see codec.py. Files in either encoding are always readable.
+            check_versions: If set to True, update_metadata() only saves over the metadata
+                that the show, shot or asset last read, and raises VersionConflict if another
+                process or instance changed it meanwhile, see versions.py. Readers never wait.
+
+        Raises:
+            ValueError: If the durability, backend or format is not one of the above,
+                a catalog is asked for in memory, or versions are checked in write-back mode
+            NotImplementedError: If versions are checked with another backend than the filesystem
         """
         # we want to make sure the path that we store is absolute
         # in case the current working directory changes in the future
         # we want to make sure this class instance uses the original one
         self._root = os.path.abspath(root)
+        self._lazy = lazy
+
+        if metadata_format not in codec.FORMATS:
+            raise ValueError(f"unknown metadata format: {metadata_format}")
+        binary = metadata_format == "binary"
+
+        if durability == "atomic":
+            self._writer = MetadataWriter(binary=binary, check_versions=check_versions)
+        elif durability == "fsync":
+            self._writer = MetadataWriter(fsync=True, binary=binary, check_versions=check_versions)
+        elif durability == "write-back":
+            if check_versions:
+                # a checked save must know right away whether it went through
+                raise ValueError("versions can't be checked when writes are buffered")
+            self._writer = WriteBackWriter(delay=flush_delay, binary=binary)
+        else:
+            raise ValueError(f"unknown durability: {durability}")
+
+        self._directory = open_root(self._root, backend, self._writer)
+        if check_versions:
+            self._check_on_disk("version checks")
+        recovered = False
+        self._trash: Optional[Trash] = None
+        if self._directory.on_disk():
+            self._trash = Trash.for_root(self._root, undo_window)
+            # purge what earlier processes deleted and left behind
+            self._trash.resume()
+            # a transaction left open by a process that died is finished or undone first
+            recovered = os.path.isdir(self._root) and recover(self._root, self._writer)
+
+        self._catalog = None
+        if catalog and backend == "memory":
+            raise ValueError("the catalog is kept on disk, it can't be used with the memory backend")
+        if catalog:
+            self._catalog = Catalog(self._root)
+            if self._catalog.created() or recovered:
+                self.reindex()
 
     def shows(self) -> List[str]:
         """Get the list of shows in the pipeline.
 
         The order of the returned shows is undertermined.
         """
-        entries = os.listdir(self._root)
-        return entries
+        if self._catalog is not None:
+            return self._catalog.children(self._root)
+
+        # hidden entries hold the bookkeeping of the storage itself
+        return self._directory.children()
 
     def load_show(self, name: str) -> Show:
         """Load the data for a show in the storage.
@@ -31,13 +136,15 @@ class Storage:
         Args:
             name: The name of the show to load
 
+        A show that was archived and deleted is opened read-only
+        straight from its archive, see Directory.open().
+
         Raises:
             FileNotFoundError: if the show does not exist
         """
 
-        show_dir = os.path.join(self._root, name)
-        directory = Directory(show_dir)
-        return Show(directory)
+        directory = self._directory.child(name)
+        return Show(directory, self._catalog, self._lazy, self._trash)
 
     def create_show(self, name: str) -> Show:
         """Create a new show inside the pipeline storage.
@@ -46,6 +153,516 @@ class Storage:
             FileExistsError: If the show already exists
         """
 
+        directory = self._directory.create_child(name)
+        show = Show(directory, self._catalog, self._lazy, self._trash)
+        # new shows always get their default metadata file right away
+        show._current_metadata()
+        return show
+
+    def find_assets(self, category: Union[None, str, Iterable[str]] = None, show: Optional[str] = None,
+                    workers: Optional[int] = None) -> Iterator[AssetMatch]:
+        """Find assets across the whole pipeline.
+
+        The metadata of the assets is read in parallel and matches are
+        yielded as soon as they are found, so the order is undetermined.
+
+        Args:
+            category: The category, or several categories, of assets to find. All
+                assets are found if this is left empty.
+            show: Only search the show with this name.
+            workers: The number of reading threads, see query.find_assets().
+
+        Raises:
+            FileNotFoundError: if the given show does not exist
+        """
+        categories = categories_of(category)
+        shows = [self._directory.child(show)] if show is not None else None
+
+        if self._catalog is not None:
+            # the whole pipeline can be answered by a single query
+            path = shows[0] if shows is not None else self._root
+            for match in self._catalog.assets(path, categories):
+                yield AssetMatch(*match)
+            return
+
+        if shows is None:
+            shows = [self._directory.child(entry.show) for entry in self.walk(depth=1)]
+        yield from find_assets(shows, categories, workers)
+
+    def search(self, query: str, category: Union[None, str, Iterable[str]] = None, show: Optional[str] = None,
+               shot: Optional[str] = None, limit: int = 20) -> List[SearchMatch]:
+        """Find shows, shots and assets by fragments of their name or description.
+
+        Every word of the query must be found in the name or description of
+        an entity, either as a whole word, the start of one or, from three
+        letters up, anywhere inside one. Name matches rank above description
+        matches, see search.score().
+
+        With a catalog this is answered from its trigram index, which the
+        create, update and delete operations keep up to date, so it is fast
+        enough to search as the user types. Without one every metadata file
+        is read.
+
+        Args:
+            query: The words to look for, eg: "red car"
+            category: Only find assets with this category, or one of several.
+            show: Only search the show with this name.
+            shot: Only search the shot with this name, in the given show.
+            limit: The most matches to return.
+
+        Returns:
+            The best matches first
+
+        Raises:
+            ValueError: if a shot is given without its show
+            FileNotFoundError: if the given show or shot does not exist
+        """
+        if shot is not None and show is None:
+            raise ValueError("searching a shot needs the name of its show")
+        categories = categories_of(category)
+        names = tuple(name for name in (show, shot) if name is not None)
+        terms = terms_of(query)
+        if not terms:
+            return []
+
+        directory = self._directory
+        for name in names:
+            directory = directory.child(name)
+
+        if self._catalog is not None:
+            candidates = self._catalog.search(query_tokens(terms), directory, categories)
+        else:
+            candidates = []
+            searched = os.path.join(self._root, *names)
+            for path, metadata in self._scan(names):
+                if path == searched:
+                    continue
+                entity_category = getattr(metadata, "category", "")
+                if categories is None or entity_category in categories:
+                    relative = os.path.relpath(path, self._root).replace(os.sep, "/")
+                    candidates.append((relative, os.path.basename(path), entity_category, metadata.description))
+        return rank(terms, candidates, limit)
+
+    def usage_report(self, limit: int = 20, level: Optional[str] = None, refresh: bool = False) -> List[UsageEntry]:
+        """Rank the shows, shots and assets which take the most space on disk.
+
+        Eg: to pick what to archive first:
+            for entry in storage.usage_report(level="shot"):
+                print(entry.show, entry.shot, entry.bytes)
+
+        Every size comes from a single pass over the tree, in which only the
+        folders that changed since the last report are scanned again, see
+        usage.UsageCache. The rest only costs a stat each.
+
+        Args:
+            limit: The most entries to return.
+            level: Only rank the "show", "shot" or "asset" entities, or all of them if left empty.
+            refresh: If set to True, every folder is scanned again, eg: to see
+                files that other programs changed in place.
+
+        Returns:
+            The biggest entities first
+
+        Raises:
+            ValueError: If the level is not one of the above
+            NotImplementedError: If the storage does not use the filesystem backend
+        """
+        self._check_on_disk("disk usage reports")
+        if level is not None and level not in LEVELS:
+            raise ValueError(f"unknown level: {level}")
+
+        depth = LEVELS.index(level) + 1 if level is not None else len(LEVELS)
+        entries = (
+            UsageEntry(*names, *(None,) * (len(LEVELS) - len(names)), usage.files, usage.bytes)
+            for names, usage in Directory.usage.rollup(self._root, depth, refresh).items()
+            if level is None or len(names) == depth
+        )
+        return heapq.nlargest(limit, entries, key=lambda entry: entry.bytes)
+
+    def object_store(self, reflink: bool = False) -> ObjectStore:
+        """Get the store of files shared between assets, see ObjectStore.
+
+        Use ObjectStore.copy() to add files to assets without copying data
+        which is already in the pipeline.
+
+        Raises:
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        self._check_on_disk("shared files")
+        return ObjectStore(self._root, reflink)
+
+    def dedupe(self, min_size: int = 64 * 1024, workers: Optional[int] = None,
+               reflink: bool = False) -> DedupeStats:
+        """Store every identical file in the assets of the pipeline only once.
+
+        Each file is hashed and replaced by a link to a single shared copy
+        of its content, see ObjectStore. Files which were shared by an
+        earlier pass are not hashed again, so running this regularly is cheap.
+
+        Args:
+            min_size: Files smaller than this many bytes are left alone.
+            workers: The number of hashing threads, defaults to the number of cpus.
+            reflink: Share files as copy-on-write clones instead of hard links.
+
+        Returns:
+            How many files were shared and how much space was saved
+
+        Raises:
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        store = self.object_store(reflink)
+        stats = dedupe(self._root, store, min_size, workers)
+        store.collect()
+        return stats
+
+    def trash(self) -> Trash:
+        """Get the trash deleted shows, shots and assets wait in, see Trash.
+
+        Raises:
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        self._check_on_disk("the trash")
+        return Trash.for_root(self._root)
+
+    def purge(self) -> PurgeStats:
+        """Remove everything in the trash right away, without waiting for the undo window.
+
+        Returns:
+            How much was removed
+        """
+        if not self._directory.on_disk():
+            # other backends free deleted entities at once
+            return PurgeStats(entries=0, files=0, bytes_freed=0, seconds=0.0)
+        return self.trash().purge()
+
+    def undelete(self, show: str, shot: Optional[str] = None, asset: Optional[str] = None) -> None:
+        """Bring back a show, shot or asset that was deleted within the undo window.
+
+        If the same entity was deleted more than once, the latest one is brought back.
+        Load it again as usual afterwards.
+
+        Args:
+            show: The name of the show
+            shot: The name of the shot, to bring back a shot or asset
+            asset: The name of the asset, to bring back an asset
+
+        Raises:
+            FileNotFoundError: if it is not in the trash, or its show or shot is gone
+            FileExistsError: if a new one with the same name has been made since
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        names = tuple(name for name in (show, shot, asset) if name is not None)
+        trash = self.trash()
+        entry = trash.find(os.path.join(*names))
+        if entry is None:
+            raise FileNotFoundError(os.path.join(self._root, *names))
+        path = trash.restore(entry)
+
+        show_path = os.path.join(self._root, show)
+        # bring the index and catalog up to date, as if it had been created again
+        if len(names) == 1:
+            AssetIndex.forget(show_path)
+        elif asset is None:
+            index = AssetIndex.for_show(show_path)
+            for found in self._walk(path, names, 3, False):
+                index.add(shot, found.asset)
+        else:
+            AssetIndex.for_show(show_path).add(shot, asset)
+        if self._catalog is not None:
+            self._catalog.add_many(self._scan(names))
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[Transaction]:
+        """Make a set of changes that happen all together or not at all.
+
+        Eg:
+            with storage.transaction():
+                shot = storage.load_show("show").create_shot("shot1")
+                shot.create_assets(["car", "tree"])
+                shot.load_asset("car").update_metadata(AssetMetadata(name="truck", category="vehicle"))
+
+        Every create, update, rename and delete made through this storage
+        inside the block is journaled, and its metadata is only written
+        when the block ends, all at once, see Transaction. If the block
+        raises, every change is undone. If the process dies, the changes
+        are finished or undone the next time a Storage is opened on the root.
+
+        Opening a transaction inside another one simply joins it.
+
+        Raises:
+            RuntimeError: if another process has a transaction open on the storage
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        self._check_on_disk("transactions")
+        if self._writer.transaction is not None:
+            yield self._writer.transaction
+            return
+
+        # nothing written before the transaction may land on top of it later
+        self._writer.flush()
+        transaction = Transaction(self._root, self._writer)
+        self._writer.transaction = transaction
+        try:
+            yield transaction
+        except BaseException:
+            self._writer.transaction = None
+            try:
+                transaction.rollback()
+            finally:
+                # the indexes and catalog followed the changes as they were made
+                for path in transaction.changed():
+                    AssetIndex.forget(os.path.join(self._root, path.split(os.sep)[0]))
+                if self._catalog is not None:
+                    self.reindex()
+            raise
+        self._writer.transaction = None
+        transaction.commit()
+
+    def flush(self) -> None:
+        """Save any metadata buffered in write-back mode."""
+        self._writer.flush()
+
+    def restore_show(self, name: str) -> Show:
+        """Restore a show from its incremental archives.
+
+        The base archive is extracted and every later delta is replayed
+        on top of it, bringing back the show as of its last archive.
+
+        Args:
+            name: The name of the show to restore
+
+        Raises:
+            FileNotFoundError: if the show has no incremental archive
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        self._check_on_disk("archives")
         show_dir = os.path.join(self._root, name)
-        directory = Directory.create(show_dir)
-        return Show(directory)
+        restore_archive(show_dir, show_dir)
+        show = Show(Directory(show_dir, self._writer), self._catalog, self._lazy, self._trash)
+        if self._catalog is not None:
+            self.reindex()
+        return show
+
+    def reindex(self) -> None:
+        """Rebuild the catalog from the directories on disk.
+
+        Raises:
+            RuntimeError: If this storage was not opened with a catalog
+        """
+        if self._catalog is None:
+            raise RuntimeError(f"storage has no catalog: {self._root}")
+
+        self._catalog.rebuild(self._scan())
+
+    def walk(self, depth: int = 3, with_metadata: bool = False) -> Iterator[WalkEntry]:
+        """Lazily visit every show, shot and asset in the pipeline.
+
+        Each show is yielded before its shots, and each shot before its assets.
+        Directories are read one at a time as the caller iterates, so memory
+        use does not grow with the size of the tree.
+
+        Args:
+            depth: 1 to only visit shows, 2 to also visit shots and 3 for assets.
+            with_metadata: If set to True, the metadata file of each entity is read.
+        """
+        if self._directory.on_disk():
+            yield from self._walk(self._root, (), depth, with_metadata)
+        else:
+            yield from self._walk_directory(self._directory, (), depth, with_metadata)
+
+    def snapshot(self) -> Snapshot:
+        """Take an immutable, compact copy of every show, shot and asset.
+
+        This reads the whole tree once, see Snapshot for how to query it.
+        """
+        return Snapshot(self.walk(with_metadata=True))
+
+    def watch(self, callback: Optional[Callable[[List[ChangeEvent]], None]] = None, **options) -> Watcher:
+        """Start following changes made to the pipeline on disk, eg: by other processes.
+
+        Each batch of changes is applied to the catalog, the asset indexes of
+        the shows and the metadata cache, so they stay up to date without
+        having to reindex or rebuild them, and is then passed to the callback.
+
+        Args:
+            callback: Called from the watching thread with each batch of changes.
+            options: Passed on to Watcher, eg: interval=5.0.
+
+        Returns:
+            The running watcher, call stop() on it when done
+
+        Raises:
+            NotImplementedError: if the storage does not use the filesystem backend
+        """
+        self._check_on_disk("watching")
+
+        def apply(events: List[ChangeEvent]) -> None:
+            self._apply_changes(events)
+            if callback is not None:
+                callback(events)
+
+        watcher = Watcher(self._root, apply, **options)
+        watcher.start()
+        return watcher
+
+    def _apply_changes(self, events: List[ChangeEvent]) -> None:
+        """Bring the catalog, indexes and cache up to date with some changes.
+
+        A change which can't be applied, eg: because it changed again since
+        or its metadata was written by hand and is broken, is logged and
+        skipped, so the rest still are.
+        """
+        for event in events:
+            try:
+                self._apply_change(event)
+            except (OSError, ValueError, TypeError):
+                _logger.warning("could not apply %s, skipping it", event, exc_info=True)
+
+    def _apply_change(self, event: ChangeEvent) -> None:
+        names = event.names()
+        path = os.path.join(self._root, *names)
+        old_path = os.path.join(os.path.dirname(path), event.old_name or names[-1])
+        show_path = os.path.join(self._root, event.show)
+
+        if event.kind == CREATED or event.kind == UPDATED:
+            metadata_file = os.path.join(path, Directory.METADATA_FILE)
+            try:
+                # warm the cache so the next load doesn't go to the disk
+                Directory.cache.load(metadata_file)
+            except FileNotFoundError:
+                pass
+        elif event.kind == DELETED:
+            Directory.cache.discard(os.path.join(path, Directory.METADATA_FILE))
+
+        if event.level == "show":
+            if event.kind != UPDATED:
+                # the index of a show is rebuilt the next time it is used
+                AssetIndex.forget(old_path)
+                AssetIndex.forget(path)
+        elif event.level == "shot":
+            index = AssetIndex.for_show(show_path)
+            if event.kind in (DELETED, RENAMED):
+                index.remove_shot(event.old_name or event.shot)
+            if event.kind in (CREATED, RENAMED):
+                try:
+                    for entry in self._walk(path, names, 3, False):
+                        index.add(event.shot, entry.asset)
+                except FileNotFoundError:
+                    # it has changed again since, which a later batch will tell us
+                    pass
+        else:
+            index = AssetIndex.for_show(show_path)
+            if event.kind == CREATED:
+                index.add(event.shot, event.asset)
+            elif event.kind == DELETED:
+                index.remove(event.shot, event.asset)
+            elif event.kind == RENAMED:
+                index.rename(event.shot, event.old_name, event.asset)
+
+        if self._catalog is None:
+            return
+        try:
+            if event.kind == CREATED:
+                self._catalog.add_many(self._scan(names))
+            elif event.kind == UPDATED:
+                self._catalog.add_many(self._scan(names, depth=len(names)))
+            elif event.kind == RENAMED:
+                self._catalog.rename(old_path, names[-1])
+            else:
+                self._catalog.remove(path)
+        except FileNotFoundError:
+            # it has changed again since, which a later batch will tell us
+            pass
+
+    def _walk(self, path: str, names: Tuple[str, ...], depth: int, with_metadata: bool) -> Iterator[WalkEntry]:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # the DirEntry already knows its type from the listing, so
+                # files like metadata.json or archives are skipped for free
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+
+                metadata = None
+                if with_metadata:
+                    metadata_file = os.path.join(entry.path, Directory.METADATA_FILE)
+                    try:
+                        metadata = codec.load(metadata_file)
+                    except FileNotFoundError:
+                        pass
+
+                entry_names = names + (entry.name,)
+                yield WalkEntry(*entry_names, metadata=metadata)
+
+                if len(entry_names) < depth:
+                    yield from self._walk(entry.path, entry_names, depth, with_metadata)
+
+    def _walk_directory(self, directory: Directory, names: Tuple[str, ...], depth: int,
+                        with_metadata: bool) -> Iterator[WalkEntry]:
+        """The same as _walk(), through the directory interface of any backend."""
+        for name in directory.child_directories():
+            try:
+                child = directory.child(name)
+            except FileNotFoundError:
+                # removed while we were walking
+                continue
+
+            metadata = None
+            if with_metadata:
+                try:
+                    metadata = child.load_metadata()
+                except FileNotFoundError:
+                    pass
+
+            entry_names = names + (name,)
+            yield WalkEntry(*entry_names, metadata=metadata)
+
+            if len(entry_names) < depth:
+                yield from self._walk_directory(child, entry_names, depth, with_metadata)
+
+    def _check_on_disk(self, feature: str) -> None:
+        if not self._directory.on_disk():
+            raise NotImplementedError(f"{feature} need the filesystem backend: {self._root}")
+
+    def _scan(self, names: Tuple[str, ...] = (), depth: int = 3) -> Iterator[Tuple[str, Any]]:
+        """Yield the directory and metadata of every entity on disk.
+
+        Args:
+            names: Only scan the entity with these names and everything below it.
+            depth: How deep to scan, see walk().
+        """
+        levels = (ShowMetadata, ShotMetadata, AssetMetadata)
+        directory = self._directory
+        if not directory.on_disk():
+            for name in names:
+                directory = directory.child(name)
+
+        entries: Iterator[WalkEntry] = iter(())
+        if len(names) < depth:
+            if directory.on_disk():
+                entries = self._walk(os.path.join(self._root, *names), names, depth, True)
+            else:
+                entries = self._walk_directory(directory, names, depth, True)
+        if names:
+            metadata = None
+            try:
+                if directory.on_disk():
+                    metadata = codec.load(os.path.join(self._root, *names, Directory.METADATA_FILE))
+                else:
+                    metadata = directory.load_metadata()
+            except FileNotFoundError:
+                pass
+            entries = itertools.chain([WalkEntry(*names, metadata=metadata)], entries)
+
+        for entry in entries:
+            names = [name for name in entry[:3] if name is not None]
+            metadata_type = levels[len(names) - 1]
+            if entry.metadata is None:
+                # entities get their default metadata the first
+                # time they are opened, so mirror that here
+                if metadata_type is AssetMetadata:
+                    metadata = AssetMetadata(name=names[-1], category="")
+                else:
+                    metadata = metadata_type(name=names[-1])
+            else:
+                metadata = metadata_type(**entry.metadata)
+            yield os.path.join(self._root, *names), metadata
@@ -0,0 +1,405 @@
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+TRASH_FOLDER = ".trash"
+"""The hidden folder under the storage root which holds deleted entities."""
+
+# the file next to each deleted entity which records where it came from
+ORIGIN_SUFFIX = ".json"
+
+
+@dataclass(frozen=True)
+class TrashEntry:
+    """A dataclass describing one deleted show, shot or asset waiting in the trash.
+
+        Attributes:
+            id (str): The name of the entity inside the trash folder.
+            path (str): Where the entity was, relative to the storage root.
+            deleted_at (float): When it was deleted, as a unix timestamp.
+    """
+    id: str
+    path: str
+    deleted_at: float
+
+
+@dataclass(frozen=True)
+class PurgeStats:
+    """A dataclass describing a finished purge of the trash.
+
+        Attributes:
+            entries (int): The number of deleted entities removed for good.
+            files (int): The number of files removed.
+            bytes_freed (int): The size of the files removed.
+            seconds (float): The time it took.
+    """
+    entries: int
+    files: int
+    bytes_freed: int
+    seconds: float
+
+
+class Trash:
+    """The place deleted shows, shots and assets wait in before they are removed.
+
+    Deleting an entity only renames it into the hidden .trash folder of its
+    storage, which is instant whatever its size. The data is removed later
+    by a background purger once the undo window has passed, and until then
+    the entity can be brought back with restore().
+
+    The purger removes files from several threads, optionally throttled
+    to a number of files per second so it doesn't starve other disk users.
+    It only runs while there is something in the trash.
+
+    There is a single trash per storage root in the process, see for_root().
+    """
+
+    _trashes: Dict[str, "Trash"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, root: str, undo_window: float = 60.0, workers: Optional[int] = None,
+                 rate: Optional[float] = None) -> None:
+        """Open (or create) the trash of a storage root.
+
+        Args:
+            root: The root of the pipeline storage
+            undo_window: How many seconds deleted entities are kept before they are purged
+            workers: The number of removing threads, defaults to the number of cpus
+            rate: If given, at most this many files are removed per second
+        """
+        self._root = os.path.abspath(root)
+        self._path = os.path.join(self._root, TRASH_FOLDER)
+        self.undo_window = undo_window
+        self.workers = workers
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._purger: Optional[threading.Thread] = None
+        self._purge_lock = threading.Lock()
+
+    @classmethod
+    def for_root(cls, root: os.PathLike, undo_window: Optional[float] = None) -> "Trash":
+        """Get the shared trash of the storage in the given directory.
+
+        Args:
+            root: The root of the pipeline storage
+            undo_window: If given, replaces the undo window of the trash
+        """
+        path = os.path.abspath(os.fspath(root))
+        with cls._registry_lock:
+            trash = cls._trashes.get(path)
+            if trash is None:
+                trash = cls._trashes[path] = Trash(path)
+        if undo_window is not None:
+            trash.undo_window = undo_window
+        return trash
+
+    def move(self, path: os.PathLike, id: Optional[str] = None,
+             origin: Optional[str] = None) -> Optional[TrashEntry]:
+        """Delete a directory under the storage root by moving it into the trash.
+
+        A directory on another file system can't be moved in one rename,
+        so it is removed right away instead.
+
+        Args:
+            path: The directory to delete
+            id: The name to give it in the trash, eg: one recorded in a journal
+                beforehand, see new_id(). A new one is made if this is left empty.
+            origin: Where to restore it to, relative to the root, if that is not
+                where it is now, eg: for one held aside by a transaction
+
+        Returns:
+            The entry of the directory in the trash, or None if it was removed right away
+        """
+        path = os.path.abspath(os.fspath(path))
+        os.makedirs(self._path, exist_ok=True)
+        entry = TrashEntry(
+            id=id or self.new_id(),
+            path=origin or os.path.relpath(path, self._root),
+            deleted_at=time.time(),
+        )
+        # the origin is written first, so anything in the trash can be told where it belongs
+        origin = self._origin(entry.id)
+        with open(origin, "w") as file:
+            json.dump({"path": entry.path, "deleted_at": entry.deleted_at}, file)
+        try:
+            os.rename(path, os.path.join(self._path, entry.id))
+        except OSError as error:
+            os.remove(origin)
+            if error.errno != errno.EXDEV:
+                raise
+            shutil.rmtree(path)
+            return None
+
+        self._start_purger()
+        return entry
+
+    @staticmethod
+    def new_id() -> str:
+        """A new unique name for something in the trash, which sorts by time."""
+        return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+    def entries(self) -> List[TrashEntry]:
+        """Get everything in the trash, the oldest first."""
+        entries = []
+        try:
+            names = os.listdir(self._path)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(ORIGIN_SUFFIX) or name.startswith("."):
+                continue
+            try:
+                with open(os.path.join(self._path, name), "r") as file:
+                    origin = json.load(file)
+            except (FileNotFoundError, ValueError):
+                # being purged, or its origin was cut short by a crash
+                continue
+            entries.append(TrashEntry(name[:-len(ORIGIN_SUFFIX)], origin["path"], origin["deleted_at"]))
+        entries.sort(key=lambda entry: entry.id)
+        return entries
+
+    def find(self, path: str) -> Optional[TrashEntry]:
+        """The most recently deleted entity which was at the given path, relative to the root."""
+        path = os.path.normpath(path)
+        matching = [entry for entry in self.entries() if entry.path == path]
+        return matching[-1] if matching else None
+
+    def restore(self, entry: TrashEntry) -> str:
+        """Move a deleted entity back to where it was.
+
+        Returns:
+            The path of the restored directory
+
+        Raises:
+            FileExistsError: if something new is already in its place
+            FileNotFoundError: if it was purged, or its parent no longer exists
+        """
+        path = os.path.join(self._root, entry.path)
+        if os.path.exists(path):
+            raise FileExistsError(path)
+        # the origin is removed once the entity is back, so an interrupted
+        # restore still lists it and a purge can't remove it from under us
+        os.rename(os.path.join(self._path, entry.id), path)
+        os.remove(self._origin(entry.id))
+        return path
+
+    def purge(self, older_than: Optional[float] = None) -> PurgeStats:
+        """Remove deleted entities for good.
+
+        Entities that another purge already started on, including one that
+        was interrupted by a crash, are finished as well.
+
+        Args:
+            older_than: Only remove entities deleted at least this many seconds
+                ago. Everything in the trash is removed if this is left empty.
+
+        Returns:
+            How much was removed
+        """
+        # one at a time in the process, so the purger never mistakes a running
+        # purge for one which was interrupted
+        with self._purge_lock:
+            return self._purge(older_than)
+
+    def _purge(self, older_than: Optional[float]) -> PurgeStats:
+        started = time.perf_counter()
+        now = time.time()
+        expired = [
+            entry for entry in self.entries()
+            if older_than is None or now - entry.deleted_at >= older_than
+        ]
+
+        # hide the origin first, so the entity is no longer listed or restored
+        for entry in expired:
+            try:
+                os.replace(self._origin(entry.id), self._hidden(entry.id))
+            except FileNotFoundError:
+                # restored or purged by someone else meanwhile
+                pass
+        # which also finds the ones that an earlier purge hid and didn't finish
+        ids = self._purging()
+        if not ids:
+            return PurgeStats(entries=0, files=0, bytes_freed=0, seconds=time.perf_counter() - started)
+
+        files, folders = [], []
+        for id in ids:
+            found, found_folders = _tree(os.path.join(self._path, id))
+            files.extend(found)
+            folders.extend(found_folders)
+
+        throttle = _Throttle(self.rate)
+
+        def remove(file: Tuple[str, int]) -> Tuple[int, int]:
+            path, size = file
+            throttle.wait()
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return 0, 0
+            return 1, size
+
+        with ThreadPoolExecutor(max_workers=self.workers or os.cpu_count() or 1) as executor:
+            removed = list(executor.map(remove, files))
+
+        # the folders are listed parents first, so remove them the other way around
+        for path in reversed(folders):
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # still being emptied by a concurrent purge
+                pass
+        for id in ids:
+            # an entity is only forgotten once all of it is gone, otherwise
+            # the next purge finishes it
+            if not os.path.lexists(os.path.join(self._path, id)):
+                try:
+                    os.remove(self._hidden(id))
+                except FileNotFoundError:
+                    pass
+
+        return PurgeStats(
+            entries=len(ids),
+            files=sum(count for count, _ in removed),
+            bytes_freed=sum(size for _, size in removed),
+            seconds=time.perf_counter() - started,
+        )
+
+    def resume(self) -> None:
+        """Start the background purger if anything is waiting in the trash.
+
+        Eg: entities deleted by a process which ended before their undo
+        window passed, which no one else would purge.
+        """
+        try:
+            waiting = bool(os.listdir(self._path))
+        except FileNotFoundError:
+            return
+        if waiting:
+            self._start_purger()
+
+    def stop(self) -> None:
+        """Stop the background purger, leaving the trash as it is."""
+        with self._lock:
+            purger, self._purger = self._purger, None
+            self._wake.notify_all()
+        if purger is not None and purger is not threading.current_thread():
+            purger.join()
+
+    def _start_purger(self) -> None:
+        with self._lock:
+            if self._purger is not None:
+                self._wake.notify_all()
+                return
+            self._purger = threading.Thread(target=self._purge_expired, name="pipeline-purger", daemon=True)
+            self._purger.start()
+
+    def _purge_expired(self) -> None:
+        """Purge each entity once its undo window has passed, until the trash is empty.
+
+        Purges which were interrupted, eg: by a crash, are finished right away.
+        """
+        me = threading.current_thread()
+        while True:
+            entries = self.entries()
+            with self._purge_lock:
+                purging = self._purging()
+            with self._lock:
+                if self._purger is not me:
+                    return
+                if not entries and not purging:
+                    self._purger = None
+                    return
+                delay = entries[0].deleted_at + self.undo_window - time.time() if entries else 0
+                if delay > 0 and not purging:
+                    # woken early when the window changes or more is deleted
+                    self._wake.wait(delay)
+                    continue
+            try:
+                self.purge(older_than=self.undo_window)
+            except OSError:
+                # eg: it was restored or purged by someone else meanwhile
+                time.sleep(1.0)
+                continue
+            if self._purging():
+                # still being removed by another purge, or not removable for now
+                with self._lock:
+                    self._wake.wait(1.0)
+
+    def _origin(self, id: str) -> str:
+        return os.path.join(self._path, id + ORIGIN_SUFFIX)
+
+    def _hidden(self, id: str) -> str:
+        """The origin of an entity once a purge has started removing it."""
+        return os.path.join(self._path, "." + id + ORIGIN_SUFFIX)
+
+    def _purging(self) -> List[str]:
+        """The ids of the entities whose removal was started, and not finished yet."""
+        try:
+            names = os.listdir(self._path)
+        except FileNotFoundError:
+            return []
+        return [
+            name[1:-len(ORIGIN_SUFFIX)] for name in names
+            if name.startswith(".") and name.endswith(ORIGIN_SUFFIX)
+        ]
+
+
+class _Throttle:
+    """Spaces out calls to wait() from any number of threads to a number per second."""
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _tree(path: str) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """Every file below path with its size, and every folder, parents first."""
+    files: List[Tuple[str, int]] = []
+    folders: List[str] = []
+    if not os.path.isdir(path) or os.path.islink(path):
+        if os.path.lexists(path):
+            files.append((path, os.lstat(path).st_size))
+        return files, folders
+
+    pending = [path]
+    while pending:
+        folder = pending.pop()
+        folders.append(folder)
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    try:
+                        files.append((entry.path, entry.stat(follow_symlinks=False).st_size))
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            # removed by a concurrent purge
+            pass
+    return files, folders
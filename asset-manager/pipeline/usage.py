@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from .cache import CacheInfo
+
+# a folder changed this recently may still change within the same tick of
+# its modification time, so it isn't trusted until it has settled
+_SETTLE_NS = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class DiskUsage:
+    """A dataclass with the size of a show, shot or asset on disk.
+
+        Attributes:
+            files (int): The number of files, in every folder below it.
+            bytes (int): The total size of the files.
+    """
+    files: int
+    bytes: int
+
+
+class UsageEntry(NamedTuple):
+    """A show, shot or asset in a usage report, see Storage.usage_report().
+
+        Attributes:
+            show (str): The name of the show.
+            shot (str): The name of the shot, or None for a show.
+            asset (str): The name of the asset, or None for a show or shot.
+            files (int): The number of files in it.
+            bytes (int): The total size of the files.
+    """
+    show: str
+    shot: Optional[str]
+    asset: Optional[str]
+    files: int
+    bytes: int
+
+
+class _Folder(NamedTuple):
+    """The files directly inside one folder, the last time it was scanned.
+
+    Files with more than one link are kept apart in links, as the device,
+    inode and size of each, so they are only counted once per tree.
+    """
+    stamp: Tuple[int, int]
+    settled: bool
+    files: int
+    bytes: int
+    children: Tuple[str, ...]
+    links: Tuple[Tuple[int, int, int], ...]
+
+
+class UsageCache:
+    """Sizes of folder trees which are only summed again where they changed.
+
+    Each folder remembers the number and size of the files directly inside
+    it along with its own inode and modification time. A folder's time
+    changes whenever something is added, removed or renamed in it, which
+    covers every change made by this library since metadata is saved with
+    a rename, so a folder which kept its time is not scanned again and the
+    size of a tree costs a single stat per folder instead of one per file.
+
+    Files changed in place, without a rename, don't change the time of
+    their folder, so they are only seen with refresh=True. A file with
+    several hardlinks, eg: one deduplicated into the object store, is
+    counted once in every tree holding any of its links: each shot
+    sharing it is charged for it in full, and their show only once.
+    Linking a file again doesn't change the time of its folder either.
+    When the cache is full, the least recently used folder is dropped.
+    """
+
+    def __init__(self, maxsize: int = 65536) -> None:
+        """Create an empty cache.
+
+        Args:
+            maxsize: The number of folders to keep, 0 disables the cache.
+        """
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, _Folder]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def usage(self, path: str, refresh: bool = False) -> DiskUsage:
+        """Get the number and size of the files in a folder and below it.
+
+        Args:
+            path: The folder to measure
+            refresh: If set to True, every folder is scanned again
+
+        Raises:
+            FileNotFoundError: if the folder does not exist
+        """
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(path)
+        return _usage(*self._total(path, (), refresh, None, 0))
+
+    def rollup(self, path: str, depth: int, refresh: bool = False) -> Dict[Tuple[str, ...], DiskUsage]:
+        """Get the usage of every folder below a folder, down to some depth, in a single pass.
+
+        Hidden folders hold bookkeeping, not shows, shots or assets, so they
+        are left out, though they still count towards the size of their parent.
+        Hidden entries of the folder itself are left out entirely.
+
+        Args:
+            path: The folder to measure
+            depth: 1 for the folders inside it, 2 for the ones inside those and so on
+            refresh: If set to True, every folder is scanned again
+
+        Returns:
+            The usage of each folder, by the names leading to it from path
+        """
+        path = os.path.abspath(path)
+        found: Dict[Tuple[str, ...], DiskUsage] = {}
+        top = self._folder(path, refresh)
+        if top is not None:
+            for name in top.children:
+                if not name.startswith("."):
+                    self._total(os.path.join(path, name), (name,), refresh, found, depth)
+        return found
+
+    def clear(self) -> None:
+        """Forget every folder and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        """Get the counters of the cache, a miss being a folder that had to be scanned."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, len(self._entries), self._maxsize)
+
+    def _total(self, path: str, names: Tuple[str, ...], refresh: bool,
+               found: Optional[Dict[Tuple[str, ...], DiskUsage]],
+               depth: int) -> Tuple[int, int, Dict[Tuple[int, int], int]]:
+        """The count and size of the files with one link in a tree, and the size of those with several by inode."""
+        folder = self._folder(path, refresh)
+        if folder is None:
+            return 0, 0, {}
+        files, size = folder.files, folder.bytes
+        links = {(device, inode): link_size for device, inode, link_size in folder.links}
+        for name in folder.children:
+            child_files, child_size, child_links = self._total(
+                os.path.join(path, name), names + (name,), refresh, found, depth)
+            files += child_files
+            size += child_size
+            links.update(child_links)
+        if found is not None and len(names) <= depth and not names[-1].startswith("."):
+            found[names] = _usage(files, size, links)
+        return files, size, links
+
+    def _folder(self, path: str, refresh: bool) -> Optional[_Folder]:
+        """What is directly inside a folder, scanning it only if it changed."""
+        try:
+            stat = os.lstat(path)
+        except FileNotFoundError:
+            self._discard(path)
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached.stamp == stamp and cached.settled and not refresh:
+                self._entries.move_to_end(path)
+                self._hits += 1
+                return cached
+            self._misses += 1
+
+        # the folder is stamped before it is listed, so a change made
+        # while it is listed is seen the next time
+        files, size, children, links = 0, 0, [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.name)
+                            continue
+                        entry_stat = entry.stat(follow_symlinks=False)
+                        if entry_stat.st_nlink > 1:
+                            links.append((entry_stat.st_dev, entry_stat.st_ino, entry_stat.st_size))
+                        else:
+                            size += entry_stat.st_size
+                            files += 1
+                    except FileNotFoundError:
+                        # removed while we were listing
+                        pass
+        except (FileNotFoundError, NotADirectoryError):
+            self._discard(path)
+            return None
+
+        settled = time.time_ns() - stat.st_mtime_ns > _SETTLE_NS
+        folder = _Folder(stamp, settled, files, size, tuple(children), tuple(links))
+        if cached is not None:
+            for name in set(cached.children).difference(folder.children):
+                self._discard(os.path.join(path, name))
+        if self._maxsize > 0:
+            with self._lock:
+                self._entries[path] = folder
+                self._entries.move_to_end(path)
+                while len(self._entries) > self._maxsize:
+                    self._entries.popitem(last=False)
+        return folder
+
+    def _discard(self, path: str) -> None:
+        """Forget a folder which is gone, along with every folder that was below it."""
+        with self._lock:
+            folder = self._entries.pop(path, None)
+        if folder is not None:
+            for name in folder.children:
+                self._discard(os.path.join(path, name))
+
+
+def _usage(files: int, size: int, links: Dict[Tuple[int, int], int]) -> DiskUsage:
+    """The usage of a tree, with each file that has several links in it counted once."""
+    return DiskUsage(files + len(links), size + sum(links.values()))
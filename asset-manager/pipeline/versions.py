@@ -0,0 +1,75 @@
+"""
+Version stamps of metadata files, for writers in many processes.
+
+Every metadata file is replaced in a single rename, so each save makes a
+new file with its own inode. The inode, modification time and size of a
+file then stamp the version of it that was read, see version_of(), and
+it changed on disk if its stamp did. Checking the stamp costs one stat
+and readers never take a lock, see Storage(check_versions=True).
+"""
+
+import os
+import random
+import time
+from typing import Callable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+Version = Tuple[int, int, int]
+
+
+class VersionConflict(Exception):
+    """Raised when metadata is saved over a file which changed since it was read.
+
+    Nothing is saved when this is raised. Read the metadata again and
+    redo the change, see retry_on_conflict().
+    """
+
+
+def stamp(stat: os.stat_result) -> Version:
+    """The version stamp of a file from its stat."""
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def version_of(path: str) -> Optional[Version]:
+    """The version stamp of a file, or None if it does not exist."""
+    try:
+        return stamp(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+def retry_on_conflict(operation: Callable[[], T], attempts: int = 10, delay: float = 0.01) -> T:
+    """Run a read-modify-write operation until it saves without a conflict.
+
+    The operation must read what it changes again each time it is called,
+    eg: by loading the entities from the storage inside of it.
+
+    Eg:
+        def tag():
+            asset = storage.load_show("show").load_shot("shot1").load_asset("car")
+            metadata = asset.metadata()
+            asset.update_metadata(dataclasses.replace(metadata, description=metadata.description + " #hero"))
+
+        retry_on_conflict(tag)
+
+    Args:
+        operation: The function to run, which may raise VersionConflict
+        attempts: The most times to run it
+        delay: The wait before the first retry in seconds, which doubles after
+            each one and is jittered, so writers that collided spread apart
+
+    Returns:
+        Whatever the operation returned
+
+    Raises:
+        VersionConflict: if every attempt ran into a conflict
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except VersionConflict:
+            if attempt == attempts - 1:
+                raise
+        time.sleep(delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+    raise ValueError("attempts must be at least 1")
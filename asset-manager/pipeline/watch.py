@@ -0,0 +1,416 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .directory import Directory
+
+_logger = logging.getLogger("pipeline")
+
+CREATED = "created"
+UPDATED = "updated"
+RENAMED = "renamed"
+DELETED = "deleted"
+
+LEVELS = ("show", "shot", "asset")
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """A dataclass describing one change made to the pipeline on disk.
+
+    When a whole show or shot is created, deleted or renamed only one
+    event is sent for it, and not one for each of its shots and assets.
+
+        Attributes:
+            kind (str): One of CREATED, UPDATED, RENAMED or DELETED.
+            show (str): The name of the show.
+            shot (str): The name of the shot, or None if the event is for a show.
+            asset (str): The name of the asset, or None if the event is for a show or shot.
+            old_name (str): The previous name of a renamed show, shot or asset.
+    """
+    kind: str
+    show: str
+    shot: Optional[str] = None
+    asset: Optional[str] = None
+    old_name: Optional[str] = None
+
+    @property
+    def level(self) -> str:
+        """Whether this event is for a "show", "shot" or "asset"."""
+        return LEVELS[len(self.names()) - 1]
+
+    def names(self) -> Tuple[str, ...]:
+        """The names leading from the storage root to the changed entity."""
+        return tuple(name for name in (self.show, self.shot, self.asset) if name is not None)
+
+
+class _Node(NamedTuple):
+    """What is known about one directory the last time it was scanned."""
+    inode: int
+    mtime_ns: int
+    metadata: Optional[Tuple[int, int]]
+    children: Tuple[str, ...]
+
+
+class Watcher:
+    """Sends batches of ChangeEvents whenever the pipeline is changed on disk.
+
+    On Linux, inotify tells the watcher which directories changed so that
+    only those are read again. Elsewhere, or if inotify is not available,
+    the tree is polled and only the directories whose modification time
+    changed are listed again. In both cases changes are debounced: events
+    are only sent once the tree has been quiet for a moment (or max_delay
+    has passed), so a bulk copy is reported as a single batch.
+
+    The callback is called from the thread of the watcher. Errors raised
+    by it, or while reading the tree, are logged and the watch goes on.
+    """
+
+    def __init__(self, root: str, callback: Callable[[List[ChangeEvent]], None], interval: float = 1.0,
+                 debounce: float = 0.5, max_delay: float = 10.0, inotify: Optional[bool] = None) -> None:
+        """Create a watcher, call start() to begin watching.
+
+        Args:
+            root: The root of the pipeline storage to watch
+            callback: Called with each batch of events
+            interval: The number of seconds between polls when not using inotify
+            debounce: How long the tree must be quiet before a batch is sent
+            max_delay: The longest time a change can wait before it is sent
+            inotify: Force inotify on or off, by default it is used where available
+        """
+        self._root = os.path.abspath(root)
+        self._callback = callback
+        self._interval = interval
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._nodes: Dict[Tuple[str, ...], _Node] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._inotify: Optional[_Inotify] = None
+        if inotify or (inotify is None and _Inotify.available()):
+            self._inotify = _Inotify()
+        self._watches: Dict[int, Tuple[str, ...]] = {}
+
+        self._scan((), self._nodes, use_cache=False)
+        self._watch_all(())
+
+    def __enter__(self) -> "Watcher":
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    def uses_inotify(self) -> bool:
+        """True if changes are reported by inotify rather than polling."""
+        return self._inotify is not None
+
+    def start(self) -> None:
+        """Start watching in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="pipeline-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching and wait for the background thread to end."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def poll(self) -> List[ChangeEvent]:
+        """Scan the whole tree right away and return what changed since the last time."""
+        return self._refresh({()})
+
+    def _run(self) -> None:
+        first_change = last_change = None
+        dirty: Set[Tuple[str, ...]] = set()
+        polled = None
+
+        while not self._stopped.is_set():
+            if self._inotify is not None:
+                for wd, mask, name in self._inotify.read(self._debounce):
+                    if mask & _Inotify.IN_IGNORED:
+                        # the directory is gone, or we stopped watching it
+                        self._watches.pop(wd, None)
+                        continue
+                    # anything we can't place, like a queue overflow,
+                    # means the whole tree has to be looked at again
+                    key = self._watches.get(wd, ())
+                    if key and mask & (_Inotify.IN_DELETE_SELF | _Inotify.IN_MOVE_SELF):
+                        # only its parent can tell where it went
+                        key = key[:-1]
+                    dirty.add(key)
+                    first_change = first_change or time.monotonic()
+                    last_change = time.monotonic()
+            else:
+                self._stopped.wait(self._interval)
+                nodes: Dict[Tuple[str, ...], _Node] = {}
+                try:
+                    self._scan((), nodes, use_cache=True, previous=polled or self._nodes)
+                except OSError:
+                    # eg: the root is gone for now, so try again on the next poll
+                    _logger.warning("could not scan %s", self._root, exc_info=True)
+                    continue
+                if nodes != (polled or self._nodes):
+                    dirty.add(())
+                    first_change = first_change or time.monotonic()
+                    last_change = time.monotonic()
+                polled = nodes
+
+            if not dirty:
+                continue
+            now = time.monotonic()
+            if now - last_change < self._debounce and now - first_change < self._max_delay:
+                continue
+
+            try:
+                events = self._refresh(dirty, polled)
+            except OSError:
+                _logger.warning("could not scan %s", self._root, exc_info=True)
+                continue
+            dirty, polled = set(), None
+            first_change = last_change = None
+            if events:
+                try:
+                    self._callback(events)
+                except Exception:
+                    _logger.exception("the callback of the watcher of %s failed", self._root)
+
+    def _refresh(self, dirty: Set[Tuple[str, ...]],
+                 scanned: Optional[Dict[Tuple[str, ...], _Node]] = None) -> List[ChangeEvent]:
+        """Read the dirty directories again and return how they changed."""
+        events: List[ChangeEvent] = []
+        # a directory that is read again covers everything below it
+        for key in sorted(dirty, key=len):
+            if any(key[:length] in dirty for length in range(len(key))):
+                continue
+
+            old = self._subtree(key)
+            if scanned is not None and key == ():
+                new = scanned
+            else:
+                new = {}
+                try:
+                    self._scan(key, new, use_cache=True, force=key)
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+
+            events.extend(_diff(old, new))
+            for stale in old:
+                del self._nodes[stale]
+            self._unwatch(set(old).difference(new))
+            self._nodes.update(new)
+            if key and key[:-1] in self._nodes and key not in new:
+                # the parent was not read again, so update its children here
+                parent = self._nodes[key[:-1]]
+                self._nodes[key[:-1]] = parent._replace(
+                    children=tuple(child for child in parent.children if child != key[-1]))
+            self._watch_all(key)
+        return events
+
+    def _subtree(self, key: Tuple[str, ...]) -> Dict[Tuple[str, ...], _Node]:
+        """Everything currently known about a directory and its contents."""
+        found = {}
+        pending = [key]
+        while pending:
+            current = pending.pop()
+            node = self._nodes.get(current)
+            if node is None:
+                continue
+            found[current] = node
+            pending.extend(current + (child,) for child in node.children)
+        return found
+
+    def _scan(self, key: Tuple[str, ...], out: Dict[Tuple[str, ...], _Node], use_cache: bool,
+              previous: Optional[Dict[Tuple[str, ...], _Node]] = None, force: Optional[Tuple[str, ...]] = None) -> None:
+        """Read a directory and everything below it into out.
+
+        If use_cache is set, the children of a directory whose modification
+        time did not change are taken from previous instead of listing it.
+        """
+        previous = self._nodes if previous is None else previous
+        path = os.path.join(self._root, *key)
+        stat = os.stat(path)
+
+        old = previous.get(key)
+        if use_cache and key != force and old is not None and \
+                (old.inode, old.mtime_ns) == (stat.st_ino, stat.st_mtime_ns):
+            children = old.children
+        elif len(key) < len(LEVELS):
+            with os.scandir(path) as entries:
+                children = tuple(sorted(
+                    entry.name for entry in entries
+                    if not entry.name.startswith(".") and entry.is_dir()
+                ))
+        else:
+            children = ()
+
+        metadata = None
+        if key:
+            try:
+                metadata_stat = os.stat(os.path.join(path, Directory.METADATA_FILE))
+                metadata = (metadata_stat.st_mtime_ns, metadata_stat.st_size)
+            except FileNotFoundError:
+                pass
+
+        out[key] = _Node(stat.st_ino, stat.st_mtime_ns, metadata, children)
+        for child in children:
+            try:
+                self._scan(key + (child,), out, use_cache, previous, force)
+            except (FileNotFoundError, NotADirectoryError):
+                # it is gone already, which the next scan of its parent will see
+                pass
+
+    def _unwatch(self, keys: Set[Tuple[str, ...]]) -> None:
+        """Stop watching directories which are no longer where they were.
+
+        A directory that was moved inside the tree is watched again under
+        its new name by _watch_all().
+        """
+        if self._inotify is None or not keys:
+            return
+        for wd, key in list(self._watches.items()):
+            if key in keys:
+                del self._watches[wd]
+                self._inotify.remove_watch(wd)
+
+    def _watch_all(self, key: Tuple[str, ...]) -> None:
+        """Make sure inotify watches every directory below key."""
+        if self._inotify is None:
+            return
+        for current in self._subtree(key):
+            try:
+                # watching the same directory again returns the same
+                # descriptor, which keeps renamed directories pointing
+                # at their new names
+                self._watches[self._inotify.add_watch(os.path.join(self._root, *current))] = current
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # most likely out of watches, so fall back to polling
+                self._inotify.close()
+                self._inotify = None
+                return
+
+
+def _diff(old: Dict[Tuple[str, ...], _Node], new: Dict[Tuple[str, ...], _Node]) -> List[ChangeEvent]:
+    """The events that turn the old state of some directories into the new one."""
+    removed = {key for key in old if key not in new}
+    added = {key for key in new if key not in old}
+
+    # a directory that disappeared and appeared next to itself under a
+    # new name, with the same inode, was renamed
+    by_inode = {(key[:-1], old[key].inode): key for key in removed}
+    renamed = {}
+    for key in added:
+        match = by_inode.get((key[:-1], new[key].inode))
+        if match is not None:
+            renamed[key] = match
+    created = added - set(renamed)
+    deleted = removed - set(renamed.values())
+
+    def covered(key: Tuple[str, ...], keys: Set[Tuple[str, ...]]) -> bool:
+        return any(key[:length] in keys for length in range(1, len(key)))
+
+    events = []
+    for key in sorted(renamed):
+        if not covered(key, created | set(renamed)):
+            events.append(_event(RENAMED, key, renamed[key][-1]))
+            if old[renamed[key]].metadata != new[key].metadata:
+                events.append(_event(UPDATED, key))
+    for key in sorted(created):
+        if key and not covered(key, created | set(renamed)):
+            events.append(_event(CREATED, key))
+    for key in sorted(key for key in new if key in old and key):
+        if old[key].metadata != new[key].metadata:
+            events.append(_event(UPDATED, key))
+    for key in sorted(deleted):
+        if key and not covered(key, deleted | set(renamed.values())):
+            events.append(_event(DELETED, key))
+    return events
+
+
+def _event(kind: str, key: Tuple[str, ...], old_name: Optional[str] = None) -> ChangeEvent:
+    return ChangeEvent(kind, *key, old_name=old_name) if len(key) == 3 else \
+        ChangeEvent(kind, *(key + (None,) * (3 - len(key))), old_name=old_name)
+
+
+class _Inotify:
+    """A minimal ctypes binding to the Linux inotify api."""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | \
+        IN_MOVE_SELF | IN_ONLYDIR
+
+    EVENT = struct.Struct("iIII")
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(select, "poll") and ctypes.util.find_library("c") is not None and \
+            hasattr(ctypes.CDLL(ctypes.util.find_library("c")), "inotify_init1")
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLIN)
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def remove_watch(self, wd: int) -> None:
+        # the kernel drops the watch of a deleted directory on its own, so
+        # it may already be gone, which is fine
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """Wait up to timeout seconds and return the (watch, mask, name) of each event."""
+        if not self._poll.poll(timeout * 1000):
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
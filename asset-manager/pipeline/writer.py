@@ -0,0 +1,213 @@
+import atexit
+import os
+import threading
+import uuid
+import weakref
+from typing import Dict, Optional
+
+from .codec import encode
+from .versions import Version, VersionConflict, version_of
+
+
+class MetadataWriter:
+    """Writes metadata files so that a crash never leaves a partial file behind.
+
+    The data is written to a temporary file next to the destination which
+    then replaces it in one atomic rename. Readers see either the old or the
+    new file, never a truncated one.
+    """
+
+    # the open transaction of the storage using this writer, if any, which
+    # directories hand their changes to instead, see journal.Transaction
+    transaction = None
+
+    def __init__(self, fsync: bool = False, binary: bool = False, check_versions: bool = False) -> None:
+        """Create a new writer.
+
+        Args:
+            fsync: If set to True, each file is flushed to the disk before it
+                replaces the old one, so it also survives a power loss.
+            binary: If set to True, files are written in the compact binary
+                encoding instead of json, see codec.py.
+            check_versions: If set to True, metadata is only saved over the version
+                of its file that was read, see write_checked().
+        """
+        self._fsync = fsync
+        self.binary = binary
+        self.check_versions = check_versions
+
+    def write(self, path: str, data: dict) -> bool:
+        """Save the data into the given file.
+
+        Returns:
+            True if the file was written right away, False if it was buffered.
+        """
+        _write_atomic(path, data, self._fsync, self.binary)
+        return True
+
+    def write_checked(self, path: str, data: dict, version: Optional[Version]) -> Version:
+        """Save the data into the given file right away, if it is still at the given version.
+
+        Writers of files in the same folder, from any process, take turns
+        for the check and the rename that follows it, and nothing else.
+        Readers never wait.
+
+        Args:
+            path: The file to save the data into
+            data: The data to save
+            version: The version stamp the file had when it was read, see
+                versions.version_of(). The file is saved whatever its version if
+                this is left empty.
+
+        Returns:
+            The version stamp of the saved file
+
+        Raises:
+            VersionConflict: if the file was changed since it was read
+        """
+        import fcntl
+
+        descriptor = os.open(os.path.dirname(path), os.O_RDONLY)
+        try:
+            # the lock is released when the folder is closed
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            if version is not None and version_of(path) != version:
+                raise VersionConflict(f"the metadata was changed since it was read: {path}")
+            _write_atomic(path, data, self._fsync, self.binary)
+            return version_of(path)
+        finally:
+            os.close(descriptor)
+
+    def pending(self, path: str) -> Optional[dict]:
+        """The data buffered for the given file but not yet written, if any."""
+        return None
+
+    def move(self, old_dir: str, new_dir: str) -> None:
+        """Follow a directory that was renamed while writes are buffered for it."""
+
+    def discard(self, directory: str) -> None:
+        """Drop the buffered writes of a directory which is being deleted."""
+
+    def flush(self, directory: Optional[str] = None) -> None:
+        """Write out anything that is buffered, or only what is buffered below a directory."""
+
+
+class WriteBackWriter(MetadataWriter):
+    """A metadata writer which buffers writes and saves them later.
+
+    Repeated writes to the same file are coalesced so only the last one
+    reaches the disk. Buffered files are flushed after a delay, when
+    flush() is called, or when the process exits. Loads of a buffered
+    file must go through pending() to see the latest data.
+    """
+
+    def __init__(self, delay: float = 1.0, fsync: bool = False, binary: bool = False) -> None:
+        """Create a new writer.
+
+        Args:
+            delay: The number of seconds after the first buffered write before it is flushed.
+            fsync: If set to True, each file is flushed to the disk as it is written.
+            binary: If set to True, files are written in the compact binary encoding.
+        """
+        super().__init__(fsync, binary)
+        self._delay = delay
+        self._pending: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._error: Optional[Exception] = None
+
+        # make sure nothing buffered is lost when the program ends, without
+        # keeping every writer that was ever created alive until then
+        reference = weakref.ref(self)
+        atexit.register(lambda: reference() is not None and reference().flush())
+
+    def write(self, path: str, data: dict) -> bool:
+        with self._lock:
+            self._pending[path] = data
+            if self._timer is None:
+                self._timer = threading.Timer(self._delay, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        return False
+
+    def pending(self, path: str) -> Optional[dict]:
+        with self._lock:
+            return self._pending.get(path)
+
+    def move(self, old_dir: str, new_dir: str) -> None:
+        prefix = os.path.join(old_dir, "")
+        with self._lock:
+            for path in [path for path in self._pending if path.startswith(prefix)]:
+                self._pending[os.path.join(new_dir, path[len(prefix):])] = self._pending.pop(path)
+
+    def discard(self, directory: str) -> None:
+        prefix = os.path.join(directory, "")
+        with self._lock:
+            for path in [path for path in self._pending if path.startswith(prefix)]:
+                del self._pending[path]
+
+    def flush(self, directory: Optional[str] = None) -> None:
+        """Write out anything that is buffered.
+
+        Args:
+            directory: If given, only the files below this directory are written
+
+        Raises:
+            OSError: if a previous flush in the background failed
+        """
+        with self._lock:
+            if directory is None:
+                pending, self._pending = self._pending, {}
+            else:
+                prefix = os.path.join(directory, "")
+                pending = {path: self._pending.pop(path) for path in list(self._pending) if path.startswith(prefix)}
+            if self._timer is not None and not self._pending:
+                self._timer.cancel()
+                self._timer = None
+            error, self._error = self._error, None
+
+        # one bad file, eg: in a folder that has been removed since,
+        # shouldn't stop the other buffered writes from being saved
+        for path, data in pending.items():
+            try:
+                _write_atomic(path, data, self._fsync, self.binary)
+            except OSError as write_error:
+                error = error or write_error
+
+        if error is not None:
+            raise error
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception as error:
+            # there is no caller to report to, so keep the error
+            # around for the next time someone flushes explicitly
+            with self._lock:
+                self._error = error
+
+
+def _write_atomic(path: str, data: dict, fsync: bool, binary: bool = False) -> None:
+    """Replace the given file with new data in a single rename."""
+    folder, name = os.path.split(path)
+    # the temporary file is hidden so that it never shows up in listings
+    temporary = os.path.join(folder, f".{name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temporary, "xb") as file:
+            file.write(encode(data, binary))
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    if fsync and hasattr(os, "O_DIRECTORY"):
+        # the rename itself is only durable once the folder is flushed
+        descriptor = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
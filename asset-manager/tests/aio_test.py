@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+import pytest
+
+from pipeline import AsyncStorage, ArchiveCancelled, make_archive
+
+
+def test_async_storage(tmpdir):
+    async def main():
+        async with AsyncStorage(tmpdir.strpath) as storage:
+            show = await storage.create_show("my-show")
+            shot = await show.create_shot("my-shot")
+            await shot.create_asset("car", "vehicle")
+            await shot.create_assets(["tree", ("bike", "vehicle")])
+
+            loaded = await (await storage.load_show("my-show")).load_shot("my-shot")
+            assert set(await loaded.assets_by_category("vehicle")) == {"car", "bike"}
+            assert (await shot.metadata()).name == "my-shot"
+            assert await storage.shows() == ["my-show"]
+
+            names = [(await asset.metadata()).name async for asset in shot.iter_assets()]
+            assert set(names) == {"car", "tree", "bike"}
+
+            entries = [entry async for entry in storage.walk()]
+            assert len(entries) == 5
+
+    asyncio.run(main())
+
+
+def test_async_archive(tmpdir):
+    async def main():
+        async with AsyncStorage(tmpdir.strpath) as storage:
+            show = await storage.create_show("my-show")
+            await show.create_shot("my-shot")
+            stats = await show.archive(delete_original_folder=True)
+            assert stats.files == 2
+            assert await storage.shows() == ["my-show.zip"]
+
+    asyncio.run(main())
+
+
+def test_async_archive_can_be_cancelled(tmpdir):
+    async def main():
+        async with AsyncStorage(tmpdir.strpath) as storage:
+            show = await storage.create_show("my-show")
+            shot = await show.create_shot("my-shot")
+            await shot.create_assets([f"asset{i}" for i in range(200)])
+
+            task = asyncio.create_task(show.archive(delete_original_folder=True, workers=1))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(main())
+    # the show is kept and no partial archive is left behind
+    assert tmpdir.join("my-show").exists()
+    assert not tmpdir.join("my-show.zip").exists()
+
+
+def test_archive_cancel_event(tmpdir):
+    root = tmpdir.join("root").ensure(dir=True)
+    root.join("a.txt").write("a")
+
+    class Cancelled:
+        def is_set(self):
+            return True
+
+    with pytest.raises(ArchiveCancelled):
+        make_archive(root.strpath, root.strpath, cancel=Cancelled())
+    assert not os.path.exists(root.strpath + ".zip")
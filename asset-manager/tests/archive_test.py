@@ -0,0 +1,148 @@
+import json
+import os
+import zipfile
+
+from pipeline import Show, ShotMetadata, Storage, make_archive, make_incremental_archive, restore_archive
+from pipeline.archive import MANIFEST_SUFFIX
+
+
+def test_make_archive_matches_directory(tmpdir):
+    root = tmpdir.join("root").ensure(dir=True)
+    root.join("a.txt").write("hello " * 1000)
+    root.join("sub", "b.bin").write_binary(os.urandom(100000), ensure=True)
+    root.join("empty").ensure(dir=True)
+
+    stats = make_archive(root.strpath, root.strpath, workers=3)
+
+    assert stats.path == root.strpath + ".zip"
+    assert stats.files == 2
+    assert stats.bytes_read == 6000 + 100000
+    assert stats.throughput() > 0
+
+    with zipfile.ZipFile(stats.path) as archive:
+        assert archive.testzip() is None
+        assert set(archive.namelist()) == {"a.txt", "sub/", "sub/b.bin", "empty/"}
+        assert archive.read("a.txt") == b"hello " * 1000
+        assert archive.read("sub/b.bin") == root.join("sub", "b.bin").read_binary()
+
+
+def test_make_archive_many_files(tmpdir):
+    root = tmpdir.join("root").ensure(dir=True)
+    for i in range(50):
+        root.join(f"file{i}.txt").write(str(i) * i)
+
+    stats = make_archive(root.strpath, root.strpath, workers=2)
+
+    with zipfile.ZipFile(stats.path) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == sorted(f"file{i}.txt" for i in range(50))
+
+
+def test_show_archive(storage: Storage, tmpdir):
+    show = storage.create_show("my-show")
+    show.create_shot("my-shot").create_asset("my-asset")
+
+    stats = show.archive(delete_original_folder=True, workers=2)
+
+    assert stats.files == 3
+    assert not tmpdir.join("my-show").exists()
+    with zipfile.ZipFile(tmpdir.join("my-show.zip")) as archive:
+        assert "my-shot/my-asset/metadata.json" in archive.namelist()
+
+
+def test_archive_write_back(tmpdir):
+    storage = Storage(tmpdir.strpath, durability="write-back", flush_delay=60)
+    shot = storage.create_show("my-show").create_shot("my-shot")
+    shot.update_metadata(ShotMetadata("my-shot", "buffered"))
+
+    shot.archive(delete_original_folder=True)
+    storage.flush()
+
+    # the buffered metadata went into the archive, and not back into the folder
+    assert not tmpdir.join("my-show", "my-shot").exists()
+    with zipfile.ZipFile(tmpdir.join("my-show", "my-shot.zip")) as archive:
+        assert json.loads(archive.read("metadata.json"))["description"] == "buffered"
+
+
+def test_asset_archive(show: Show, tmpdir):
+    asset = show.create_shot("my-shot").create_asset("my-asset")
+    asset.archive()
+
+    assert tmpdir.join("test-show", "my-shot", "my-asset.zip").exists()
+
+
+def test_incremental_archive_only_writes_changes(tmpdir):
+    root = tmpdir.join("root").ensure(dir=True)
+    root.join("same.txt").write("same")
+    root.join("changed.txt").write("before")
+    root.join("touched.txt").write("touched")
+    root.join("deleted.txt").write("deleted")
+
+    base = make_incremental_archive(root.strpath, root.strpath)
+    assert base.path == root.strpath + ".zip"
+    assert base.files == 4
+
+    root.join("changed.txt").write("after!")
+    root.join("touched.txt").setmtime(root.join("touched.txt").mtime() + 10)
+    root.join("new.txt").write("new")
+    root.join("deleted.txt").remove()
+
+    delta = make_incremental_archive(root.strpath, root.strpath)
+    assert delta.path == root.strpath + ".1.zip"
+    assert delta.files == 2
+    assert delta.unchanged == 2
+    with zipfile.ZipFile(delta.path) as archive:
+        assert set(archive.namelist()) == {"changed.txt", "new.txt"}
+
+    assert make_incremental_archive(root.strpath, root.strpath).files == 0
+
+
+def test_restore_archive_replays_deltas(tmpdir):
+    root = tmpdir.join("root").ensure(dir=True)
+    root.join("a.txt").write("a")
+    root.join("sub", "b.txt").write("b", ensure=True)
+    make_incremental_archive(root.strpath, root.strpath)
+
+    root.join("a.txt").write("a2")
+    root.join("sub").remove()
+    root.join("c.txt").write("c")
+    make_incremental_archive(root.strpath, root.strpath)
+
+    target = tmpdir.join("restored")
+    restore_archive(root.strpath, target.strpath)
+
+    assert target.join("a.txt").read() == "a2"
+    assert target.join("c.txt").read() == "c"
+    assert not target.join("sub").exists()
+
+
+def test_full_archive_replaces_incremental_chain(tmpdir):
+    root = tmpdir.join("root").ensure(dir=True)
+    root.join("a.txt").write("v1")
+    make_incremental_archive(root.strpath, root.strpath)
+    root.join("a.txt").write("v2")
+    make_incremental_archive(root.strpath, root.strpath)
+
+    root.join("a.txt").write("v3")
+    make_archive(root.strpath, root.strpath)
+    assert not tmpdir.join("root" + MANIFEST_SUFFIX).exists()
+    assert not tmpdir.join("root.1.zip").exists()
+    with zipfile.ZipFile(root.strpath + ".zip") as archive:
+        assert archive.read("a.txt") == b"v3"
+
+    # a new chain starts from the current tree
+    root.join("a.txt").write("v4")
+    make_incremental_archive(root.strpath, root.strpath)
+    restore_archive(root.strpath, tmpdir.join("restored").strpath)
+    assert tmpdir.join("restored", "a.txt").read() == "v4"
+
+
+def test_restore_show(storage: Storage):
+    show = storage.create_show("my-show")
+    show.create_shot("my-shot")
+    show.archive(incremental=True)
+    show.create_shot("my-other-shot")
+    show.archive(delete_original_folder=True, incremental=True)
+
+    restored = storage.restore_show("my-show")
+    assert set(restored.shots()) == {"my-shot", "my-other-shot"}
@@ -0,0 +1,91 @@
+import gc
+import weakref
+
+import pytest
+
+from pipeline import AssetMetadata, ShotMetadata, Storage
+from pipeline.archived import ArchivedDirectory, ZipReader
+
+
+@pytest.fixture
+def archived(filled: Storage) -> Storage:
+    show = filled.load_show("show")
+    show.create_shot("shot2").create_assets([("car", "vehicle")])
+    show.load_shot("shot2").update_metadata(ShotMetadata(name="shot2", description="chase"))
+    show.archive(delete_original_folder=True)
+    return filled
+
+
+def test_load_archived_show(archived: Storage, tmpdir):
+    assert not tmpdir.join("show").check()
+
+    show = archived.load_show("show")
+    assert show.metadata().name == "show"
+    assert sorted(show.shots()) == ["shot1", "shot2"]
+
+    shot = show.load_shot("shot2")
+    assert shot.metadata().description == "chase"
+    assert shot.assets() == ["car"]
+    assert sorted(show.load_shot("shot1").assets_by_category("vehicle")) == ["car"]
+
+    asset = shot.load_asset("car")
+    assert asset.metadata() == AssetMetadata(name="car", category="vehicle")
+    assert sorted(asset.shots()) == ["shot1", "shot2"]
+
+    with pytest.raises(FileNotFoundError):
+        show.load_shot("missing")
+
+
+def test_archived_is_read_only(archived: Storage):
+    shot = archived.load_show("show").load_shot("shot1")
+    with pytest.raises(PermissionError):
+        shot.update_metadata(ShotMetadata(name="shot1", description="new"))
+    with pytest.raises(PermissionError):
+        shot.create_asset("bike")
+    with pytest.raises(PermissionError):
+        shot.load_asset("car").delete()
+
+
+def test_load_archived_shot(storage: Storage, tmpdir):
+    show = storage.create_show("show")
+    show.create_shot("shot1").create_asset("car", "vehicle")
+    show.load_shot("shot1").archive(delete_original_folder=True)
+
+    shot = storage.load_show("show").load_shot("shot1")
+    assert isinstance(shot._directory, ArchivedDirectory)
+    assert shot.load_asset("car").metadata().category == "vehicle"
+
+
+def test_zip_reader_shared(archived: Storage, tmpdir):
+    path = tmpdir.join("show.zip").strpath
+    reader = ZipReader.open(path)
+    assert ZipReader.open(path) is reader
+    assert sorted(reader.children("")) == ["shot1", "shot2"]
+    assert reader.is_folder("shot1/car/")
+    ZipReader.forget(path)
+    assert ZipReader.open(path) is not reader
+
+
+def test_zip_reader_replaced_archive(archived: Storage, tmpdir):
+    path = tmpdir.join("show.zip")
+    shot = archived.load_show("show").load_shot("shot2")
+    reader = ZipReader.open(path.strpath)
+    path.setmtime(path.mtime() + 10)
+
+    assert ZipReader.open(path.strpath) is not reader
+    # handles opened before still read the archive they were opened on
+    assert shot.metadata().description == "chase"
+    ZipReader.forget(path.strpath)
+    # metadata which was not parsed yet comes from the old mapping
+    assert shot.load_asset("car").metadata().category == "vehicle"
+
+    # and the old reader is closed once nothing holds it
+    closed = weakref.ref(reader._map)
+    del shot, reader
+    gc.collect()
+    assert closed() is None
+
+
+def test_missing_show(storage: Storage):
+    with pytest.raises(FileNotFoundError):
+        storage.load_show("missing")
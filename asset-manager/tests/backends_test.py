@@ -0,0 +1,95 @@
+import pytest
+
+from pipeline import AssetMetadata, ShotMetadata, Storage
+from pipeline.backends import ShowPack
+
+
+@pytest.fixture(params=["filesystem", "memory", "packed"])
+def backend(request, tmpdir) -> Storage:
+    return Storage(tmpdir.strpath, backend=request.param)
+
+
+@pytest.fixture
+def storage(backend: Storage) -> Storage:
+    # the shared fixtures, eg: filled, are built on every backend
+    return backend
+
+
+def test_create_and_load(filled: Storage):
+    show = filled.load_show("show")
+    show.create_shots(["shot2", "shot3"])
+    show.load_shot("shot2").create_asset("car", "vehicle")
+
+    assert filled.shows() == ["show"]
+    assert sorted(filled.load_show("show").shots()) == ["shot1", "shot2", "shot3"]
+    shot = filled.load_show("show").load_shot("shot1")
+    assert sorted(shot.assets()) == ["car", "tree"]
+    assert shot.load_asset("tree").metadata() == AssetMetadata(name="tree", category="prop")
+    assert sorted(shot.load_asset("car").shots()) == ["shot1", "shot2"]
+
+    with pytest.raises(FileExistsError):
+        filled.create_show("show")
+    with pytest.raises(FileNotFoundError):
+        show.load_shot("missing")
+
+
+def test_update_rename_and_delete(backend: Storage):
+    show = backend.create_show("show")
+    shot = show.create_shot("shot1")
+    shot.create_asset("car", "vehicle")
+
+    shot.update_metadata(ShotMetadata(name="shot1", description="chase"))
+    assert backend.load_show("show").load_shot("shot1").metadata().description == "chase"
+
+    asset = backend.load_show("show").load_shot("shot1").load_asset("car")
+    asset.update_metadata(AssetMetadata(name="bike", category="vehicle"))
+    assert backend.load_show("show").load_shot("shot1").assets() == ["bike"]
+
+    backend.load_show("show").load_shot("shot1").load_asset("bike").delete()
+    assert backend.load_show("show").load_shot("shot1").assets() == []
+
+    backend.load_show("show").delete()
+    assert backend.shows() == []
+
+
+def test_find_assets_and_walk(filled: Storage):
+    assert [match.asset for match in filled.find_assets("vehicle")] == ["car"]
+    entries = [entry[:3] for entry in filled.walk()]
+    assert sorted(entries, key=str) == sorted([
+        ("show", None, None), ("show", "shot1", None),
+        ("show", "shot1", "car"), ("show", "shot1", "tree"),
+    ], key=str)
+    metadata = {entry.asset: entry.metadata for entry in filled.walk(with_metadata=True) if entry.asset}
+    assert metadata["tree"]["category"] == "prop"
+
+
+def test_memory_stays_in_memory(tmpdir):
+    storage = Storage(tmpdir.strpath, backend="memory")
+    storage.create_show("show").create_shot("shot1").create_asset("car")
+    assert tmpdir.listdir() == []
+    # every memory storage starts out empty
+    assert Storage(tmpdir.strpath, backend="memory").shows() == []
+
+
+def test_packed_uses_one_file_per_show(tmpdir):
+    storage = Storage(tmpdir.strpath, backend="packed")
+    show = storage.create_show("show")
+    show.create_shots([f"shot{index}" for index in range(20)])
+    show.load_shot("shot0").create_assets(["car", "tree"])
+    assert [path.basename for path in tmpdir.listdir()] == ["show" + ShowPack.SUFFIX]
+
+    show.update_metadata(show.metadata())
+    assert Storage(tmpdir.strpath, backend="packed").load_show("show").load_shot("shot0").assets() == ["car", "tree"]
+
+
+def test_unknown_backend(tmpdir):
+    with pytest.raises(ValueError):
+        Storage(tmpdir.strpath, backend="tape")
+
+
+def test_filesystem_only_features(tmpdir):
+    storage = Storage(tmpdir.strpath, backend="memory")
+    with pytest.raises(NotImplementedError):
+        storage.dedupe()
+    with pytest.raises(NotImplementedError):
+        storage.create_show("show").archive()
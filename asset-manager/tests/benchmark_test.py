@@ -0,0 +1,36 @@
+import json
+
+from benchmarks.generate import PAYLOAD_FILE, TreeSpec, generate
+from benchmarks.run import main, run
+
+
+def test_generate(tmpdir):
+    storage = generate(tmpdir.strpath, TreeSpec(shows=2, shots=3, assets=4, payload_size=100))
+
+    assert sorted(storage.shows()) == ["show000", "show001"]
+    shot = storage.load_show("show001").load_shot("shot0002")
+    assets = shot.assets()
+    assert len(assets) == 4
+    assert tmpdir.join("show001", "shot0002", assets[0], PAYLOAD_FILE).check(file=True)
+
+    # the same spec always builds the same tree
+    other = generate(tmpdir.mkdir("other").strpath, TreeSpec(shows=2, shots=3, assets=4, payload_size=100))
+    assert sorted(other.load_show("show001").load_shot("shot0002").assets()) == sorted(assets)
+
+
+def test_run(tmpdir):
+    storage = generate(tmpdir.strpath, TreeSpec(shows=1, shots=2, assets=2, payload_size=0))
+    results = run(storage, repeat=3, archive_repeat=1)
+
+    assert results["Asset.shots"]["runs"] == 3
+    assert results["Shot.archive"]["runs"] == 1
+    assert all(result["min"] <= result["median"] <= result["max"] for result in results.values())
+
+
+def test_main_json(tmpdir):
+    output = tmpdir.join("results.json")
+    assert main(["--shows", "1", "--shots", "2", "--assets", "2", "--repeat", "2", "--output", output.strpath]) == 0
+
+    results = json.loads(output.read())
+    assert results["spec"]["shots"] == 2
+    assert "Shot.assets_by_category" in results["results"]
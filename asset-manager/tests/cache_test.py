@@ -0,0 +1,55 @@
+import json
+
+from pipeline import Directory, MetadataCache
+
+
+def test_cache_hits_until_file_changes(tmpdir):
+    path = tmpdir.join("metadata.json")
+    path.write(json.dumps({"name": "a"}))
+    cache = MetadataCache()
+
+    assert cache.load(path.strpath) == {"name": "a"}
+    assert cache.load(path.strpath) == {"name": "a"}
+    assert (cache.info().hits, cache.info().misses) == (1, 1)
+
+    path.write(json.dumps({"name": "bb"}))
+    assert cache.load(path.strpath) == {"name": "bb"}
+    assert cache.info().misses == 2
+
+
+def test_cache_returns_copies(tmpdir):
+    path = tmpdir.join("metadata.json")
+    path.write(json.dumps({"name": "a"}))
+    cache = MetadataCache()
+
+    cache.load(path.strpath)["name"] = "changed"
+    assert cache.load(path.strpath) == {"name": "a"}
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    cache = MetadataCache(maxsize=2)
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmpdir.join(name + ".json")
+        path.write(json.dumps({"name": name}))
+        paths.append(path.strpath)
+
+    cache.load(paths[0])
+    cache.load(paths[1])
+    cache.load(paths[0])
+    cache.load(paths[2])
+
+    assert cache.info().size == 2
+    cache.load(paths[0])
+    assert cache.info().hits == 2
+    cache.load(paths[1])
+    assert cache.info().misses == 4
+
+
+def test_directory_save_writes_through(show):
+    shot = show.create_shot("my-shot")
+    Directory.cache.clear()
+
+    shot.update_metadata(type(shot.metadata())(name="my-shot", description="new"))
+    assert show.load_shot("my-shot").metadata().description == "new"
+    assert Directory.cache.info().misses == 0
@@ -0,0 +1,128 @@
+import pytest
+
+from pipeline import Storage, Catalog, AssetMetadata
+
+
+@pytest.fixture
+def catalogued(tmpdir) -> Storage:
+    return Storage(tmpdir.strpath, catalog=True)
+
+
+def test_catalog_lists_created_entities(catalogued: Storage):
+    show = catalogued.create_show("my-show")
+    shot = show.create_shot("my-shot")
+    shot.create_asset("my-asset")
+
+    assert catalogued.shows() == ["my-show"]
+    assert show.shots() == ["my-shot"]
+    assert shot.assets() == ["my-asset"]
+
+
+def test_catalog_assets_by_category(catalogued: Storage):
+    shot = catalogued.create_show("my-show").create_shot("my-shot")
+    shot.create_asset("car", "vehicle")
+    shot.create_asset("bike", "vehicle")
+    shot.create_asset("tree", "prop")
+
+    assert set(shot.assets_by_category("vehicle")) == {"car", "bike"}
+    assert shot.assets_by_category("prop") == ["tree"]
+
+
+def test_catalog_follows_asset_rename(catalogued: Storage):
+    shot = catalogued.create_show("my-show").create_shot("my-shot")
+    asset = shot.create_asset("car", "vehicle")
+    asset.update_metadata(AssetMetadata(name="truck", category="prop"))
+
+    assert shot.assets() == ["truck"]
+    assert shot.assets_by_category("prop") == ["truck"]
+
+
+def test_catalog_delete_removes_children(catalogued: Storage):
+    show = catalogued.create_show("my-show")
+    show.create_shot("my-shot").create_asset("my-asset")
+    show.delete()
+
+    assert catalogued.shows() == []
+
+
+def test_catalog_persists(tmpdir):
+    Storage(tmpdir.strpath, catalog=True).create_show("my-show")
+    assert Storage(tmpdir.strpath, catalog=True).shows() == ["my-show"]
+
+
+def test_catalog_is_built_for_existing_tree(tmpdir):
+    show = Storage(tmpdir.strpath).create_show("my-show")
+    show.create_shot("my-shot").create_asset("car", "vehicle")
+
+    storage = Storage(tmpdir.strpath, catalog=True)
+    shot = storage.load_show("my-show").load_shot("my-shot")
+    assert shot.assets_by_category("vehicle") == ["car"]
+
+
+def test_reindex_picks_up_outside_changes(catalogued: Storage, tmpdir):
+    catalogued.create_show("my-show")
+    tmpdir.join("other-show").ensure(dir=True)
+    assert catalogued.shows() == ["my-show"]
+
+    catalogued.reindex()
+    assert set(catalogued.shows()) == {"my-show", "other-show"}
+
+
+def test_reindex_assets_without_metadata(catalogued: Storage, tmpdir):
+    catalogued.create_show("my-show").create_shot("my-shot")
+    tmpdir.join("my-show", "my-shot", "car").ensure(dir=True)
+
+    catalogued.reindex()
+    shot = catalogued.load_show("my-show").load_shot("my-shot")
+    assert shot.assets() == ["car"]
+    assert shot.assets_by_category("") == ["car"]
+    assert [match[:3] for match in catalogued.search("car")] == [("my-show", "my-shot", "car")]
+    assert [match[:3] for match in Storage(tmpdir.strpath).search("car")] == [("my-show", "my-shot", "car")]
+
+
+def test_reindex_requires_catalog(storage: Storage):
+    with pytest.raises(RuntimeError):
+        storage.reindex()
+
+
+def test_catalog_file_is_not_a_show(tmpdir):
+    Storage(tmpdir.strpath, catalog=True).create_show("my-show")
+    assert Storage(tmpdir.strpath).shows() == ["my-show"]
+
+
+def test_catalog_rename_keeps_similar_names(tmpdir):
+    catalog = Catalog(tmpdir.strpath)
+    catalog.add(tmpdir.join("show"), AssetMetadata("show", ""))
+    catalog.add(tmpdir.join("show", "shot"), AssetMetadata("shot", ""))
+    catalog.add(tmpdir.join("show-2", "shot"), AssetMetadata("shot", ""))
+
+    catalog.rename(tmpdir.join("show"), "renamed")
+
+    assert catalog.children(tmpdir.join("renamed")) == ["shot"]
+    assert catalog.children(tmpdir.join("show-2")) == ["shot"]
+
+
+def test_catalog_bulk_create(catalogued: Storage):
+    show = catalogued.create_show("my-show")
+    show.create_shots(["shot1", "shot2"])
+    show.load_shot("shot1").create_assets([("car", "vehicle"), "tree"])
+
+    assert set(show.shots()) == {"shot1", "shot2"}
+    assert show.load_shot("shot1").assets_by_category("vehicle") == ["car"]
+
+
+def test_catalog_find_assets(catalogued: Storage):
+    show = catalogued.create_show("show1")
+    show.create_shot("shot").create_assets([("car", "vehicle"), ("tree", "prop")])
+    catalogued.create_show("show2").create_shot("shot").create_assets([("bike", "vehicle")])
+
+    found = {(match.show, match.shot, match.asset) for match in catalogued.find_assets(category="vehicle")}
+    assert found == {("show1", "shot", "car"), ("show2", "shot", "bike")}
+    assert [match.asset for match in show.assets_by_category({"prop"})] == ["tree"]
+    assert len(list(catalogued.find_assets(show="show2"))) == 1
+
+
+def test_catalog_find_assets_does_not_walk(catalogued: Storage, monkeypatch):
+    catalogued.create_show("show").create_shot("shot").create_assets([("car", "vehicle")])
+    monkeypatch.setattr(Storage, "walk", lambda *args, **kwargs: pytest.fail("the storage root was walked"))
+    assert [match.asset for match in catalogued.find_assets(category="vehicle")] == ["car"]
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+
+import pytest
+
+from pipeline import Storage, cli
+from pipeline.cli import SOCKET_FILE, Daemon, main, request
+
+
+@pytest.fixture
+def root(filled: Storage, tmpdir) -> str:
+    return tmpdir.strpath
+
+
+@pytest.fixture
+def daemon(root: str):
+    server = Daemon(root)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def run(root: str, capsys, *args) -> str:
+    assert main(["--root", root, *args]) == 0
+    return capsys.readouterr().out
+
+
+def test_direct(root: str, capsys):
+    assert run(root, capsys, "list") == "show\n"
+    assert run(root, capsys, "list", "show", "shot1") == "car\ntree\n"
+    assert run(root, capsys, "query", "--category", "prop") == "show/shot1/tree\tprop\n"
+
+    run(root, capsys, "create", "show", "shot1", "bike", "--category", "vehicle")
+    assert run(root, capsys, "list", "show", "shot1", "--category", "vehicle") == "bike\ncar\n"
+    run(root, capsys, "delete", "show", "shot1", "bike")
+    assert json.loads(run(root, capsys, "--json", "list", "show", "shot1")) == ["car", "tree"]
+
+
+def test_errors(root: str, capsys):
+    assert main(["--root", root, "list", "missing"]) == 1
+    assert "error" in capsys.readouterr().err
+    assert main(["--root", root, "create", "show"]) == 1
+
+
+def test_daemon(root: str, daemon: Daemon, capsys):
+    assert request(daemon.socket_path, "ping", {}) == os.getpid()
+    assert run(root, capsys, "list", "show", "shot1") == "car\ntree\n"
+    run(root, capsys, "create", "show", "shot2")
+    assert run(root, capsys, "list", "show") == "shot1\nshot2\n"
+    assert run(root, capsys, "query", "tre").startswith("show/shot1/tree\tprop\t")
+
+    with pytest.raises(FileNotFoundError):
+        request(daemon.socket_path, "list", {"names": ["missing"]})
+    with pytest.raises(FileExistsError):
+        Daemon(root)
+
+
+def test_daemon_errors_are_not_retried(root: str, daemon: Daemon, capsys, monkeypatch):
+    monkeypatch.setattr(cli, "Storage", lambda root: pytest.fail("the command ran again without the daemon"))
+    assert main(["--root", root, "list", "missing"]) == 1
+    assert "missing" in capsys.readouterr().err
+
+
+def test_unexpected_daemon_errors(root: str, daemon: Daemon, capsys, monkeypatch):
+    def broken(storage, command, arguments):
+        raise KeyError("boom")
+
+    monkeypatch.setattr(cli, "execute", broken)
+    assert main(["--root", root, "list"]) == 1
+    assert capsys.readouterr().err.startswith("error: KeyError")
+
+
+def test_stale_socket(root: str, capsys, tmpdir):
+    # a socket file left behind by a daemon which was killed
+    tmpdir.join(SOCKET_FILE).write("")
+    assert run(root, capsys, "list") == "show\n"
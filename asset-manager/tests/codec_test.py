@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from pipeline import AssetMetadata, ShowMetadata, Storage
+from pipeline import codec
+
+
+def test_round_trip():
+    data = {"name": "car", "count": 3, "ratio": 0.5, "hidden": False, "owner": None,
+            "tags": ["a", "b"], "description": "voiture rouge, très rapide"}
+    raw = codec.encode(data, binary=True)
+    assert raw.startswith(codec.MAGIC)
+    assert codec.decode(raw) == data
+    assert codec.decode(codec.encode(data)) == data
+    assert codec.decode(codec.encode({}, binary=True)) == {}
+
+
+def test_newer_version():
+    raw = bytearray(codec.encode({"name": "car"}, binary=True))
+    raw[3] = codec.VERSION + 1
+    with pytest.raises(ValueError):
+        codec.decode(bytes(raw))
+
+
+def test_to_dict():
+    assert codec.to_dict(AssetMetadata(name="car", category="vehicle")) == \
+        {"name": "car", "category": "vehicle", "description": ""}
+    assert codec.to_dict(ShowMetadata(name="show")) == {"name": "show", "description": ""}
+
+
+def test_binary_storage(tmpdir):
+    storage = Storage(tmpdir.strpath, metadata_format="binary")
+    show = storage.create_show("show")
+    show.create_shot("shot1").create_assets([("car", "vehicle")])
+    show.create_shot("shot2").create_asset("car", "vehicle")
+
+    # both the batch and the single create write the binary encoding
+    for shot in ("shot1", "shot2"):
+        assert tmpdir.join("show", shot, "car", "metadata.json").read_binary().startswith(codec.MAGIC)
+
+    # files in either encoding are read side by side
+    tmpdir.join("show", "shot2", "metadata.json").write(json.dumps({"name": "shot2", "description": "chase"}))
+    reader = Storage(tmpdir.strpath)
+    assert reader.load_show("show").load_shot("shot1").load_asset("car").metadata().category == "vehicle"
+    assert reader.load_show("show").load_shot("shot2").metadata().description == "chase"
+    assert {entry.asset: entry.metadata["category"] for entry in reader.walk(with_metadata=True) if entry.asset} == \
+        {"car": "vehicle"}
+
+
+def test_frozen_metadata_is_not_copied(storage: Storage):
+    asset = storage.create_show("show").create_shot("shot1").create_asset("car", "vehicle")
+    assert asset.metadata() is asset.metadata()
+
+    metadata = AssetMetadata(name="car", category="prop")
+    asset.update_metadata(metadata)
+    assert asset.metadata() is metadata
@@ -7,6 +7,14 @@ def storage(tmpdir) -> pipeline.Storage:
     return pipeline.Storage(tmpdir.strpath)
 
 
+@pytest.fixture
+def filled(storage: pipeline.Storage) -> pipeline.Storage:
+    """A storage with one show, holding shot1 with a car and a tree."""
+    show = storage.create_show("show")
+    show.create_shot("shot1").create_assets([("car", "vehicle"), ("tree", "prop")])
+    return storage
+
+
 @pytest.fixture
 def show(tmpdir) -> pipeline.Show:
     storage = pipeline.Storage(tmpdir.strpath)
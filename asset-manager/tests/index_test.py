@@ -0,0 +1,56 @@
+from pipeline import Show, AssetIndex, AssetMetadata
+
+
+def test_asset_shots(show: Show):
+    shot1 = show.create_shot("shot1")
+    shot2 = show.create_shot("shot2")
+    show.create_shot("shot3")
+    car = shot1.create_asset("car")
+    shot2.create_asset("car")
+
+    assert set(car.shots()) == {"shot1", "shot2"}
+
+
+def test_asset_shots_follow_changes(show: Show):
+    shot1 = show.create_shot("shot1")
+    shot2 = show.create_shot("shot2")
+    car = shot1.create_asset("car")
+    assert car.shots() == ["shot1"]
+
+    other = shot2.create_asset("car")
+    assert set(car.shots()) == {"shot1", "shot2"}
+
+    other.delete()
+    assert car.shots() == ["shot1"]
+
+    car.update_metadata(AssetMetadata(name="truck", category=""))
+    assert car.shots() == ["shot1"]
+    assert show.load_shot("shot1").load_asset("truck").shots() == ["shot1"]
+
+
+def test_asset_shots_after_shot_delete(show: Show):
+    shot1 = show.create_shot("shot1")
+    shot2 = show.create_shot("shot2")
+    car = shot1.create_asset("car")
+    shot2.create_asset("car")
+    assert len(car.shots()) == 2
+
+    shot2.delete()
+    assert car.shots() == ["shot1"]
+
+
+def test_reindex_assets_sees_outside_changes(show: Show, tmpdir):
+    car = show.create_shot("shot1").create_asset("car")
+    show.create_shot("shot2")
+    assert car.shots() == ["shot1"]
+
+    tmpdir.join("test-show", "shot2", "car").ensure(dir=True)
+    assert car.shots() == ["shot1"]
+
+    show.reindex_assets()
+    assert set(car.shots()) == {"shot1", "shot2"}
+
+
+def test_index_is_shared_per_show(tmpdir):
+    path = tmpdir.join("show")
+    assert AssetIndex.for_show(path) is AssetIndex.for_show(path.strpath)
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+
+import pipeline
+from pipeline import AssetMetadata, OperationRecord, Show, StatsSink, Storage, instrument
+from pipeline.directory import Directory
+
+
+def test_instrument_stats(storage: Storage):
+    shot = storage.create_show("show").create_shot("shot")
+    shot.create_asset("car", "vehicle")
+
+    stats = StatsSink()
+    with instrument(stats):
+        storage.load_show("show").shots()
+        asset = shot.load_asset("car")
+        asset.update_metadata(AssetMetadata(name="car", category="prop"))
+        list(storage.walk())
+
+    totals = stats.stats()
+    assert totals["Show.shots"].calls == 1
+    assert totals["Show.shots"].syscalls["listdir"] == 1
+    assert totals["Storage.walk"].syscalls["scandir"] >= 1
+    assert totals["Asset.update_metadata"].bytes_written > 0
+    assert totals["Asset.update_metadata"].syscalls["replace"] == 1
+    # nested calls are counted in their callers as well
+    assert totals["Asset.update_metadata"].bytes_written >= totals["Directory.save_metadata"].bytes_written > 0
+    assert totals["Storage.load_show"].histogram.percentile(50) > 0
+    assert "Show.shots" in stats.report()
+
+
+def test_instrument_errors_and_callbacks(storage: Storage):
+    records = []
+    with instrument(records.append):
+        try:
+            storage.load_show("missing")
+        except FileNotFoundError:
+            pass
+
+    assert records[-1].name == "Storage.load_show"
+    assert records[-1].error == "FileNotFoundError"
+
+
+def test_instrument_disabled(storage: Storage):
+    original = Show.shots
+    with instrument(StatsSink()):
+        assert Show.shots is not original
+        assert pipeline.storage.os is not os
+    # everything is put back so there is no overhead
+    assert Show.shots is original
+    assert pipeline.storage.os is os
+    assert "open" not in vars(pipeline.cache)
+    assert isinstance(vars(Directory)["create"], staticmethod)
+
+
+def test_instrument_only_records_its_thread(storage: Storage):
+    storage.create_show("show")
+    records = []
+    with instrument(records.append):
+        other = threading.Thread(target=storage.load_show, args=("show",))
+        other.start()
+        other.join()
+        storage.shows()
+    names = [record.name for record in records]
+    assert "Storage.shows" in names
+    assert "Storage.load_show" not in names
+
+
+def test_instrument_from_many_threads(storage: Storage):
+    original = Show.shots
+    storage.create_show("show")
+
+    def measure():
+        for _ in range(50):
+            with instrument(StatsSink()):
+                storage.load_show("show").shots()
+
+    threads = [threading.Thread(target=measure) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Show.shots is original
+    assert pipeline.storage.os is os
+
+
+def test_instrument_logging(storage: Storage, caplog):
+    with caplog.at_level(logging.DEBUG, logger="pipeline"):
+        with instrument(pipeline.LoggingSink()):
+            storage.create_show("show")
+    assert any("Storage.create_show took" in message for message in caplog.messages)
+
+
+def test_instrument_archive_bytes(storage: Storage):
+    show = storage.create_show("show")
+    show.create_shot("shot")
+    records = []
+    with instrument(records.append):
+        show.archive()
+
+    archive = next(record for record in records if record.name == "Show.archive")
+    assert isinstance(archive, OperationRecord)
+    assert archive.bytes_read > 0 and archive.bytes_written > 0
@@ -0,0 +1,150 @@
+import errno
+import json
+import os
+import shutil
+
+import pytest
+
+from pipeline import AssetMetadata, ShotMetadata, Storage
+from pipeline.journal import COMMIT, HELD_FOLDER, JOURNAL_FILE, Transaction
+
+
+def test_transaction_commits(filled: Storage, tmpdir):
+    with filled.transaction():
+        show = filled.load_show("show")
+        show.create_shot("shot2").create_asset("rock", "prop")
+        shot = show.load_shot("shot1")
+        shot.load_asset("car").update_metadata(AssetMetadata(name="truck", category="vehicle"))
+        shot.update_metadata(ShotMetadata(name="shot1", description="the chase"))
+        # the changes are seen inside the transaction before they are written
+        assert shot.load_asset("truck").metadata().category == "vehicle"
+        assert show.load_shot("shot1").metadata().description == "the chase"
+        assert tmpdir.join(JOURNAL_FILE).check()
+
+    assert not tmpdir.join(JOURNAL_FILE).check()
+    reopened = Storage(tmpdir.strpath)
+    shot = reopened.load_show("show").load_shot("shot1")
+    assert sorted(shot.assets()) == ["tree", "truck"]
+    assert shot.metadata().description == "the chase"
+    assert reopened.load_show("show").load_shot("shot2").assets() == ["rock"]
+
+
+def test_transaction_rolls_back(filled: Storage, tmpdir):
+    with pytest.raises(RuntimeError):
+        with filled.transaction():
+            show = filled.load_show("show")
+            show.create_shot("shot2")
+            shot = show.load_shot("shot1")
+            shot.load_asset("car").update_metadata(AssetMetadata(name="truck", category="vehicle"))
+            shot.load_asset("tree").delete()
+            raise RuntimeError("boom")
+
+    assert not tmpdir.join(JOURNAL_FILE).check()
+    show = filled.load_show("show")
+    assert show.shots() == ["shot1"]
+    shot = show.load_shot("shot1")
+    assert sorted(shot.assets()) == ["car", "tree"]
+    assert shot.load_asset("car").metadata().name == "car"
+    assert sorted(filled.find_assets("vehicle")) == [("show", "shot1", "car", "vehicle")]
+    assert filled.trash().entries() == []
+
+
+def test_rollback_restores_deletes_after_undo_window(filled: Storage, tmpdir):
+    storage = Storage(tmpdir.strpath, undo_window=0)
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.load_show("show").load_shot("shot1").load_asset("tree").delete()
+            # the purger finds nothing to remove while the transaction is open
+            storage.trash().purge(older_than=0)
+            raise RuntimeError("boom")
+
+    assert sorted(storage.load_show("show").load_shot("shot1").assets()) == ["car", "tree"]
+
+
+def test_commit_moves_deletes_to_trash(filled: Storage):
+    with filled.transaction():
+        filled.load_show("show").load_shot("shot1").load_asset("tree").delete()
+        assert filled.trash().entries() == []
+
+    assert [entry.path for entry in filled.trash().entries()] == [os.path.join("show", "shot1", "tree")]
+
+
+def test_rollback_raises_for_missing_deletes(filled: Storage, tmpdir):
+    with pytest.raises(FileNotFoundError):
+        with filled.transaction():
+            filled.load_show("show").load_shot("shot1").load_asset("tree").delete()
+            shutil.rmtree(tmpdir.join(HELD_FOLDER).strpath)
+            raise RuntimeError("boom")
+
+    assert not tmpdir.join(JOURNAL_FILE).check()
+    assert filled.load_show("show").load_shot("shot1").assets() == ["car"]
+
+
+def test_created_children_are_staged(filled: Storage, tmpdir):
+    with pytest.raises(RuntimeError):
+        with filled.transaction():
+            filled.load_show("show").create_shots(["shot2", "shot3"])
+            filled.load_show("show").load_shot("shot2").create_assets([("rock", "prop")])
+            # the metadata waits for the commit like any other write
+            assert not tmpdir.join("show", "shot2", "metadata.json").check()
+            assert filled.load_show("show").load_shot("shot2").load_asset("rock").metadata().category == "prop"
+            raise RuntimeError("boom")
+    assert filled.load_show("show").shots() == ["shot1"]
+
+    with filled.transaction():
+        filled.load_show("show").create_shots(["shot2"])
+    assert tmpdir.join("show", "shot2", "metadata.json").check()
+
+
+def test_journal_without_hard_links(filled: Storage, tmpdir, monkeypatch):
+    def link(source, destination):
+        raise PermissionError(errno.EPERM, "hard links are not supported", destination)
+
+    monkeypatch.setattr(os, "link", link)
+    with filled.transaction():
+        filled.load_show("show").create_shot("shot2")
+        with pytest.raises(RuntimeError):
+            Storage(tmpdir.strpath).transaction().__enter__()
+    assert filled.load_show("show").load_shot("shot2").metadata().name == "shot2"
+    assert not tmpdir.join(JOURNAL_FILE).check()
+
+
+def test_nested_transactions_join(filled: Storage):
+    with filled.transaction() as outer:
+        with filled.transaction() as inner:
+            assert inner is outer
+
+
+def test_recover_undoes_uncommitted(filled: Storage, tmpdir):
+    transaction = Transaction(tmpdir.strpath, filled._writer)
+    filled._writer.transaction = transaction
+    show = filled.load_show("show")
+    show.create_shot("shot2")
+    show.load_shot("shot1").load_asset("car").update_metadata(AssetMetadata(name="truck", category="vehicle"))
+    show.load_shot("shot1").load_asset("tree").delete()
+    # the process dies here, without committing, which releases the journal
+    filled._writer.transaction = None
+    transaction._file.close()
+
+    shot = Storage(tmpdir.strpath).load_show("show").load_shot("shot1")
+    assert not tmpdir.join(JOURNAL_FILE).check()
+    assert not tmpdir.join("show", "shot2").check()
+    assert sorted(shot.assets()) == ["car", "tree"]
+
+
+def test_recover_redoes_committed(filled: Storage, tmpdir):
+    metadata = {"name": "shot1", "description": "recovered"}
+    with tmpdir.join(JOURNAL_FILE).open("w") as file:
+        file.write(json.dumps({"op": COMMIT, "writes": [["show/shot1/metadata.json", metadata]]}) + "\n")
+
+    shot = Storage(tmpdir.strpath).load_show("show").load_shot("shot1")
+    assert shot.metadata().description == "recovered"
+    assert not tmpdir.join(JOURNAL_FILE).check()
+
+
+def test_one_transaction_at_a_time(filled: Storage, tmpdir):
+    with filled.transaction():
+        with pytest.raises(RuntimeError):
+            Storage(tmpdir.strpath).transaction().__enter__()
+        # an open transaction is not mistaken for one left behind
+        assert tmpdir.join(JOURNAL_FILE).check()
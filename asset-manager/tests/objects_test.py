@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import pytest
+
+from pipeline import ObjectStore, Storage, objects
+from pipeline.objects import OBJECTS_FOLDER, hash_file
+
+
+@pytest.fixture
+def payloads(filled: Storage, tmpdir):
+    show = filled.load_show("show")
+    for shot in ("shot2", "shot3"):
+        show.create_shot(shot).create_assets([("car", "vehicle"), ("tree", "prop")])
+    for shot in ("shot1", "shot2", "shot3"):
+        tmpdir.join("show", shot, "car", "car.abc").write_binary(b"car" * 1000)
+        tmpdir.join("show", shot, "tree", "tree.abc").write_binary(shot.encode() * 1000)
+    return tmpdir
+
+
+def test_dedupe(storage: Storage, payloads):
+    stats = storage.dedupe(min_size=1)
+
+    # the car is the same everywhere, every tree is different
+    assert stats.linked == 2
+    assert stats.bytes_saved == 2 * 3000
+    cars = [os.stat(payloads.join("show", shot, "car", "car.abc").strpath) for shot in ("shot1", "shot2", "shot3")]
+    assert len({car.st_ino for car in cars}) == 1
+    assert payloads.join("show", "shot2", "car", "car.abc").read_binary() == b"car" * 1000
+
+    # the store is bookkeeping, not a show
+    assert storage.shows() == ["show"]
+
+    # shared files are recognised without hashing them again
+    again = storage.dedupe(min_size=1)
+    assert again.linked == 0
+    assert again.hashed == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "setxattr"), reason="extended attributes are not available")
+def test_dedupe_reflink_skips_clones(storage: Storage, payloads, monkeypatch):
+    # a copy which keeps the stat and attributes of its source stands in for a clone
+    monkeypatch.setattr(objects, "_clone", shutil.copy2)
+    assert storage.dedupe(min_size=1, reflink=True).linked == 2
+
+    # clones keep their own inodes, but still aren't hashed again
+    assert storage.dedupe(min_size=1, reflink=True).hashed == 0
+    payloads.join("show", "shot2", "tree", "tree.abc").write_binary(b"changed" * 1000)
+    assert storage.dedupe(min_size=1, reflink=True).hashed == 1
+
+
+def test_dedupe_min_size(storage: Storage, payloads):
+    assert storage.dedupe(min_size=10_000).linked == 0
+
+
+def test_object_store_copy(storage: Storage, payloads, tmpdir):
+    source = tmpdir.join("source.abc")
+    source.write_binary(b"car" * 1000)
+    store = storage.object_store()
+
+    destination = payloads.join("show", "shot1", "tree", "car.abc")
+    digest = store.copy(source.strpath, destination.strpath)
+
+    assert digest == hash_file(source.strpath)
+    assert destination.read_binary() == b"car" * 1000
+    assert os.path.samefile(destination.strpath, store.path(digest))
+    # shared files can't be edited in place by accident
+    assert not os.access(destination.strpath, os.W_OK) or os.geteuid() == 0
+
+
+def test_object_store_collect(storage: Storage, payloads):
+    storage.dedupe(min_size=1)
+    storage.load_show("show").delete()
+    # deleted shows can be brought back until they are purged
+    assert ObjectStore(payloads.strpath).collect() == 0
+    storage.purge()
+
+    store = ObjectStore(payloads.strpath)
+    assert store.collect() > 0
+    assert store.digests() == {}
+    assert payloads.join(OBJECTS_FOLDER).check(dir=True)
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from pipeline import AssetMetadata, ShotMetadata, Storage
+from pipeline.search import query_tokens, score, terms_of, tokens_of
+
+
+@pytest.fixture(params=[False, True], ids=["scan", "catalog"])
+def storage(request, tmpdir) -> Storage:
+    # the shared fixtures, eg: filled, are searched with and without a catalog
+    return Storage(tmpdir.strpath, catalog=request.param)
+
+
+@pytest.fixture
+def searchable(filled: Storage) -> Storage:
+    show = filled.load_show("show")
+    shot = show.load_shot("shot1")
+    shot.create_asset("hero_car", "vehicle")
+    shot.load_asset("tree").update_metadata(AssetMetadata(name="tree", category="prop", description="a red oak"))
+    show.create_shot("chase").create_asset("cart", "prop")
+    show.load_shot("chase").update_metadata(ShotMetadata(name="chase", description="car chase"))
+    return filled
+
+
+def names(matches):
+    return [match[:3] for match in matches]
+
+
+def test_search_ranking(searchable: Storage):
+    matches = searchable.search("car")
+    # the whole name first, then words, starts of words and descriptions
+    assert names(matches) == [
+        ("show", "shot1", "car"),
+        ("show", "shot1", "hero_car"),
+        ("show", "chase", "cart"),
+        ("show", "chase", None),
+    ]
+    assert matches[0].category == "vehicle"
+
+
+def test_search_fragments(searchable: Storage):
+    assert names(searchable.search("ero")) == [("show", "shot1", "hero_car")]
+    assert names(searchable.search("ak")) == []
+    assert names(searchable.search("oak")) == [("show", "shot1", "tree")]
+    assert names(searchable.search("RED o")) == [("show", "shot1", "tree")]
+    assert searchable.search("") == []
+
+
+def test_search_filters(searchable: Storage):
+    assert names(searchable.search("car", category="prop")) == [("show", "chase", "cart")]
+    assert names(searchable.search("car", show="show", shot="chase")) == [("show", "chase", "cart")]
+    assert len(searchable.search("car", limit=2)) == 2
+    with pytest.raises(ValueError):
+        searchable.search("car", shot="chase")
+    with pytest.raises(FileNotFoundError):
+        searchable.search("car", show="missing")
+
+
+def test_search_follows_changes(searchable: Storage):
+    shot = searchable.load_show("show").load_shot("shot1")
+    shot.load_asset("car").update_metadata(AssetMetadata(name="truck", category="vehicle"))
+    shot.load_asset("tree").delete()
+
+    assert names(searchable.search("truck")) == [("show", "shot1", "truck")]
+    assert searchable.search("oak") == []
+    assert ("show", "shot1", "car") not in names(searchable.search("car"))
+
+
+def test_tokens():
+    assert terms_of("Hero_Car 2") == ["hero", "car", "2"]
+    tokens = tokens_of("hero_car", "")
+    assert query_tokens(["her"]) <= tokens
+    assert query_tokens(["c"]) <= tokens
+    assert not query_tokens(["ar"]) <= tokens
+    assert score(["car"], "car", "") > score(["car"], "cart", "") > score(["car"], "oscar", "")
+
+
+def test_search_as_you_type(tmpdir):
+    storage = Storage(tmpdir.strpath, catalog=True)
+    show = storage.create_show("show")
+    for index in range(20):
+        show.create_shot(f"shot{index}").create_assets([(f"asset{number}", "prop") for number in range(50)])
+
+    started = time.perf_counter()
+    for query in ("a", "as", "ass", "asse", "asset", "asset1"):
+        storage.search(query)
+    assert (time.perf_counter() - started) / 6 < 0.05
@@ -71,3 +71,15 @@ def test_shot_delete_removes_shots(show: Show):
 
     with pytest.raises(FileNotFoundError):
         shot.update_metadata(ShowMetadata("my-shot"))
+
+
+def test_create_assets(show: Show):
+    shot = show.create_shot("my-shot")
+    shot.create_asset("car", "vehicle")
+
+    created = shot.create_assets(["tree", ("car", "prop"), ("bike", "vehicle")])
+
+    assert created == {"tree": True, "car": False, "bike": True}
+    assert set(shot.assets()) == {"tree", "car", "bike"}
+    assert set(shot.assets_by_category("vehicle")) == {"car", "bike"}
+    assert shot.load_asset("bike").shots() == ["my-shot"]
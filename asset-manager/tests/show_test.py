@@ -1,6 +1,6 @@
 import pytest
 
-from pipeline import Show, Storage, ShowMetadata
+from pipeline import Show, Storage, ShowMetadata, directory
 
 
 def test_show_metadata(storage: Storage):
@@ -79,3 +79,36 @@ def test_list_shots(show: Show):
 
 def test_list_shots_is_list(show: Show):
     assert isinstance(show.shots(), list)
+
+
+def test_create_shots(show: Show):
+    show.create_shot("shot1")
+
+    created = show.create_shots(["shot1", "shot2", "shot3", "shot2"])
+
+    assert created == {"shot1": False, "shot2": True, "shot3": True}
+    assert set(show.shots()) == {"shot1", "shot2", "shot3"}
+    assert show.load_shot("shot2").metadata().name == "shot2"
+
+
+def test_create_shots_sync(show: Show, monkeypatch):
+    synced = []
+    monkeypatch.setattr(directory, "_syncfs", lambda: lambda descriptor: synced.append(descriptor) or 0)
+
+    assert show.create_shots(["shot1", "shot2"], sync=True) == {"shot1": True, "shot2": True}
+    assert sorted(show.shots()) == ["shot1", "shot2"]
+    # a single barrier for the file system of the batch
+    assert len(synced) == 1
+
+
+def test_show_assets_by_category(show: Show):
+    shot1 = show.create_shot("shot1")
+    shot2 = show.create_shot("shot2")
+    shot1.create_assets([("car", "vehicle"), ("tree", "prop")])
+    shot2.create_assets([("bike", "vehicle"), ("lamp", "prop"), ("fx", "")])
+
+    found = {(match.shot, match.asset) for match in show.assets_by_category("vehicle", workers=2)}
+    assert found == {("shot1", "car"), ("shot2", "bike")}
+
+    found = {match.asset for match in show.assets_by_category(["vehicle", "prop"])}
+    assert found == {"car", "tree", "bike", "lamp"}
@@ -0,0 +1,43 @@
+import pytest
+
+from pipeline import Storage, Snapshot
+
+
+@pytest.fixture
+def snapshot(filled: Storage) -> Snapshot:
+    filled.load_show("show").create_shot("shot2").create_assets([("car", "vehicle")])
+    filled.create_show("show2").create_shot("shot1").create_assets([("bike", "vehicle"), ("fx", "")])
+    return filled.snapshot()
+
+
+def test_snapshot_rows(snapshot: Snapshot):
+    assert len(snapshot) == 2 + 3 + 5
+    assert snapshot.count(level=Snapshot.SHOW) == 2
+    assert snapshot.count(level=Snapshot.SHOT) == 3
+
+    show = snapshot[0]
+    assert (show.level, show.parent) == (Snapshot.SHOW, None)
+
+    assets = list(snapshot.filter(level=Snapshot.ASSET))
+    assert {tuple(row.path()) for row in assets} >= {("show", "shot2", "car"), ("show2", "shot1", "fx")}
+    assert all(row.parent.level == Snapshot.SHOT for row in assets)
+
+
+def test_snapshot_filter(snapshot: Snapshot):
+    assert {row.name for row in snapshot.filter(category="vehicle")} == {"car", "bike"}
+    assert snapshot.count(category="vehicle") == 3
+    assert snapshot.count(category="vehicle", show="show2") == 1
+    assert snapshot.count(category="unknown") == 0
+    assert snapshot.count(show="show2") == 4
+
+
+def test_snapshot_group_by_category(snapshot: Snapshot):
+    groups = snapshot.group_by_category()
+    assert {category: len(rows) for category, rows in groups.items()} == {"vehicle": 3, "prop": 1, "": 1}
+    assert {snapshot[index].name for index in groups["prop"]} == {"tree"}
+    assert set(snapshot.group_by_category(show="show")) == {"vehicle", "prop"}
+
+
+def test_snapshot_interns_strings(snapshot: Snapshot):
+    cars = [row for row in snapshot.filter(category="vehicle") if row.name == "car"]
+    assert cars[0].name is cars[1].name
@@ -60,3 +60,84 @@ def test_list_shows(storage: Storage):
 
 def test_list_shows_is_list(storage: Storage):
     assert isinstance(storage.shows(), list)
+
+
+def test_walk_visits_everything(storage: Storage):
+    show = storage.create_show("my-show")
+    shot = show.create_shot("my-shot")
+    shot.create_asset("my-asset", "prop")
+    show.archive()
+
+    entries = list(storage.walk())
+    assert [entry[:3] for entry in entries] == [
+        ("my-show", None, None),
+        ("my-show", "my-shot", None),
+        ("my-show", "my-shot", "my-asset"),
+    ]
+    assert all(entry.metadata is None for entry in entries)
+
+
+def test_walk_depth(storage: Storage):
+    storage.create_show("my-show").create_shot("my-shot").create_asset("my-asset")
+
+    assert [entry.show for entry in storage.walk(depth=1)] == ["my-show"]
+    assert len(list(storage.walk(depth=2))) == 2
+
+
+def test_walk_with_metadata(storage: Storage):
+    storage.create_show("my-show").create_shot("my-shot").create_asset("my-asset", "prop")
+
+    assets = [entry for entry in storage.walk(with_metadata=True) if entry.asset]
+    assert assets[0].metadata == {"name": "my-asset", "category": "prop", "description": ""}
+
+
+
+def test_lazy_load_does_no_metadata_io(tmpdir):
+    Storage(tmpdir.strpath).create_show("my-show").create_shot("my-shot")
+    tmpdir.join("my-show", "metadata.json").remove()
+
+    storage = Storage(tmpdir.strpath, lazy=True)
+    show = storage.load_show("my-show")
+    assert show.shots() == ["my-shot"]
+    assert not tmpdir.join("my-show", "metadata.json").exists()
+
+    assert show.metadata().name == "my-show"
+    assert tmpdir.join("my-show", "metadata.json").exists()
+
+
+def test_lazy_create_saves_metadata(tmpdir):
+    storage = Storage(tmpdir.strpath, lazy=True)
+    shot = storage.create_show("my-show").create_shot("my-shot")
+    shot.create_asset("my-asset", "prop")
+
+    assert tmpdir.join("my-show", "metadata.json").exists()
+    assert tmpdir.join("my-show", "my-shot", "metadata.json").exists()
+    assert shot.assets_by_category("prop") == ["my-asset"]
+
+
+def test_lazy_children_are_lazy(tmpdir):
+    Storage(tmpdir.strpath).create_show("my-show").create_shot("my-shot").create_asset("my-asset")
+    tmpdir.join("my-show", "my-shot", "my-asset", "metadata.json").write("not json")
+
+    shot = Storage(tmpdir.strpath, lazy=True).load_show("my-show").load_shot("my-shot")
+    asset = shot.load_asset("my-asset")
+    with pytest.raises(ValueError):
+        asset.metadata()
+
+
+def test_find_assets(storage: Storage):
+    storage.create_show("show1").create_shot("shot").create_assets([("car", "vehicle"), ("tree", "prop")])
+    storage.create_show("show2").create_shot("shot").create_assets([("bike", "vehicle")])
+
+    found = {(match.show, match.asset) for match in storage.find_assets(category="vehicle")}
+    assert found == {("show1", "car"), ("show2", "bike")}
+
+    found = {match.asset for match in storage.find_assets(category="vehicle", show="show2")}
+    assert found == {"bike"}
+
+    assert len(list(storage.find_assets())) == 3
+
+
+def test_find_assets_missing_show(storage: Storage):
+    with pytest.raises(FileNotFoundError):
+        list(storage.find_assets(show="my-show"))
@@ -0,0 +1,132 @@
+import time
+
+import pytest
+
+from pipeline import Directory, Show, Storage, Trash
+from pipeline.trash import TRASH_FOLDER
+
+
+@pytest.fixture
+def filled(filled: Storage, tmpdir) -> Storage:
+    filled.load_show("show").create_shot("shot2").create_assets([("car", "vehicle")])
+    tmpdir.join("show", "shot1", "car", "car.abc").write_binary(b"car" * 1000)
+    return filled
+
+
+def test_delete_moves_to_trash(filled: Storage, tmpdir):
+    filled.load_show("show").load_shot("shot1").delete()
+
+    assert not tmpdir.join("show", "shot1").check()
+    assert filled.load_show("show").shots() == ["shot2"]
+    assert filled.load_show("show").load_shot("shot2").load_asset("car").shots() == ["shot2"]
+    entries = filled.trash().entries()
+    assert [entry.path for entry in entries] == ["show/shot1"]
+    assert tmpdir.join(TRASH_FOLDER, entries[0].id, "car", "car.abc").check()
+    # the trash is bookkeeping, not a show
+    assert filled.shows() == ["show"]
+
+
+def test_undelete(filled: Storage):
+    filled.load_show("show").load_shot("shot1").delete()
+    filled.undelete("show", "shot1")
+
+    shot = filled.load_show("show").load_shot("shot1")
+    assert sorted(shot.assets()) == ["car", "tree"]
+    assert sorted(shot.load_asset("car").shots()) == ["shot1", "shot2"]
+    assert filled.trash().entries() == []
+
+    with pytest.raises(FileNotFoundError):
+        filled.undelete("show", "shot3")
+
+
+def test_undelete_taken_name(filled: Storage):
+    filled.load_show("show").load_shot("shot2").load_asset("car").delete()
+    filled.load_show("show").load_shot("shot2").create_asset("car")
+    with pytest.raises(FileExistsError):
+        filled.undelete("show", "shot2", "car")
+
+
+def test_purge(filled: Storage, tmpdir):
+    filled.load_show("show").delete()
+    stats = filled.purge()
+
+    assert stats.entries == 1
+    assert stats.bytes_freed >= 3000
+    assert tmpdir.join(TRASH_FOLDER).listdir() == []
+    with pytest.raises(FileNotFoundError):
+        filled.undelete("show")
+
+
+def test_background_purge(tmpdir):
+    storage = Storage(tmpdir.strpath, undo_window=0.0)
+    storage.create_show("show").delete()
+
+    deadline = time.monotonic() + 5.0
+    while storage.trash().entries() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert storage.trash().entries() == []
+
+
+def test_leftover_trash_is_purged(filled: Storage, tmpdir):
+    filled.load_show("show").delete()
+    # the process that deleted it ends before its undo window passes
+    filled.trash().stop()
+    del Trash._trashes[tmpdir.strpath]
+
+    storage = Storage(tmpdir.strpath, undo_window=0.0)
+    deadline = time.monotonic() + 5.0
+    while storage.trash().entries() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert storage.trash().entries() == []
+
+
+def test_interrupted_purge_is_resumed(filled: Storage, tmpdir):
+    filled.load_show("show").delete()
+    entry, = filled.trash().entries()
+    filled.trash().stop()
+    del Trash._trashes[tmpdir.strpath]
+    # a purge hid the entry, then the process died
+    tmpdir.join(TRASH_FOLDER, entry.id + ".json").rename(tmpdir.join(TRASH_FOLDER, "." + entry.id + ".json"))
+
+    storage = Storage(tmpdir.strpath)
+    deadline = time.monotonic() + 5.0
+    while tmpdir.join(TRASH_FOLDER).listdir() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert tmpdir.join(TRASH_FOLDER).listdir() == []
+    storage.trash().stop()
+
+
+def test_throttled_purge(filled: Storage, tmpdir):
+    trash = Trash(tmpdir.strpath, workers=4, rate=1000)
+    filled.load_show("show").delete()
+    assert trash.purge().files > 0
+
+
+def test_delete_without_storage(filled: Storage, tmpdir):
+    show = Show(Directory(tmpdir.join("show").strpath))
+    show.load_shot("shot1").load_asset("car").delete()
+    show.load_shot("shot2").delete()
+
+    # without a storage there is no trash to move into
+    assert not tmpdir.join("show", "shot1", "car").check()
+    assert show.shots() == ["shot1"]
+    assert not tmpdir.join(TRASH_FOLDER).check()
+    assert not tmpdir.join("show", TRASH_FOLDER).check()
+
+
+def test_purge_finishes_interrupted_purge(filled: Storage, tmpdir):
+    filled.load_show("show").load_shot("shot1").delete()
+    filled.load_show("show").load_shot("shot2").delete()
+    trash = filled.trash()
+    # left to the purge below, not the background one
+    trash.stop()
+    first, second = trash.entries()
+    # a purge hid the first entry, then crashed before removing anything
+    tmpdir.join(TRASH_FOLDER, first.id + ".json").rename(tmpdir.join(TRASH_FOLDER, "." + first.id + ".json"))
+    # and another one restored the second meanwhile
+    tmpdir.join(TRASH_FOLDER, second.id + ".json").remove()
+
+    stats = trash.purge()
+    assert stats.entries == 1
+    assert stats.bytes_freed >= 3000
+    assert tmpdir.join(TRASH_FOLDER).listdir() == [tmpdir.join(TRASH_FOLDER, second.id)]
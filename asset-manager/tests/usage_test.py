@@ -0,0 +1,140 @@
+import os
+import time
+
+import pytest
+
+from pipeline import Directory, DiskUsage, Storage, UsageEntry
+from pipeline.cli import main
+
+
+@pytest.fixture
+def sized(filled: Storage, tmpdir) -> Storage:
+    filled.load_show("show").create_shot("shot2").create_assets([("car", "vehicle")])
+    tmpdir.join("show", "shot1", "car", "car.abc").write_binary(b"c" * 5000)
+    tmpdir.join("show", "shot1", "tree", "textures", "bark.png").ensure().write_binary(b"t" * 2000)
+    tmpdir.join("show", "shot2", "car", "car.abc").write_binary(b"c" * 1000)
+    settle(tmpdir.strpath)
+    Directory.usage.clear()
+    return filled
+
+
+def settle(root: str) -> None:
+    """Age every folder, as if nothing had changed in them for a while."""
+    past = time.time() - 60
+    for folder, _, _ in os.walk(root):
+        os.utime(folder, (past, past))
+
+
+def metadata_size(*folder) -> int:
+    return os.path.getsize(os.path.join(*folder, Directory.METADATA_FILE))
+
+
+def test_disk_usage(sized: Storage, tmpdir):
+    shot = sized.load_show("show").load_shot("shot1")
+    car = shot.load_asset("car").disk_usage()
+    assert car == DiskUsage(files=2, bytes=5000 + metadata_size(tmpdir, "show", "shot1", "car"))
+
+    tree = shot.load_asset("tree").disk_usage()
+    # files in subfolders of the asset count too
+    assert tree == DiskUsage(files=2, bytes=2000 + metadata_size(tmpdir, "show", "shot1", "tree"))
+    assert shot.disk_usage() == DiskUsage(
+        files=car.files + tree.files + 1,
+        bytes=car.bytes + tree.bytes + metadata_size(tmpdir, "show", "shot1"),
+    )
+    show = sized.load_show("show").disk_usage()
+    assert show.files == 1 + shot.disk_usage().files + sized.load_show("show").load_shot("shot2").disk_usage().files
+
+
+def test_hardlinks_count_once(sized: Storage, tmpdir):
+    shot = sized.load_show("show").load_shot("shot1")
+    before = shot.disk_usage()
+    os.link(tmpdir.join("show", "shot1", "car", "car.abc"), tmpdir.join("show", "shot1", "tree", "car.abc"))
+    # linking a file again doesn't change the folder it was in
+    assert shot.disk_usage(refresh=True) == before
+    # each asset still counts the file on its own
+    assert shot.load_asset("tree").disk_usage().bytes == 5000 + 2000 + metadata_size(tmpdir, "show", "shot1", "tree")
+
+
+def test_hardlinks_shared_across_shots(sized: Storage, tmpdir):
+    tmpdir.join("show", "shot1", "car", "payload.bin").write_binary(b"p" * 3000)
+    os.link(tmpdir.join("show", "shot1", "car", "payload.bin"), tmpdir.join("show", "shot2", "car", "payload.bin"))
+    show = sized.load_show("show")
+
+    # each shot is charged for the payload, as its own disk usage is
+    report = {entry[:3]: (entry.files, entry.bytes) for entry in sized.usage_report(refresh=True)}
+    for name in ("shot1", "shot2"):
+        usage = show.load_shot(name).disk_usage(refresh=True)
+        assert report[("show", name, None)] == (usage.files, usage.bytes)
+    # and the show holding both only once
+    usage = show.disk_usage(refresh=True)
+    assert report[("show", None, None)] == (usage.files, usage.bytes)
+    shots = [show.load_shot(name).disk_usage().bytes for name in ("shot1", "shot2")]
+    assert usage.bytes == sum(shots) - 3000 + metadata_size(tmpdir, "show")
+
+
+def test_only_changed_folders_are_scanned(sized: Storage, tmpdir):
+    sized.usage_report()
+    scanned = Directory.usage.info().misses
+    sized.usage_report()
+    assert Directory.usage.info().misses == scanned
+
+    # a new file in one asset only rescans that asset
+    tmpdir.join("show", "shot2", "car", "car.v2.abc").write_binary(b"c" * 3000)
+    report = sized.usage_report()
+    assert Directory.usage.info().misses == scanned + 1
+    assert report[0][:3] == ("show", None, None)
+    assert sized.load_show("show").load_shot("shot2").disk_usage().bytes >= 4000
+
+
+def test_library_changes_are_seen(sized: Storage):
+    show = sized.load_show("show")
+    before = show.disk_usage()
+    show.load_shot("shot1").load_asset("car").delete()
+    after = show.disk_usage()
+    assert after.files == before.files - 2
+    assert after.bytes < before.bytes - 5000
+
+
+def test_files_changed_in_place_need_refresh(sized: Storage, tmpdir):
+    asset = sized.load_show("show").load_shot("shot2").load_asset("car")
+    before = asset.disk_usage()
+    with tmpdir.join("show", "shot2", "car", "car.abc").open("ab") as file:
+        file.write(b"c" * 500)
+    assert asset.disk_usage() == before
+    assert asset.disk_usage(refresh=True).bytes == before.bytes + 500
+
+
+def test_usage_report(sized: Storage, tmpdir):
+    assets = sized.usage_report(level="asset")
+    assert [entry[:3] for entry in assets] == [
+        ("show", "shot1", "car"),
+        ("show", "shot1", "tree"),
+        ("show", "shot2", "car"),
+    ]
+    assert isinstance(assets[0], UsageEntry)
+    assert assets[0].bytes == 5000 + metadata_size(tmpdir, "show", "shot1", "car")
+
+    shots = sized.usage_report(level="shot", limit=1)
+    assert [entry[:3] for entry in shots] == [("show", "shot1", None)]
+    # the trash and other bookkeeping are not shows
+    sized.load_show("show").load_shot("shot2").delete()
+    assert [entry.show for entry in sized.usage_report(level="show")] == ["show"]
+    assert len(sized.usage_report()) == 4
+
+    with pytest.raises(ValueError):
+        sized.usage_report(level="frame")
+
+
+def test_usage_needs_the_filesystem(tmpdir):
+    storage = Storage(tmpdir.strpath, backend="memory")
+    with pytest.raises(NotImplementedError):
+        storage.create_show("show").disk_usage()
+    with pytest.raises(NotImplementedError):
+        storage.usage_report()
+
+
+def test_usage_command(sized: Storage, tmpdir, capsys):
+    assert main(["--root", tmpdir.strpath, "--direct", "usage", "--level", "asset", "--limit", "1"]) == 0
+    assert capsys.readouterr().out.startswith("show/shot1/car\t2\t")
+    assert main(["--root", tmpdir.strpath, "--direct", "usage", "show", "shot2"]) == 0
+    assert "files: 3" in capsys.readouterr().out
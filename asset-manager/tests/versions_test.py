@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from pipeline import AssetMetadata, ShotMetadata, Storage, VersionConflict, retry_on_conflict
+
+
+@pytest.fixture
+def checked(filled: Storage, tmpdir) -> Storage:
+    return Storage(tmpdir.strpath, check_versions=True)
+
+
+def load_shot(storage: Storage):
+    return storage.load_show("show").load_shot("shot1")
+
+
+def test_stale_update_conflicts(checked: Storage):
+    first = load_shot(checked)
+    second = load_shot(checked)
+
+    first.update_metadata(ShotMetadata(name="shot1", description="first"))
+    with pytest.raises(VersionConflict):
+        second.update_metadata(ShotMetadata(name="shot1", description="second"))
+    assert load_shot(checked).metadata().description == "first"
+
+    # the winner can keep updating what it saved
+    first.update_metadata(ShotMetadata(name="shot1", description="again"))
+    assert load_shot(checked).metadata().description == "again"
+
+
+def test_changes_by_other_processes_conflict(checked: Storage, tmpdir):
+    asset = load_shot(checked).load_asset("car")
+    other = Storage(tmpdir.strpath)
+    load_shot(other).load_asset("car").update_metadata(AssetMetadata(name="car", category="prop"))
+
+    with pytest.raises(VersionConflict):
+        asset.update_metadata(AssetMetadata(name="truck", category="vehicle"))
+    assert sorted(load_shot(checked).assets()) == ["car", "tree"]
+
+
+def test_renamed_asset_keeps_its_version(checked: Storage):
+    asset = load_shot(checked).load_asset("car")
+    asset.update_metadata(AssetMetadata(name="truck", category="vehicle"))
+    asset.update_metadata(AssetMetadata(name="truck", category="vehicle", description="red"))
+    assert load_shot(checked).load_asset("truck").metadata().description == "red"
+
+
+def test_unchecked_updates_overwrite(filled: Storage):
+    first = load_shot(filled)
+    second = load_shot(filled)
+    first.update_metadata(ShotMetadata(name="shot1", description="first"))
+    second.update_metadata(ShotMetadata(name="shot1", description="second"))
+    assert load_shot(filled).metadata().description == "second"
+
+
+def test_retry_on_conflict(checked: Storage):
+    def append(word: str) -> None:
+        shot = load_shot(checked)
+        description = shot.metadata().description
+        shot.update_metadata(ShotMetadata(name="shot1", description=description + word))
+
+    threads = [
+        threading.Thread(target=retry_on_conflict, args=(lambda word=word: append(word), 100))
+        for word in "abcdefgh"
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # no update was lost
+    assert sorted(load_shot(checked).metadata().description) == list("abcdefgh")
+
+
+def test_retry_gives_up():
+    def conflict():
+        raise VersionConflict("always")
+
+    with pytest.raises(VersionConflict):
+        retry_on_conflict(conflict, attempts=3, delay=0.0)
+
+
+def test_check_versions_options(tmpdir):
+    with pytest.raises(ValueError):
+        Storage(tmpdir.strpath, durability="write-back", check_versions=True)
+    with pytest.raises(NotImplementedError):
+        Storage(tmpdir.strpath, backend="memory", check_versions=True)
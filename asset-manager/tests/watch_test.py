@@ -0,0 +1,125 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+from pipeline import ChangeEvent, Directory, Storage, Watcher
+from pipeline.asset import AssetMetadata
+from pipeline.watch import CREATED, DELETED, RENAMED, UPDATED, _Inotify
+
+
+@pytest.fixture
+def watcher(filled: Storage, tmpdir) -> Watcher:
+    return Watcher(tmpdir.strpath, lambda events: None, inotify=False)
+
+
+def test_watch_poll_events(filled: Storage, watcher: Watcher):
+    assert watcher.poll() == []
+
+    shot = filled.load_show("show").load_shot("shot1")
+    shot.create_asset("rock", "prop")
+    assert watcher.poll() == [ChangeEvent(CREATED, "show", "shot1", "rock")]
+
+    shot.load_asset("car").update_metadata(AssetMetadata(name="car", category="prop"))
+    assert watcher.poll() == [ChangeEvent(UPDATED, "show", "shot1", "car")]
+
+    shot.load_asset("rock").update_metadata(AssetMetadata(name="bush", category="prop"))
+    assert watcher.poll() == [
+        ChangeEvent(RENAMED, "show", "shot1", "bush", old_name="rock"),
+        ChangeEvent(UPDATED, "show", "shot1", "bush"),
+    ]
+
+    shot.load_asset("bush").delete()
+    assert watcher.poll() == [ChangeEvent(DELETED, "show", "shot1", "bush")]
+
+
+def test_watch_poll_subtrees(watcher: Watcher, tmpdir):
+    # a bulk copy is a single event, not one per asset
+    shutil.copytree(tmpdir.join("show", "shot1").strpath, tmpdir.join("show", "shot2").strpath)
+    events = watcher.poll()
+    assert events == [ChangeEvent(CREATED, "show", "shot2")]
+    assert events[0].level == "shot"
+
+    os.rename(tmpdir.join("show").strpath, tmpdir.join("show2").strpath)
+    assert watcher.poll() == [ChangeEvent(RENAMED, "show2", old_name="show")]
+
+    # bookkeeping files and folders are not part of the pipeline
+    os.mkdir(tmpdir.join("show2", ".staging").strpath)
+    assert watcher.poll() == []
+
+
+@pytest.mark.skipif(not _Inotify.available(), reason="inotify is not available")
+def test_watch_inotify(storage: Storage, tmpdir):
+    storage.create_show("show")
+    batches = []
+    received = threading.Event()
+
+    def callback(events):
+        batches.append(events)
+        received.set()
+
+    with Watcher(tmpdir.strpath, callback, debounce=0.1) as watcher:
+        assert watcher.uses_inotify()
+        storage.load_show("show").create_shot("shot1").create_assets(["car", "tree"])
+        assert received.wait(5)
+
+    assert batches == [[ChangeEvent(CREATED, "show", "shot1")]]
+
+
+@pytest.mark.skipif(not _Inotify.available(), reason="inotify is not available")
+def test_watch_inotify_drops_removed_directories(filled: Storage, tmpdir):
+    received = threading.Semaphore(0)
+
+    with Watcher(tmpdir.strpath, lambda events: received.release(), debounce=0.1) as watcher:
+        assert len(watcher._watches) == 5
+        shutil.rmtree(tmpdir.join("show", "shot1").strpath)
+        assert received.acquire(timeout=5)
+        os.rename(tmpdir.join("show").strpath, tmpdir.join("show2").strpath)
+        assert received.acquire(timeout=5)
+
+        # only the directories still in the tree are watched, under their current names
+        assert sorted(watcher._watches.values()) == [(), ("show2",)]
+
+
+def test_storage_watch(filled: Storage, tmpdir):
+    storage = Storage(tmpdir.strpath, catalog=True)
+
+    # another process adds an asset behind the back of the catalog
+    other = Storage(tmpdir.strpath)
+    received = threading.Event()
+    watcher = storage.watch(lambda events: received.set(), interval=0.05, debounce=0.05, inotify=False)
+    try:
+        other.load_show("show").load_shot("shot1").create_asset("bike", "vehicle")
+        assert received.wait(5)
+    finally:
+        watcher.stop()
+
+    assert sorted(match.asset for match in storage.find_assets("vehicle")) == ["bike", "car"]
+    assert storage.load_show("show").load_shot("shot1").load_asset("bike").shots() == ["shot1"]
+
+
+def test_storage_watch_survives_broken_changes(filled: Storage, tmpdir):
+    storage = Storage(tmpdir.strpath, catalog=True)
+
+    batches = []
+    received = threading.Event()
+
+    def callback(events):
+        batches.append(events)
+        received.set()
+        raise RuntimeError("a broken callback")
+
+    watcher = storage.watch(callback, interval=0.05, debounce=0.05, inotify=False)
+    try:
+        # a metadata file half written by hand
+        tmpdir.join("show", "shot1", "car", Directory.METADATA_FILE).write("{\"name\": ")
+        assert received.wait(5)
+        received.clear()
+        Storage(tmpdir.strpath).load_show("show").load_shot("shot1").create_asset("bike", "vehicle")
+        assert received.wait(5)
+    finally:
+        watcher.stop()
+
+    assert batches[-1] == [ChangeEvent(CREATED, "show", "shot1", "bike")]
+    assert "bike" in [match.asset for match in storage.find_assets("vehicle")]
@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from pipeline import Storage, ShowMetadata, MetadataWriter, WriteBackWriter, AssetMetadata
+
+
+def test_atomic_write_leaves_no_temporary_files(tmpdir):
+    path = tmpdir.join("metadata.json")
+    MetadataWriter().write(path.strpath, {"name": "a"})
+    MetadataWriter(fsync=True).write(path.strpath, {"name": "b"})
+
+    assert json.loads(path.read()) == {"name": "b"}
+    assert os.listdir(tmpdir.strpath) == ["metadata.json"]
+
+
+def test_failed_write_keeps_old_file(tmpdir):
+    path = tmpdir.join("metadata.json")
+    path.write(json.dumps({"name": "a"}))
+
+    with pytest.raises(TypeError):
+        MetadataWriter().write(path.strpath, {"name": object()})
+
+    assert json.loads(path.read()) == {"name": "a"}
+    assert os.listdir(tmpdir.strpath) == ["metadata.json"]
+
+
+def test_write_back_coalesces_until_flush(tmpdir):
+    path = tmpdir.join("metadata.json")
+    writer = WriteBackWriter(delay=60)
+
+    assert not writer.write(path.strpath, {"name": "a"})
+    writer.write(path.strpath, {"name": "b"})
+    assert not path.exists()
+    assert writer.pending(path.strpath) == {"name": "b"}
+
+    writer.flush()
+    assert json.loads(path.read()) == {"name": "b"}
+    assert writer.pending(path.strpath) is None
+
+
+def test_write_back_flushes_on_timer(tmpdir):
+    path = tmpdir.join("metadata.json")
+    writer = WriteBackWriter(delay=0)
+    writer.write(path.strpath, {"name": "a"})
+    writer._timer.join()
+
+    assert json.loads(path.read()) == {"name": "a"}
+
+
+def test_storage_write_back(tmpdir):
+    storage = Storage(tmpdir.strpath, durability="write-back", flush_delay=60)
+    show = storage.create_show("my-show")
+    show.update_metadata(ShowMetadata("my-show", "new description"))
+
+    assert storage.load_show("my-show").metadata().description == "new description"
+    assert Storage(tmpdir.strpath).load_show("my-show").metadata().description == ""
+
+    storage.flush()
+    assert Storage(tmpdir.strpath).load_show("my-show").metadata().description == "new description"
+
+
+def test_storage_write_back_follows_rename(tmpdir):
+    storage = Storage(tmpdir.strpath, durability="write-back", flush_delay=60)
+    shot = storage.create_show("my-show").create_shot("my-shot")
+    asset = shot.create_asset("car")
+    asset.update_metadata(AssetMetadata("truck", "vehicle"))
+    storage.flush()
+
+    assert Storage(tmpdir.strpath).load_show("my-show").load_shot("my-shot").assets_by_category("vehicle") == ["truck"]
+
+
+def test_storage_unknown_durability(tmpdir):
+    with pytest.raises(ValueError):
+        Storage(tmpdir.strpath, durability="sometimes")